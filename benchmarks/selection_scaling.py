@@ -0,0 +1,64 @@
+"""Times PolyNation parent selection at large population sizes.
+
+Builds a nation whose population is made of synthetic polymers born in
+three nations, then times quota allocation, the selection scheme, mating
+and parent flagging together. Time per polymer should stay flat as the
+population grows.
+
+Usage:
+    python benchmarks/selection_scaling.py [sizes ...]
+"""
+import os
+import sys
+import tempfile
+from time import time
+
+import numpy as np
+import pandas as pd
+
+# Run from a checkout without installing polyga
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from polyga import polygod as pg
+from polyga.population import Population
+
+def nothing(df, *args):
+    return df
+
+def synthetic_population(nation, n, rng):
+    planet = nation.land.planet
+    codes = [planet.birthplaces.code(planet.name, nation.land.name, name) 
+             for name in ['Home', 'Away', 'Far']]
+    birthplace = rng.choice(codes, n, p=[0.8, 0.15, 0.05])
+    offsets = np.arange(n + 1, dtype=np.int64) * 2
+    chromosomes = rng.integers(0, 100, 2 * n)
+    return Population(planet.birthplaces, np.arange(1, n + 1), np.zeros(n),
+                      np.zeros(n), birthplace, np.full(n, '[*]CC[*]', 
+                      dtype=object), chromosomes, offsets, 
+                      fitness=rng.random(n))
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as folder:
+        planet = pg.PolyPlanet('Benchmark', predict_function=nothing,
+                fingerprint_function=nothing, save_folder=folder)
+        land = pg.PolyLand('Land', planet, generative_function=nothing,
+                fitness_function=nothing)
+        nation = pg.PolyNation('Home', land, num_population_initial=1,
+                partner_selection='random', num_families=15, 
+                parent_migrant_percentage=0.3)
+        print('{:>10} {:>10} {:>18}'.format('polymers', 'seconds', 
+                                            'us per polymer'))
+        for n in sizes:
+            nation.population = synthetic_population(nation, n, rng)
+            st = time()
+            nation._PolyNation__selection()
+            seconds = time() - st
+            print('{:>10} {:>10.3f} {:>18.3f}'.format(n, seconds, 
+                                                      seconds / n * 1e6))
+        planet.complete_run()
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or [10**5, 2 * 10**5,
+                                                     5 * 10**5, 10**6]
+    main(sizes)
@@ -1,16 +1,168 @@
 from collections import defaultdict
 import json
 import os
+import pickle
+import shutil
 import sqlite3
+from urllib.parse import quote
 
+import numpy as np
 import pandas as pd
 
+from polyga.canonical import polymer_key
+from polyga.fingerprints import FingerprintStore
+
 def str_to_list(string):
     """remove [] and whitespace, then create list of integers to return"""
     string = string[1:-1].replace(' ', '').split(',')
     return [int(str_id) for str_id in string]
 
-def load_planet(planet: str) -> (pd.DataFrame, pd.DataFrame):
+def connect(planet: str) -> sqlite3.Connection:
+    """Opens the census database of a planet read-only
+
+    The census is written in WAL mode (see polyga.census.SQLiteCensus), so
+    connections opened here never block, or are blocked by, a running 
+    planet taking its census. Each query sees the census as of the last 
+    commit before it started.
+
+    Planets with a sharded census (see polyga.census.ShardedSQLiteCensus) 
+    get a connection with every shard attached and temporary polymer and 
+    census_log views of their union, so queries see one database. If there
+    are more shards than SQLite can attach, the shards are copied into 
+    in-memory tables instead.
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).
+
+    Returns (sqlite3.Connection):  
+        Connection with a polymer table or view.
+    """
+    folder = os.path.join(planet, 'shards')
+    shards = sorted(name for name in os.listdir(folder) 
+                    if name.endswith('.sqlite')) if os.path.isdir(
+                            folder) else []
+    if len(shards) == 0:
+        return sqlite3.connect(_readonly_uri(os.path.join(planet, 
+            'planetary_database.sqlite')), uri=True)
+    conn = sqlite3.connect('file::memory:', uri=True)
+    uris = [_readonly_uri(os.path.join(folder, name)) for name in shards]
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(
+            conn, 'getlimit') else 10
+    if len(shards) <= limit:
+        for i, uri in enumerate(uris):
+            conn.execute("ATTACH DATABASE ? AS shard_{}".format(i), (uri,))
+        for table in _shared_tables(conn, ['shard_{}'.format(i) for i in 
+                                           range(len(uris))]):
+            conn.execute("CREATE TEMP VIEW {} AS ".format(table) 
+                    + " UNION ALL ".join("SELECT * FROM shard_{}.{}".format(
+                        i, table) for i in range(len(uris))))
+        return conn
+    tables = None
+    for uri in uris:
+        conn.execute("ATTACH DATABASE ? AS shard", (uri,))
+        if tables is None:
+            tables = _shared_tables(conn, ['shard'])
+            for table in tables:
+                conn.execute("CREATE TABLE {0} AS SELECT * FROM shard.{0}"
+                             .format(table))
+        else:
+            for table in tables:
+                conn.execute("INSERT INTO {0} SELECT * FROM shard.{0}"
+                             .format(table))
+        # Can't detach inside a transaction
+        conn.commit()
+        conn.execute("DETACH DATABASE shard")
+    for col in ['planetary_id', 'parent_1_id', 'parent_2_id', 'generation']:
+        conn.execute("CREATE INDEX ix_polymer_{0} ON polymer ({0})".format(
+            col))
+    return conn
+
+def _readonly_uri(path: str) -> str:
+    """Returns SQLite URI opening path read-only"""
+    return 'file:{}?mode=ro'.format(quote(os.path.abspath(path)))
+
+def _shared_tables(conn, schemas: list) -> list:
+    """Returns census tables every attached schema has
+
+    Shards written before census_log existed only have polymer.
+    """
+    tables = ['polymer', 'census_log']
+    for schema in schemas:
+        names = {row[0] for row in conn.execute(
+            "SELECT name FROM {}.sqlite_master WHERE type = 'table'".format(
+                schema))}
+        tables = [table for table in tables if table in names]
+    return tables
+
+def latest_generation(planet: str) -> int:
+    """Returns latest generation every nation has completely saved
+
+    Each nation's census of a generation is committed together with a row
+    of census_log, so a generation up to this one is never half written.
+    Monitors of a running planet can poll it, or use tail.
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).
+
+    Returns (int):  
+        Latest complete generation, or -1 if no census was taken yet.
+    """
+    conn = connect(planet)
+    latest = _latest_generation(conn)
+    conn.close()
+    return latest
+
+def _latest_generation(conn) -> int:
+    """Returns latest generation in census_log every nation reached"""
+    try:
+        row = conn.execute("SELECT MIN(latest) FROM (SELECT "
+                + "MAX(generation) AS latest FROM census_log "
+                + "GROUP BY settled_planet, settled_nation)").fetchone()
+    except sqlite3.OperationalError:
+        # Databases written before census_log
+        row = conn.execute("SELECT MAX(generation) FROM polymer").fetchone()
+    return -1 if row[0] is None else row[0]
+
+def tail(planet: str, since: int = -1
+         ) -> (pd.DataFrame, pd.DataFrame, int):
+    """Loads polymers of generations completed after since
+
+    Meant for polling a running planet without reloading it, e.g.,
+
+        latest = -1
+        while running:
+            df, fp_df, latest = tail(planet, latest)
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        since (int):  
+            Latest generation already loaded. Default -1, meaning none.
+
+    Returns:  
+        df (pd.DataFrame):  
+            Dataframe of polymers of generations after since, up to the 
+            latest complete generation, and their properties.  
+        fp_df (pd.DataFrame):  
+            Dataframe of their fingerprints, indexed by planetary_id.  
+        latest (int):  
+            Latest complete generation. Pass it as since of the next call.
+    """
+    conn = connect(planet)
+    # One read transaction, so the rows match the marker's snapshot
+    conn.execute("BEGIN")
+    latest = _latest_generation(conn)
+    df = pd.read_sql("SELECT * FROM polymer WHERE generation > ? "
+                     + "AND generation <= ?", conn, params=[since, latest])
+    conn.rollback()
+    conn.close()
+    df, fp_df = _expand(df)
+    return df, fp_df, max(latest, since)
+
+def load_planet(planet: str, cache: bool = False
+                ) -> (pd.DataFrame, pd.DataFrame):
     """Loads planetary database and returns pandas dataframe
 
     Converts properties json string to columns of property values and 
@@ -19,7 +171,13 @@ def load_planet(planet: str) -> (pd.DataFrame, pd.DataFrame):
 
     Args:  
         planet(str):  
-            Planet name (full or relative path of it).
+            Planet name (full or relative path of it).  
+        cache (bool):  
+            If true, decoded columns are kept in the load_planet_cache 
+            folder of the planet, so later loads only decode generations 
+            saved since (see latest_generation) and memory-map the rest. 
+            The cache is rebuilt if the census was rolled back. 
+            Default False.
 
     Returns:  
         df (pd.DataFrame):  
@@ -27,11 +185,273 @@ def load_planet(planet: str) -> (pd.DataFrame, pd.DataFrame):
         fp_df (pd.DataFrame):  
             Dataframe of polymer fingerprints, indexed by planetary_id.
     """
-    conn = sqlite3.connect(os.path.join(planet, 
-        'planetary_database.sqlite')
-    )
+    if cache:
+        return _load_cached(planet)
+    conn = connect(planet)
     query = "SELECT * FROM polymer"
     df = pd.read_sql(query, conn)
+    conn.close()
+    return _expand(df)
+
+def _load_cached(planet: str) -> (pd.DataFrame, pd.DataFrame):
+    """load_planet through the load_planet_cache folder of planet.
+
+    meta.json of the folder has the latest cached generation, a key of 
+    the census up to it, the number of cached rows, the file and dtype
+    of each cached column of df, and the fingerprint block. Numeric 
+    columns are raw arrays, appended to and memory-mapped, other columns 
+    are appended pickles. Fingerprints are one raw (rows, columns) float64
+    block with the dtype of each column, so wide fingerprints don't take 
+    a file per column.
+    """
+    folder = os.path.join(planet, 'load_planet_cache')
+    meta_path = os.path.join(folder, 'meta.json')
+    conn = connect(planet)
+    # One read transaction, so the cache and the rest of the rows match
+    conn.execute("BEGIN")
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if ('fp_block' not in meta 
+            or meta['key'] != _cache_key(conn, meta['generation'])):
+            meta = None
+    if meta is None:
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+        meta = {'generation': -1, 'key': None, 'rows': 0, 
+                'columns': {}, 'fp_block': {'file': 'fp_block', 
+                                            'columns': {}}}
+    latest = _latest_generation(conn)
+    if latest > meta['generation']:
+        df, fp_df = _expand(pd.read_sql("SELECT * FROM polymer WHERE "
+                + "generation > ? AND generation <= ?", conn, 
+                params=[meta['generation'], latest]))
+        # Without meta.json a half appended cache is rebuilt
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        _cache_append(folder, meta['columns'], 'df', df, meta['rows'])
+        _cache_append_block(folder, meta['fp_block'], fp_df, meta['rows'])
+        meta['rows'] += len(df)
+        meta['generation'] = latest
+        meta['key'] = _cache_key(conn, latest)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    # Generations not completely saved yet aren't cached
+    rest = pd.read_sql("SELECT * FROM polymer WHERE generation > ?", conn,
+                       params=[meta['generation']])
+    conn.rollback()
+    conn.close()
+    df = pd.DataFrame({col: _cache_read(folder, spec, meta['rows']) 
+                       for col, spec in meta['columns'].items()})
+    fp_columns = meta['fp_block']['columns']
+    fp_df = pd.DataFrame(_cache_read_block(folder, meta['fp_block'], 
+                                           meta['rows']), 
+                         columns=list(fp_columns), copy=False,
+                         index=pd.Index(df['planetary_id'] if meta['rows']
+                                        else [], name='planetary_id'))
+    fp_df = fp_df.astype({col: dtype for col, dtype in fp_columns.items()
+                          if np.dtype(dtype) != np.float64})
+    if len(rest) != 0:
+        rest_df, rest_fp_df = _expand(rest)
+        df = pd.concat([df, rest_df], ignore_index=True)
+        fp_df = pd.concat([fp_df, rest_fp_df])
+    return df, fp_df
+
+def _cache_key(conn, generation: int) -> list:
+    """Returns what changes if census up to generation is rewritten"""
+    try:
+        return list(conn.execute("SELECT COUNT(*), MAX(written_at) FROM "
+            + "census_log WHERE generation <= ?", (generation,)).fetchone())
+    except sqlite3.OperationalError:
+        # Databases written before census_log
+        return list(conn.execute("SELECT COUNT(*) FROM polymer WHERE "
+            + "generation <= ?", (generation,)).fetchone())
+
+def _cache_append(folder: str, specs: dict, prefix: str, df: pd.DataFrame,
+                  rows: int):
+    """Appends columns of df to the cached columns in specs.
+
+    Columns new to the cache start with rows of nan, cached columns df 
+    doesn't have get nan, and columns whose dtype changes are rewritten.
+    """
+    for col in list(specs) + [col for col in df.columns if col not in specs]:
+        values = df[col].to_numpy() if col in df.columns else np.full(
+                len(df), np.nan)
+        if col not in specs:
+            if rows == 0:
+                dtype = values.dtype if values.dtype.kind in 'biuf' else (
+                        np.dtype(object))
+            else:
+                dtype = np.dtype(np.float64)
+            specs[col] = {'file': '{}_{}'.format(prefix, len(specs)),
+                          'dtype': dtype.str}
+            _cache_write(folder, specs[col], np.full(rows, np.nan), 'wb')
+        cached = np.dtype(specs[col]['dtype'])
+        if cached.kind in 'biuf' and values.dtype.kind in 'biuf':
+            dtype = np.result_type(cached, values.dtype)
+        else:
+            dtype = np.dtype(object)
+        if dtype != cached:
+            old = np.asarray(_cache_read(folder, specs[col], rows)
+                             ).astype(dtype)
+            specs[col]['dtype'] = dtype.str
+            _cache_write(folder, specs[col], old, 'wb')
+        _cache_write(folder, specs[col], values.astype(dtype), 'ab')
+
+def _cache_append_block(folder: str, block: dict, fp_df: pd.DataFrame, 
+                        rows: int):
+    """Appends rows of fp_df to the cached fingerprint block.
+
+    Cached columns fp_df doesn't have get nan. Columns new to the cache 
+    are nan for cached rows, so the block is rewritten wider.
+    """
+    columns = block['columns']
+    path = os.path.join(folder, block['file'])
+    new = [col for col in fp_df.columns if col not in columns]
+    if len(new) != 0 and rows != 0:
+        widened = np.full((rows, len(columns) + len(new)), np.nan)
+        widened[:, :len(columns)] = _cache_read_block(folder, block, rows)
+        with open(path, 'wb') as f:
+            f.write(widened.tobytes())
+        del widened
+    for col in list(columns) + new:
+        values = fp_df[col] if col in fp_df.columns else None
+        if (values is None or values.dtype.kind not in 'biuf'
+            or (col in new and rows != 0)):
+            # Columns with nan, or that aren't numbers, read back as float
+            dtype = np.dtype(np.float64)
+        else:
+            dtype = values.dtype
+        columns[col] = (np.result_type(np.dtype(columns[col]), dtype) 
+                        if col in columns else dtype).str
+    block_rows = fp_df.reindex(columns=list(columns)).to_numpy(
+            dtype=np.float64)
+    with open(path, 'ab') as f:
+        f.write(np.ascontiguousarray(block_rows).tobytes())
+
+def _cache_read_block(folder: str, block: dict, rows: int) -> np.ndarray:
+    """Returns first rows of the cached fingerprint block"""
+    shape = (rows, len(block['columns']))
+    if rows == 0 or shape[1] == 0:
+        return np.empty(shape)
+    return np.memmap(os.path.join(folder, block['file']), dtype=np.float64,
+                     mode='r', shape=shape)
+
+def _cache_write(folder: str, spec: dict, values: np.ndarray, mode: str):
+    """Writes (mode 'wb') or appends (mode 'ab') values to a cached column"""
+    with open(os.path.join(folder, spec['file']), mode) as f:
+        if np.dtype(spec['dtype']).kind in 'biuf':
+            f.write(np.ascontiguousarray(values).tobytes())
+        else:
+            pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _cache_read(folder: str, spec: dict, rows: int) -> np.ndarray:
+    """Returns first rows values of a cached column"""
+    path = os.path.join(folder, spec['file'])
+    dtype = np.dtype(spec['dtype'])
+    if dtype.kind in 'biuf':
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+    chunks = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                chunks.append(pickle.load(f))
+            except EOFError:
+                break
+    return np.concatenate(chunks)[:rows] if len(chunks) != 0 else (
+            np.empty(0, dtype=object))
+
+
+def load_hall_of_fame(planet: str, archive: str = None) -> pd.DataFrame:
+    """Loads hall of fame of a planet (see polyga.halloffame)
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        archive (str):  
+            Archive to load, e.g., 'fitness:Awesomeland'. Default None, 
+            meaning all.
+
+    Returns (pd.DataFrame):  
+        Polymers of the archives as of the last generation saved, best of
+        each archive first.
+    """
+    path = os.path.join(planet, 'hall_of_fame.sqlite')
+    if os.path.exists(path):
+        conn = sqlite3.connect(_readonly_uri(path), uri=True)
+    else:
+        conn = connect(planet)
+    query = "SELECT * FROM hall_of_fame"
+    params = []
+    if archive is not None:
+        query += " WHERE archive = ?"
+        params.append(archive)
+    df = pd.read_sql(query + " ORDER BY archive, rank", conn, params=params)
+    conn.close()
+    return df.drop(columns='id')
+
+def load_generation(planet: str, generation: int = None, 
+                    nations: list = None, top_k: int = None, 
+                    by: str = None, ascending: bool = False
+                    ) -> (pd.DataFrame, pd.DataFrame):
+    """Loads polymers of one generation of a planetary database
+
+    Filters run in SQL, so only the chosen polymers are parsed.
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        generation (int):  
+            Generation to load. Default None, meaning the last generation 
+            of the chosen nations.  
+        nations (list):  
+            Names of nations polymers settled in. Default None, meaning 
+            all nations.  
+        top_k (int):  
+            If passed, only the top_k polymers by property by are loaded.  
+        by (str):  
+            Property to rank polymers by when top_k passed.  
+        ascending (bool):  
+            If true, polymers with the lowest values of by are the top 
+            polymers. Default False.
+
+    Returns:  
+        df (pd.DataFrame):  
+            Dataframe of polymers and their properties.  
+        fp_df (pd.DataFrame):  
+            Dataframe of polymer fingerprints, indexed by planetary_id.
+    """
+    if top_k is not None and by is None:
+        raise ValueError("Choose a property to rank top_k polymers by.")
+    conn = connect(planet)
+    where = []
+    params = []
+    if nations is not None:
+        nations = [nations] if isinstance(nations, str) else list(nations)
+        where.append("settled_nation IN ({})".format(
+            ', '.join('?' * len(nations))))
+        params.extend(nations)
+    if generation is None:
+        generation = conn.execute("SELECT MAX(generation) FROM polymer" 
+                + (" WHERE " + where[0] if where else ""), params).fetchone()[0]
+    where.append("generation = ?")
+    params.append(generation)
+    query = "SELECT * FROM polymer WHERE " + " AND ".join(where)
+    if top_k is not None:
+        query += " ORDER BY json_extract(properties, ?) {} LIMIT ?".format(
+                'ASC' if ascending else 'DESC')
+        params.extend(['$."{}"'.format(by), top_k])
+    df = pd.read_sql(query, conn, params=params)
+    conn.close()
+    return _expand(df)
+
+
+def _expand(df: pd.DataFrame) -> (pd.DataFrame, pd.DataFrame):
+    """Expands properties and fingerprints of polymer table rows"""
     cols = df.columns
     df_dict = defaultdict(list)
     fp_list = []
@@ -50,7 +470,476 @@ def load_planet(planet: str) -> (pd.DataFrame, pd.DataFrame):
             else:
                 df_dict[col].append(row[col])
     df = pd.DataFrame.from_dict(df_dict)
-    fp_df = pd.DataFrame(fp_list)
+    fp_df = pd.DataFrame(fp_list, columns=['planetary_id'] if 
+                         len(fp_list) == 0 else None)
     fp_df = fp_df.set_index(keys=['planetary_id'])
     return df, fp_df
 
+
+def load_fingerprint_store(planet: str, chunk_size: int = 10000
+                           ) -> (np.ndarray, FingerprintStore):
+    """Loads fingerprints of planetary database into a FingerprintStore
+
+    Unlike load_planet, no dataframe is built, so similarity searches over 
+    large planets stay in bit-packed memory. Rows are packed chunk_size at
+    a time as they are read.
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        chunk_size (int):  
+            Rows decoded and packed at once. Default 10000.
+
+    Returns:  
+        planetary_ids (np.ndarray):  
+            Planetary id of each row of the store.  
+        store (FingerprintStore):  
+            Fingerprints, one row per row of the polymer table. Columns 
+            missing from a row are 0.
+    """
+    conn = connect(planet)
+    rows = conn.execute("SELECT planetary_id, fingerprint FROM polymer")
+    planetary_ids = []
+    stores = []
+    while True:
+        chunk = rows.fetchmany(chunk_size)
+        if len(chunk) == 0:
+            break
+        fps = [json.loads(fp) for _, fp in chunk]
+        planetary_ids.extend(planetary_id for planetary_id, _ in chunk)
+        headers = list(dict.fromkeys(key for fp in fps for key in fp))
+        columns = {col: i for i, col in enumerate(headers)}
+        matrix = np.zeros((len(fps), len(headers)))
+        for i, fp in enumerate(fps):
+            matrix[i, [columns[key] for key in fp]] = list(fp.values())
+        stores.append(FingerprintStore.from_matrix(matrix, headers))
+    conn.close()
+    if len(stores) == 0:
+        store = FingerprintStore.from_matrix(np.zeros((0, 0)), [])
+    else:
+        store = FingerprintStore.concat(stores)
+    return np.array(planetary_ids, dtype=np.int64), store
+
+
+def load_census(planet: str, columns: list = None, nations: list = None,
+                generations: list = None, fingerprints: bool = False
+                ) -> (pd.DataFrame, FingerprintStore):
+    """Loads a Parquet census (see polyga.census.ParquetCensus)
+
+    Only files of the chosen nations and generations are opened and only
+    the chosen columns are read from them.
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        columns (list):  
+            Columns to read, e.g., ['planetary_id', 'Polymer_Coolness']. 
+            settled_nation and generation are always included. Default 
+            None, meaning all columns except fingerprints.  
+        nations (list):  
+            Nations to read. Default None, meaning all.  
+        generations (list):  
+            Generations to read. Default None, meaning all.  
+        fingerprints (bool):  
+            If true, fingerprints are read too. Default False.
+
+    Returns:  
+        df (pd.DataFrame):  
+            Dataframe of polymers. Columns a file doesn't have are nan.  
+        store (FingerprintStore):  
+            Fingerprints with rows in the order of df, or None if 
+            fingerprints is false.
+    """
+    import pyarrow.parquet as pq
+    folder = os.path.join(planet, 'census')
+    if isinstance(nations, str):
+        nations = [nations]
+    frames = []
+    stores = []
+    for nation_folder in sorted(os.listdir(folder)):
+        nation = nation_folder.split('=', 1)[1]
+        if nations is not None and nation not in nations:
+            continue
+        partitions = sorted(os.listdir(os.path.join(folder, nation_folder)),
+                            key=lambda name: int(name.split('=')[1]))
+        for generation_folder in partitions:
+            generation = int(generation_folder.split('=')[1])
+            if generations is not None and generation not in generations:
+                continue
+            path = os.path.join(folder, nation_folder, generation_folder,
+                                'part-0.parquet')
+            schema = pq.read_schema(path)
+            metadata = {key.decode(): json.loads(value) for key, value in
+                        schema.metadata.items() 
+                        if key.decode().startswith('polyga_')}
+            fp_cols = set(metadata['polyga_dense_headers']) | {
+                          'fingerprint_bits'}
+            if columns is None:
+                wanted = [col for col in schema.names if col not in fp_cols]
+            else:
+                wanted = [col for col in columns if col in schema.names]
+            if fingerprints:
+                wanted += [col for col in schema.names if col in fp_cols 
+                           and col not in wanted]
+            table = pq.read_table(path, columns=wanted)
+            df = table.select([col for col in wanted if col not in fp_cols
+                               or (columns is not None and col in columns)]
+                              ).to_pandas()
+            df.insert(0, 'generation', generation)
+            df.insert(0, 'settled_nation', nation)
+            frames.append(df)
+            if fingerprints:
+                stores.append(_parquet_fingerprints(table, metadata))
+    df = pd.concat(frames, ignore_index=True) if len(frames) != 0 else (
+            pd.DataFrame(columns=['settled_nation', 'generation']))
+    if not fingerprints:
+        return df, None
+    return df, FingerprintStore.concat(stores) if len(stores) != 0 else (
+            FingerprintStore.empty())
+
+def _parquet_fingerprints(table, metadata: dict) -> FingerprintStore:
+    """Returns FingerprintStore of a Parquet census table"""
+    bit_headers = metadata['polyga_bit_headers']
+    dense_headers = metadata['polyga_dense_headers']
+    num_words = (len(bit_headers) + 63) // 64
+    if 'fingerprint_bits' in table.column_names:
+        column = table.column('fingerprint_bits').combine_chunks()
+        width = column.type.byte_width
+        bits = np.frombuffer(column.buffers()[1], dtype=np.uint8, 
+                             count=len(column) * width, 
+                             offset=column.offset * width)
+        bits = bits.view(np.uint64).reshape(len(column), num_words)
+    else:
+        bits = np.zeros((table.num_rows, num_words), dtype=np.uint64)
+    dense = np.column_stack([table.column(col).to_numpy() for col in 
+                             dense_headers]) if dense_headers else (
+            np.zeros((table.num_rows, 0)))
+    return FingerprintStore(metadata['polyga_fp_headers'], bit_headers, 
+                            bits, dense_headers, dense)
+
+# Columns of the polymer table that generation_statistics can group by or
+# summarize directly. Anything else is looked up in the properties json.
+_GROUP_COLUMNS = ['generation', 'settled_planet', 'settled_land', 
+                  'settled_nation', 'birth_planet', 'birth_land', 
+                  'birth_nation', 'is_parent']
+_SCALAR_COLUMNS = ['planetary_id', 'parent_1_id', 'parent_2_id', 'is_parent',
+                   'num_chromosomes', 'generation']
+
+def generation_statistics(planet: str, properties: list, 
+                          by: list = None, quantiles: list = None
+                          ) -> pd.DataFrame:
+    """Returns summary statistics of properties per generation and nation
+
+    Count, mean, std, min, and max are computed by SQLite in one grouped
+    pass, with properties read out of the json column by json_extract.
+    Quantiles of a property are found with one window query that returns 
+    only the two values around each quantile, so neither fingerprints nor
+    whole columns are loaded into pandas.
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        properties (list):  
+            Properties to summarize. May also be numeric columns of the 
+            polymer table, like num_chromosomes.  
+        by (list):  
+            Columns to group by. Default ['generation', 'settled_nation'].  
+        quantiles (list):  
+            Quantiles to compute, between 0 and 1. Linearly interpolated, 
+            like pandas. Default [0.25, 0.5, 0.75].
+
+    Returns:  
+        df (pd.DataFrame):  
+            One row per group, indexed by the by columns. Columns are 
+            (property, statistic), statistic being count, mean, std, min, 
+            max, and e.g. 25% for quantile 0.25. std is the sample standard
+            deviation. Polymers missing a property are left out of its 
+            statistics.
+    """
+    if by is None:
+        by = ['generation', 'settled_nation']
+    if quantiles is None:
+        quantiles = [0.25, 0.5, 0.75]
+    by = [by] if isinstance(by, str) else list(by)
+    properties = [properties] if isinstance(properties, str) else list(
+            properties)
+    for col in by:
+        if col not in _GROUP_COLUMNS:
+            raise ValueError("Choose a valid column to group by. {} "
+                             "invalid.".format(col))
+    for q in quantiles:
+        if not 0 <= q <= 1:
+            raise ValueError("Choose a valid quantile. {} invalid.".format(q))
+    keys = ', '.join(by)
+    values = ', '.join('{} AS v{}'.format(_value(prop), i) 
+                       for i, prop in enumerate(properties))
+    vals = "SELECT {}, {} FROM polymer".format(keys, values)
+    means = ', '.join('AVG(v{0}) AS m{0}'.format(i) 
+                      for i in range(len(properties)))
+    stats = ', '.join(('COUNT(v{0}), m{0}, SUM((v{0} - m{0}) * (v{0} - m{0})),'
+                      + ' MIN(v{0}), MAX(v{0})').format(i) 
+                      for i in range(len(properties)))
+    query = """
+    WITH vals AS ({vals}),
+    means AS (SELECT {keys}, {means} FROM vals GROUP BY {keys})
+    SELECT {keys}, {stats}
+    FROM vals JOIN means USING ({keys})
+    GROUP BY {keys}
+    ORDER BY {keys}
+    """.format(vals=vals, keys=keys, means=means, stats=stats)
+    conn = connect(planet)
+    rows = conn.execute(query).fetchall()
+    columns = pd.MultiIndex.from_product([properties, 
+                                          ['count', 'mean', 'std', 'min', 
+                                           'max']])
+    index = pd.MultiIndex.from_arrays([[row[i] for row in rows] for i in 
+                                       range(len(by))], names=by)
+    df = pd.DataFrame([row[len(by):] for row in rows], index=index, 
+                      columns=columns, dtype=np.float64)
+    for prop in properties:
+        count = df[(prop, 'count')]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df[(prop, 'std')] = np.sqrt(df[(prop, 'std')] / (count - 1))
+        df[(prop, 'count')] = count.astype(np.int64)
+        if len(quantiles) != 0:
+            values = _quantiles(conn, prop, by, quantiles, index)
+            for j, q in enumerate(quantiles):
+                df[(prop, '{:g}%'.format(q * 100))] = values[:, j]
+    conn.close()
+    if len(by) == 1:
+        df.index = df.index.get_level_values(0)
+    return df[[(prop, stat) for prop in properties for stat in 
+               ['count', 'mean', 'std', 'min', 'max'] + 
+               ['{:g}%'.format(q * 100) for q in quantiles]]]
+
+def _value(prop: str) -> str:
+    """Returns SQL expression of a property or scalar column"""
+    if prop in _SCALAR_COLUMNS:
+        return prop
+    return "json_extract(properties, '$.\"{}\"')".format(
+            prop.replace("'", "''"))
+
+def _quantiles(conn, prop: str, by: list, quantiles: list, 
+               index: pd.MultiIndex) -> np.ndarray:
+    """Returns (len(index), len(quantiles)) quantiles of prop in each group
+
+    Values are ranked in one window pass, and only the two values around
+    each quantile are returned.
+    """
+    keys = ', '.join(by)
+    query = """
+    WITH qs(j, q) AS (VALUES {qs})
+    SELECT {keys}, j, q * (n - 1), rank, v FROM (
+        SELECT {keys}, v, 
+               ROW_NUMBER() OVER (PARTITION BY {keys} ORDER BY v) - 1 AS rank,
+               COUNT(*) OVER (PARTITION BY {keys}) AS n
+        FROM (SELECT {keys}, {value} AS v FROM polymer) 
+        WHERE v IS NOT NULL
+    ) CROSS JOIN qs
+    WHERE rank = CAST(q * (n - 1) AS INTEGER) 
+       OR rank = CAST(q * (n - 1) AS INTEGER) + 1
+    """.format(keys=keys, value=_value(prop), 
+               qs=', '.join(['(?, ?)'] * len(quantiles)))
+    params = [x for j, q in enumerate(quantiles) for x in (j, q)]
+    position = {}
+    low = {}
+    high = {}
+    for row in conn.execute(query, params):
+        group = row[:len(by)]
+        j, pos, rank, value = row[len(by):]
+        position[group, j] = pos
+        if rank == int(pos):
+            low[group, j] = value
+        else:
+            high[group, j] = value
+    result = np.full((len(index), len(quantiles)), np.nan)
+    for i, group in enumerate(index):
+        group = tuple(group) if isinstance(group, tuple) else (group,)
+        for j in range(len(quantiles)):
+            if (group, j) in low:
+                fraction = position[group, j] - int(position[group, j])
+                result[i, j] = low[group, j] + fraction * (
+                        high.get((group, j), low[group, j]) - low[group, j])
+    return result
+
+# Lineage queries walk the indexed parent ids of the polymer table with 
+# recursive common table expressions, so only the family of a polymer is read.
+# UNION drops repeats of (id, depth), which keeps inbred families from 
+# multiplying the rows.
+_ANCESTORS = """
+WITH RECURSIVE tree(planetary_id, depth) AS (
+    SELECT ?, 0
+    UNION
+    SELECT CASE parent.k WHEN 1 THEN p.parent_1_id ELSE p.parent_2_id END,
+           tree.depth + 1
+    FROM tree
+    JOIN polymer p ON p.planetary_id = tree.planetary_id
+    JOIN (SELECT 1 AS k UNION ALL SELECT 2) parent
+    WHERE tree.depth < ?
+)
+SELECT p.planetary_id, p.parent_1_id, p.parent_2_id, p.smiles_string,
+       p.generation, p.settled_nation, MIN(tree.depth) AS depth
+FROM tree JOIN polymer p ON p.planetary_id = tree.planetary_id
+GROUP BY p.planetary_id
+ORDER BY depth, p.planetary_id
+"""
+
+_DESCENDANTS = """
+WITH RECURSIVE tree(planetary_id, depth) AS (
+    SELECT ?, 0
+    UNION
+    SELECT c.planetary_id, tree.depth + 1
+    FROM tree
+    JOIN polymer c ON c.parent_1_id = tree.planetary_id 
+                   OR c.parent_2_id = tree.planetary_id
+    WHERE tree.depth < ?
+)
+SELECT {}
+FROM tree JOIN polymer p ON p.planetary_id = tree.planetary_id
+WHERE tree.depth > 0
+{}
+"""
+
+def _max_depth(max_depth):
+    """Returns max_depth, or a depth no lineage reaches if None"""
+    return 2**62 if max_depth is None else max_depth
+
+def ancestors(planet: str, planetary_id: int, 
+              max_depth: int = None) -> pd.DataFrame:
+    """Returns ancestry tree of a polymer
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        planetary_id (int):  
+            Polymer whose ancestors are returned.  
+        max_depth (int):  
+            Number of generations to go back. Default None, meaning all.
+
+    Returns:  
+        df (pd.DataFrame):  
+            The polymer (depth 0) and each ancestor in the database, with 
+            its parent ids, smiles_string, generation, settled_nation, and
+            depth, the fewest generations between it and the polymer. 
+            Parent ids link the rows into the tree.
+    """
+    conn = connect(planet)
+    df = pd.read_sql(_ANCESTORS, conn, 
+                     params=[int(planetary_id), _max_depth(max_depth)])
+    conn.close()
+    return df
+
+def descendants(planet: str, planetary_id: int,
+                max_depth: int = None) -> pd.DataFrame:
+    """Returns descendants of a polymer
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        planetary_id (int):  
+            Polymer whose descendants are returned.  
+        max_depth (int):  
+            Number of generations to go forward. Default None, meaning all.
+
+    Returns:  
+        df (pd.DataFrame):  
+            Each descendant with its parent ids, smiles_string, generation,
+            settled_nation, and depth, the fewest generations between the 
+            polymer and it.
+    """
+    conn = connect(planet)
+    query = _DESCENDANTS.format("p.planetary_id, p.parent_1_id, "
+            + "p.parent_2_id, p.smiles_string, p.generation, "
+            + "p.settled_nation, MIN(tree.depth) AS depth", 
+            "GROUP BY p.planetary_id ORDER BY depth, p.planetary_id")
+    df = pd.read_sql(query, conn, 
+                     params=[int(planetary_id), _max_depth(max_depth)])
+    conn.close()
+    return df
+
+def descendant_count(planet: str, planetary_id: int, 
+                     max_depth: int = None) -> int:
+    """Returns number of descendants of a polymer in the database
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        planetary_id (int):  
+            Polymer whose descendants are counted.  
+        max_depth (int):  
+            Number of generations to go forward. Default None, meaning all.
+    """
+    conn = connect(planet)
+    query = _DESCENDANTS.format("COUNT(DISTINCT p.planetary_id)", "")
+    count = conn.execute(query, [int(planetary_id), 
+                                 _max_depth(max_depth)]).fetchone()[0]
+    conn.close()
+    return count
+
+def founder_contributions(planet: str, planetary_id: int) -> pd.Series:
+    """Returns expected share of a polymer's chromosomes from each founder
+
+    Each parent passes on half of its child's chromosomes, so an ancestor
+    contributes 0.5**depth along each path to the polymer. Founders are 
+    ancestors whose parents are not in the database (e.g., generation 0).
+    Only the ancestry tree is read from the database.
+
+    Args:  
+        planet(str):  
+            Planet name (full or relative path of it).  
+        planetary_id (int):  
+            Polymer whose founders are returned.
+
+    Returns:  
+        contributions (pd.Series):  
+            Share of each founder, indexed by planetary_id. Sums to 1.
+    """
+    tree = ancestors(planet, planetary_id)
+    if len(tree) == 0:
+        return pd.Series([], dtype=np.float64, name='contribution')
+    parents = {row.planetary_id: (row.parent_1_id, row.parent_2_id) for 
+               row in tree.itertuples()}
+    # A polymer's share is complete once all its children in the tree
+    # passed theirs on
+    num_children = defaultdict(int)
+    for polymer_parents in parents.values():
+        for parent in polymer_parents:
+            num_children[parent] += 1
+    share = defaultdict(float)
+    share[int(planetary_id)] = 1.0
+    ready = [int(planetary_id)]
+    contributions = defaultdict(float)
+    while len(ready) != 0:
+        polymer = ready.pop()
+        for parent in parents[polymer]:
+            if parent in parents:
+                share[parent] += share[polymer] / 2
+                num_children[parent] -= 1
+                if num_children[parent] == 0:
+                    ready.append(parent)
+            else:
+                contributions[polymer] += share[polymer] / 2
+    return pd.Series(contributions, name='contribution').sort_index()
+
+def unique_polymers(df: pd.DataFrame, keep: str = 'first') -> pd.DataFrame:
+    """Drops repeats of the same polymer from a planet dataframe
+
+    Polymers are compared by their canonical repeat unit key (see 
+    polyga.canonical), so the same polymer written from a different cut or
+    direction counts as a repeat.
+
+    Args:  
+        df (pd.DataFrame):  
+            Dataframe of polymers with a smiles_string column.  
+        keep (str):  
+            Which repeat to keep, 'first' or 'last'. Default 'first'.
+
+    Returns:  
+        df (pd.DataFrame):  
+            Dataframe with one row per polymer.
+    """
+    keys = df['smiles_string'].map(polymer_key)
+    return df.loc[~keys.duplicated(keep=keep)]
+
+
+from polyga.analysis.similarity import SimilarityIndex
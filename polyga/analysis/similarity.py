@@ -0,0 +1,384 @@
+"""Similarity search over the fingerprints of a planet's history.
+
+SimilarityIndex keeps every polymer's fingerprint bit-packed (see
+polyga.fingerprints.FingerprintStore) with its squared norm, so a Tanimoto
+scan is a popcount per word. With lsh=True it also keeps MinHash signatures
+of the bits, hashed band by band into sorted tables, so approximate queries
+only score polymers sharing a band with the query.
+
+Example:
+    index = SimilarityIndex.build('Planet_Silly', lsh=True)
+    index.save('Planet_Silly')
+    index = SimilarityIndex.load('Planet_Silly')
+    index.nearest(42, k=10)
+    index.within('[*]CC[*]', threshold=0.8)
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from polyga.canonical import polymer_key
+from polyga.fingerprints import FingerprintStore, pack_bits, popcount
+
+# Odd multiplier mixing signature values of a band into one hash
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class SimilarityIndex:
+    """Fingerprints of every polymer of a planet, ready for searches.
+
+    Rows are sorted by planetary id.
+
+    Attributes:
+
+        planetary_ids (np.ndarray):
+            Planetary id of each row.
+
+        smiles (np.ndarray):
+            Smiles string of each row, as python strings.
+
+        store (FingerprintStore):
+            Fingerprints of each row.
+
+        norms (np.ndarray):
+            Squared norm of each row's fingerprint, its number of set bits
+            plus the sum of squares of its non-binary columns.
+
+        generation (int):
+            Latest complete generation of the planet when built.
+
+        signatures (np.ndarray):
+            (n, lsh_bands * lsh_rows) MinHash signatures of the bits, or
+            None if the index has no LSH tables.
+
+        lsh_rows (int):
+            Signature values per band.
+
+        seed (int):
+            Seed of the MinHash permutations.
+    """
+    def __init__(self, planetary_ids: np.ndarray, smiles: np.ndarray,
+                 store: FingerprintStore, generation: int = -1,
+                 signatures: np.ndarray = None, lsh_rows: int = 4,
+                 seed: int = 0):
+        order = np.argsort(planetary_ids, kind='stable')
+        self.planetary_ids = np.asarray(planetary_ids, dtype=np.int64)[order]
+        # Object array, as fixed width strings pad to the longest smiles
+        self.smiles = np.asarray(smiles, dtype=object)[order]
+        store = store.take(order)
+        self.store = FingerprintStore(store.headers, store.bit_headers,
+                                      np.ascontiguousarray(store.bits),
+                                      store.dense_headers,
+                                      store.dense.astype(np.float64))
+        self.norms = (popcount(self.store.bits)
+                      + np.einsum('ij,ij->i', self.store.dense,
+                                  self.store.dense))
+        self.generation = generation
+        self.lsh_rows = lsh_rows
+        self.seed = seed
+        self.signatures = None
+        if signatures is not None:
+            self.__index(np.asarray(signatures)[order])
+        self.__rows = None
+        self.__keys = None
+
+    @classmethod
+    def build(cls, planet: str, lsh: bool = False, lsh_bands: int = 16,
+              lsh_rows: int = 4, seed: int = 0,
+              chunk_size: int = 10000) -> 'SimilarityIndex':
+        """Returns index of every polymer in the census of planet.
+
+        Args:
+            planet (str):
+                Planet name (full or relative path of it). SQLite, sharded
+                and Parquet censuses are read.
+
+            lsh (bool):
+                If true, MinHash LSH tables are built for approximate
+                queries. Default False.
+
+            lsh_bands (int):
+                Number of bands. More bands find more of the true
+                neighbors and score more candidates. Default 16.
+
+            lsh_rows (int):
+                Signature values per band. More rows make candidates more
+                similar to the query. Default 4.
+
+            seed (int):
+                Seed of the MinHash permutations. Default 0.
+
+            chunk_size (int):
+                Rows unpacked at once while signing. Default 10000.
+        """
+        from polyga import analysis
+        if os.path.isdir(os.path.join(planet, 'census')):
+            df, store = analysis.load_census(planet, columns=['planetary_id',
+                    'smiles_string'], fingerprints=True)
+            planetary_ids = df['planetary_id'].to_numpy()
+            smiles = df['smiles_string'].to_numpy()
+            generation = int(df['generation'].max()) if len(df) else -1
+        else:
+            planetary_ids, store = analysis.load_fingerprint_store(planet)
+            conn = analysis.connect(planet)
+            names = dict(conn.execute(
+                "SELECT planetary_id, smiles_string FROM polymer"))
+            conn.close()
+            generation = analysis.latest_generation(planet)
+            smiles = [names[i] for i in planetary_ids.tolist()]
+        index = cls(planetary_ids, smiles, store, generation, None, lsh_rows,
+                    seed)
+        if lsh:
+            index.__index(index.__sign(index.store.bits, lsh_bands * lsh_rows,
+                                       chunk_size))
+        return index
+
+    def __len__(self):
+        return len(self.planetary_ids)
+
+    def save(self, path: str):
+        """Saves index to path, or to similarity_index.npz in folder path"""
+        if os.path.isdir(path):
+            path = os.path.join(path, 'similarity_index.npz')
+        # Smiles are saved as utf-8 bytes and offsets, so loading doesn't
+        # unpickle or pad them
+        encoded = [smiles.encode() for smiles in self.smiles.tolist()]
+        arrays = {
+                  'planetary_ids': self.planetary_ids,
+                  'smiles_bytes': np.frombuffer(b''.join(encoded), 
+                                                dtype=np.uint8),
+                  'smiles_offsets': np.cumsum([0] + [len(smiles) for smiles
+                                                     in encoded]),
+                  'bits': self.store.bits,
+                  'dense': self.store.dense,
+                  'meta': np.array(json.dumps({
+                      'headers': self.store.headers,
+                      'bit_headers': self.store.bit_headers,
+                      'dense_headers': self.store.dense_headers,
+                      'generation': self.generation,
+                      'lsh_rows': self.lsh_rows,
+                      'seed': self.seed,
+                      })),
+                 }
+        if self.signatures is not None:
+            arrays['signatures'] = self.signatures
+        # Readers never see a partial file
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str) -> 'SimilarityIndex':
+        """Loads index saved to path, or to similarity_index.npz in path"""
+        if os.path.isdir(path):
+            path = os.path.join(path, 'similarity_index.npz')
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            if 'smiles_bytes' in arrays.files:
+                data = arrays['smiles_bytes'].tobytes()
+                offsets = arrays['smiles_offsets'].tolist()
+                smiles = [data[start:end].decode() for start, end in 
+                          zip(offsets[:-1], offsets[1:])]
+            else:
+                smiles = arrays['smiles']
+            store = FingerprintStore(meta['headers'], meta['bit_headers'],
+                                     arrays['bits'], meta['dense_headers'],
+                                     arrays['dense'])
+            return cls(arrays['planetary_ids'], smiles, store,
+                       meta['generation'], arrays['signatures']
+                       if 'signatures' in arrays.files else None,
+                       meta['lsh_rows'], meta['seed'])
+
+    def nearest(self, query, k: int = 10, fingerprint_function=None,
+                approximate: bool = None) -> pd.DataFrame:
+        """Returns the k polymers most similar to query.
+
+        Args:
+            query (int or str):
+                Planetary id, or smiles string of a polymer. Smiles are
+                matched up to how the repeat unit is written (see 
+                polyga.canonical). Smiles not in the index are 
+                fingerprinted with fingerprint_function.
+
+            k (int):
+                Number of polymers returned. Default 10.
+
+            fingerprint_function (callable):
+                The planet's fingerprint function. Only needed for smiles
+                not in the index.
+
+            approximate (bool):
+                If true, only polymers sharing an LSH band with query are
+                scored, so fewer than k may be returned. Default true if
+                the index has LSH tables.
+
+        Returns (pd.DataFrame):
+            planetary_id, smiles_string and Tanimoto similarity of each
+            polymer, most similar first. The query itself is included if
+            it is in the index.
+        """
+        rows, similarity = self.__scores(query, fingerprint_function,
+                                         approximate)
+        if k < len(rows):
+            top = np.argpartition(-similarity, k - 1)[:k]
+            rows, similarity = rows[top], similarity[top]
+        return self.__frame(rows, similarity)
+
+    def within(self, query, threshold: float = 0.7, fingerprint_function=None,
+               approximate: bool = None) -> pd.DataFrame:
+        """Returns polymers at least threshold similar to query.
+
+        Args:
+            threshold (float):
+                Least Tanimoto similarity returned. Default 0.7.
+
+            query, fingerprint_function, approximate:
+                See nearest.
+
+        Returns (pd.DataFrame):
+            See nearest.
+        """
+        rows, similarity = self.__scores(query, fingerprint_function,
+                                         approximate)
+        keep = similarity >= threshold
+        return self.__frame(rows[keep], similarity[keep])
+
+    def __frame(self, rows, similarity) -> pd.DataFrame:
+        """Returns rows sorted by similarity, then planetary id"""
+        order = np.lexsort((self.planetary_ids[rows], -similarity))
+        rows, similarity = rows[order], similarity[order]
+        return pd.DataFrame({'planetary_id': self.planetary_ids[rows],
+                             'smiles_string': self.smiles[rows],
+                             'similarity': similarity})
+
+    def __scores(self, query, fingerprint_function, approximate):
+        """Returns candidate rows and their Tanimoto similarity to query"""
+        bits, dense, norm = self.__query(query, fingerprint_function)
+        if approximate is None:
+            approximate = self.signatures is not None
+        if approximate:
+            if self.signatures is None:
+                raise ValueError("Build the index with lsh=True for "
+                                 "approximate queries.")
+            rows = self.__candidates(bits)
+        else:
+            rows = np.arange(len(self))
+        dots = (popcount(self.store.bits[rows] & bits)
+                + self.store.dense[rows] @ dense)
+        denominators = norm + self.norms[rows] - dots
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = np.where(denominators != 0, dots / denominators, 0.0)
+        return rows, similarity
+
+    def __query(self, query, fingerprint_function):
+        """Returns packed bits, dense columns and squared norm of query"""
+        if isinstance(query, (int, np.integer)):
+            row = np.searchsorted(self.planetary_ids, query)
+            if row == len(self) or self.planetary_ids[row] != query:
+                raise ValueError("Choose a valid planetary id. {} "
+                                 "invalid.".format(query))
+            return (self.store.bits[row], self.store.dense[row],
+                    self.norms[row])
+        if self.__rows is None:
+            self.__rows = {smiles: row for row, smiles in
+                           reversed(list(enumerate(self.smiles.tolist())))}
+        row = self.__rows.get(query)
+        if row is None:
+            # Canonical keys are slow, so they're only found for smiles
+            # not written as in the index
+            if self.__keys is None:
+                self.__keys = {key: row for row, key in reversed(list(
+                    enumerate(polymer_key(smiles) for smiles in 
+                              self.smiles.tolist())))}
+            row = self.__keys.get(polymer_key(query))
+        if row is not None:
+            return (self.store.bits[row], self.store.dense[row],
+                    self.norms[row])
+        if fingerprint_function is None:
+            raise ValueError("Smiles {} is not in the index. Pass the "
+                             "planet's fingerprint_function.".format(query))
+        store = _fingerprint(query, fingerprint_function)
+        bits = pack_bits(store.columns(self.store.bit_headers))[0]
+        dense = store.columns(self.store.dense_headers)[0].astype(np.float64)
+        values = store.to_dense()[0].astype(np.float64)
+        # Columns the index doesn't have still count toward the norm
+        return bits, dense, float(values @ values)
+
+    def __sign(self, bits: np.ndarray, num_perm: int,
+               chunk_size: int) -> np.ndarray:
+        """Returns (n, num_perm) MinHash signatures of packed bits.
+
+        The signature of a permutation is the least rank of the row's set
+        bits, or the number of bits if no bit is set.
+        """
+        num_bits = len(self.store.bit_headers)
+        ranks = np.array([np.random.default_rng(self.seed + p).permutation(
+                          num_bits) for p in range(num_perm)],
+                         dtype=np.int32).reshape(num_perm, num_bits)
+        signatures = np.full((len(bits), num_perm), num_bits, dtype=np.int32)
+        for start in range(0, len(bits), chunk_size):
+            chunk = np.unpackbits(np.ascontiguousarray(
+                    bits[start:start + chunk_size]).view(np.uint8), axis=1,
+                    count=num_bits, bitorder='little')
+            rows, cols = np.nonzero(chunk)
+            if len(rows) == 0:
+                continue
+            # Set bits of a row are contiguous in cols, so the least rank
+            # of each row is a reduceat from the row's first set bit
+            has_bits = np.bincount(rows, minlength=len(chunk)) != 0
+            starts = np.searchsorted(rows, np.flatnonzero(has_bits))
+            mins = np.minimum.reduceat(ranks[:, cols], starts, axis=1)
+            signatures[start:start + chunk_size][has_bits] = mins.T
+        return signatures
+
+    def __index(self, signatures: np.ndarray):
+        """Hashes each band of signatures into a sorted table"""
+        self.signatures = signatures
+        self.__tables = []
+        for band in self.__bands(signatures):
+            order = np.argsort(band, kind='stable')
+            self.__tables.append((band[order], order))
+
+    def __bands(self, signatures: np.ndarray) -> list:
+        """Returns one uint64 hash per row for each band of signatures"""
+        signatures = np.atleast_2d(signatures).astype(np.uint64)
+        bands = []
+        with np.errstate(over='ignore'):
+            for start in range(0, signatures.shape[1], self.lsh_rows):
+                band = np.zeros(len(signatures), dtype=np.uint64)
+                for col in range(start, min(start + self.lsh_rows,
+                                            signatures.shape[1])):
+                    band = band * _MIX + signatures[:, col] + np.uint64(1)
+                bands.append(band)
+        return bands
+
+    def __candidates(self, bits: np.ndarray) -> np.ndarray:
+        """Returns rows sharing at least one band with bits"""
+        signature = self.__sign(bits[None], self.signatures.shape[1],
+                                len(self) or 1)
+        candidates = []
+        for band, (hashes, order) in zip(self.__bands(signature),
+                                         self.__tables):
+            left = np.searchsorted(hashes, band[0], side='left')
+            right = np.searchsorted(hashes, band[0], side='right')
+            candidates.append(order[left:right])
+        return np.unique(np.concatenate(candidates)) if candidates else (
+                np.zeros(0, dtype=np.int64))
+
+
+def _fingerprint(smiles: str, fingerprint_function) -> FingerprintStore:
+    """Returns FingerprintStore of smiles made by a fingerprint function"""
+    df = pd.DataFrame({'planetary_id': [0], 'smiles_string': [smiles]})
+    result = fingerprint_function(df)
+    if len(result) == 3:
+        # 'matrix' fingerprint protocol
+        planetary_ids, matrix, fp_headers = result
+        if len(planetary_ids) == 0:
+            raise ValueError("Could not fingerprint {}.".format(smiles))
+        return FingerprintStore.from_matrix(matrix, fp_headers)
+    fp_df, fp_headers = result
+    if len(fp_df) == 0:
+        raise ValueError("Could not fingerprint {}.".format(smiles))
+    return FingerprintStore.from_frame(fp_df, fp_headers)
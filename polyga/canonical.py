@@ -0,0 +1,92 @@
+"""Canonical keys of polymer repeat units and chromosome sequences.
+
+The same polymer can be written as many different repeat unit smiles,
+depending on where the repeat unit is cut and in which direction it is
+read. For example, ``[*]CC(C)[*]``, ``[*]C(C)C[*]`` and ``[*]C(C[*])C`` all
+describe polypropylene. The keys returned here are the same for all of them,
+so caches, deduplication, and analysis see one polymer.
+"""
+from rdkit import Chem, RDLogger
+
+def chromosome_key(chromosome_ids: list) -> tuple:
+    """Returns canonical key of a chromosome sequence.
+
+    Sequences are equal up to rotation and reversal, e.g., [1, 2, 3, 4],
+    [3, 4, 1, 2] and [4, 3, 2, 1] share a key.
+
+    Args:
+        chromosome_ids (list):
+            list of chromosome ids
+
+    Returns (tuple):
+        smallest rotation of the sequence or its reverse
+    """
+    ids = tuple(int(x) for x in chromosome_ids)
+    n = len(ids)
+    if n == 0:
+        return ids
+    reverse = ids[::-1]
+    return min(min(seq[i:] + seq[:i] for i in range(n))
+               for seq in (ids, reverse))
+
+def polymer_key(smiles: str) -> str:
+    """Returns canonical key of a polymer repeat unit.
+
+    The two end groups ([*]) are removed and the repeat unit is closed on
+    itself into a cyclic oligomer (a dimer, or a trimer if both ends sit on
+    the same atom). The RDKit canonical smiles of that ring does not depend
+    on where the repeat unit was cut or the direction it was written in.
+
+    Repeat units that are multiples of each other (e.g., [*]C[*] and
+    [*]CC[*]) are not given the same key.
+
+    Args:
+        smiles (str):
+            smiles of repeat unit with two [*] end groups
+
+    Returns (str):
+        Canonical key. If the smiles does not have exactly two end groups
+        the RDKit canonical smiles is returned. If the smiles cannot be
+        parsed, it is returned unchanged.
+    """
+    RDLogger.DisableLog('rdApp.*')
+    try:
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            return smiles
+        cyclic = _cyclic_oligomer(mol)
+        if cyclic is None:
+            return Chem.MolToSmiles(mol)
+        return Chem.MolToSmiles(cyclic)
+    finally:
+        RDLogger.EnableLog('rdApp.*')
+
+def _cyclic_oligomer(mol):
+    """Returns repeat unit closed into a ring, or None if not possible"""
+    stars = [atom for atom in mol.GetAtoms() if atom.GetAtomicNum() == 0]
+    if len(stars) != 2 or any(star.GetDegree() != 1 for star in stars):
+        return None
+    bonds = [star.GetBonds()[0] for star in stars]
+    head, tail = [bond.GetOtherAtomIdx(star.GetIdx())
+                  for bond, star in zip(bonds, stars)]
+    if stars[0].GetIdx() in (head, tail) or stars[1].GetIdx() in (head, tail):
+        return None
+    bond_type = bonds[1].GetBondType()
+    unit = Chem.RWMol(mol)
+    for idx in sorted((star.GetIdx() for star in stars), reverse=True):
+        unit.RemoveAtom(idx)
+    # Atom indices shift down once for every star removed before them
+    shift = lambda idx: idx - sum(star.GetIdx() < idx for star in stars)
+    head, tail = shift(head), shift(tail)
+    n = unit.GetNumAtoms()
+    copies = 3 if head == tail else 2
+    cyclic = Chem.RWMol(unit)
+    for i in range(1, copies):
+        cyclic = Chem.RWMol(Chem.CombineMols(cyclic, unit))
+    for i in range(copies):
+        cyclic.AddBond(tail + i * n, head + ((i + 1) % copies) * n, bond_type)
+    try:
+        Chem.SanitizeMol(cyclic)
+    except Exception:
+        return None
+    return cyclic
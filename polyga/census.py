@@ -0,0 +1,355 @@
+"""Where PolyNations save each generation of their populations.
+
+The census is append-only: every generation, each nation writes one batch of
+polymers. SQLiteCensus writes rows of the polymer table (see polyga.models),
+with fingerprints and properties as json, in WAL mode so analyses can read
+a running planet without blocking it. Each nation's generation is committed
+with a census_log row marking it complete. ShardedSQLiteCensus does the same,
+but each nation (or land) writes to its own database, so writers never wait
+on each other's locks. ParquetCensus writes one Parquet
+file per nation and generation, with properties as typed columns and bit
+fingerprints as a fixed-size binary column, for fast columnar analysis. It
+needs pyarrow.
+
+Example:
+    planet = PolyPlanet('Planet_Silly', ..., census_backend='parquet')
+"""
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from polyga.models import CensusLog, Polymer
+
+CENSUS_BACKENDS = ['sqlite', 'sharded', 'parquet']
+SHARD_KEYS = ['nation', 'land']
+
+def make_census(backend: str, save_folder: str, shard_by: str = 'nation'):
+    """Returns census of backend saving in save_folder"""
+    if backend == 'sqlite':
+        return SQLiteCensus(save_folder)
+    elif backend == 'sharded':
+        return ShardedSQLiteCensus(save_folder, shard_by)
+    elif backend == 'parquet':
+        return ParquetCensus(save_folder)
+    raise ValueError("Choose a valid census backend. {} invalid.".format(
+        backend))
+
+def fingerprint_rows(fingerprints, chunk_size: int = 10000):
+    """Yields rows of a FingerprintStore as lists.
+
+    Rows are unpacked chunk_size at a time so the census never holds a
+    dense copy of every fingerprint.
+    """
+    for start in range(0, len(fingerprints), chunk_size):
+        yield from fingerprints.to_dense(
+                slice(start, start + chunk_size)).tolist()
+
+
+class SQLiteCensus:
+    """Census kept in planetary_database.sqlite of the planet's folder.
+
+    Attributes:
+
+        name (str):
+            File name of the database.
+
+        database (str):
+            Path of the database.
+
+        session (sqlalchemy.orm.Session):
+            Open session. Not pickled, reopened by connect.
+    """
+    def __init__(self, save_folder: str,
+                 name: str = 'planetary_database.sqlite'):
+        self.name = name
+        self.connect(save_folder)
+
+    def connect(self, save_folder: str):
+        """Opens database in save_folder, creating table and indexes"""
+        self.database = os.path.join(save_folder, self.name)
+        engine = create_engine(f"sqlite:///{self.database}")
+        # Readers never block the writer, or the writer readers. The 
+        # journal mode is saved in the database.
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        # Resumed planets already have the tables, but maybe not indexes
+        for table in [Polymer.__table__, CensusLog.__table__]:
+            table.create(engine, checkfirst=True)
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
+        Session = sessionmaker()
+        Session.configure(bind=engine)
+        self.session = Session()
+
+    def write(self, nation, population, chunk_size: int = 10000):
+        """Saves population of nation"""
+        # Can't add lists to database and don't want to save fitness or
+        # immigration location
+        birthplaces = population.birthplaces
+        fp_headers = population.fp_headers
+        columns = zip(population.planetary_id.tolist(),
+                population.parent_1_id.tolist(),
+                population.parent_2_id.tolist(),
+                population.is_parent.tolist(),
+                population.num_chromosomes.tolist(),
+                population.smiles.tolist(),
+                population.birthplace.tolist(),
+                population.generation.tolist(),
+                fingerprint_rows(population.fingerprints, chunk_size),
+                zip(*[values.tolist() for values in
+                      population.properties.values()])
+                if len(population.properties) != 0
+                else [()] * len(population),
+                range(len(population))
+                )
+        prop_names = list(population.properties.keys())
+        for (planetary_id, parent_1_id, parent_2_id, is_parent,
+             num_chromosomes, smiles, birthplace, generation, fingerprint,
+             properties, i) in columns:
+            birth_planet, birth_land, birth_nation = birthplaces[birthplace]
+            polymer = Polymer(planetary_id=planetary_id,
+                    parent_1_id=parent_1_id,
+                    parent_2_id=parent_2_id,
+                    is_parent=is_parent,
+                    num_chromosomes = num_chromosomes,
+                    smiles_string = smiles,
+                    birth_land = birth_land,
+                    birth_nation = birth_nation,
+                    birth_planet = birth_planet,
+                    str_chromosome_ids = str(population.chromosome_ids(i)),
+                    generation = generation,
+                    settled_planet = nation.land.planet.name,
+                    settled_land = nation.land.name,
+                    settled_nation = nation.name,
+                    fingerprint = dict(zip(fp_headers, fingerprint)),
+                    properties = dict(zip(prop_names, properties)))
+            self.session.add(polymer)
+        # Committed with the polymers, so readers never see one without
+        # the other
+        self.session.add(CensusLog(settled_planet=nation.land.planet.name,
+                settled_land=nation.land.name,
+                settled_nation=nation.name,
+                generation=nation.generation,
+                num_polymers=len(population),
+                written_at=time.time()))
+        self.session.commit()
+
+    def commit(self):
+        self.session.commit()
+
+    def close(self):
+        self.session.close()
+
+    def rollback(self, planet: str, generations: dict):
+        """Deletes census of generations nations have not reached.
+
+        Args:
+            planet (str):
+                Name of the planet.
+
+            generations (dict):
+                Keys are nation names, values the first generation deleted.
+        """
+        conn = sqlite3.connect(self.database)
+        with conn:
+            for nation, generation in generations.items():
+                for table in ['polymer', 'census_log']:
+                    conn.execute("DELETE FROM {} WHERE settled_planet = ?"
+                                 .format(table) + " AND settled_nation = ?"
+                                 + " AND generation >= ?",
+                                 (planet, nation, generation))
+        conn.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Sessions can't be pickled, connect reopens
+        del state['session']
+        return state
+
+
+class ShardedSQLiteCensus:
+    """Census kept in one SQLite database per nation or land.
+
+    Shards are shards/<nation or land>.sqlite in the planet's folder, each
+    with its own polymer table. Planetary ids are unique across shards, so
+    polyga.analysis reads the shards as one polymer table by attaching
+    them to one connection.
+
+    Attributes:
+
+        folder (str):
+            Path of the shards folder.
+
+        shard_by (str):
+            'nation' or 'land'.
+    """
+    def __init__(self, save_folder: str, shard_by: str = 'nation'):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError("Choose a valid shard key. {} invalid.".format(
+                shard_by))
+        self.shard_by = shard_by
+        self.connect(save_folder)
+
+    def connect(self, save_folder: str):
+        """Uses shards folder in save_folder. Shards open when written"""
+        self.folder = os.path.join(save_folder, 'shards')
+        os.makedirs(self.folder, exist_ok=True)
+        self.shards = {}
+
+    def write(self, nation, population, chunk_size: int = 10000):
+        """Saves population of nation in its shard"""
+        key = nation.name if self.shard_by == 'nation' else nation.land.name
+        if key not in self.shards:
+            self.shards[key] = SQLiteCensus(self.folder, key + '.sqlite')
+        self.shards[key].write(nation, population, chunk_size)
+
+    def commit(self):
+        for shard in self.shards.values():
+            shard.commit()
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+
+    def rollback(self, planet: str, generations: dict):
+        """Deletes census of generations nations have not reached.
+
+        Args:
+            planet (str):
+                Name of the planet.
+
+            generations (dict):
+                Keys are nation names, values the first generation deleted.
+        """
+        for name in os.listdir(self.folder):
+            if name.endswith('.sqlite'):
+                shard = SQLiteCensus.__new__(SQLiteCensus)
+                shard.database = os.path.join(self.folder, name)
+                shard.rollback(planet, generations)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Sessions can't be pickled, shards reopen when written
+        state['shards'] = {}
+        return state
+
+
+class ParquetCensus:
+    """Census kept as Parquet files in the census folder of the planet.
+
+    Files are hive partitioned, census/settled_nation=<nation>/
+    generation=<generation>/part-0.parquet, so readers can skip nations and
+    generations by path (see polyga.analysis.load_census). Each file has
+    polyga's columns, chromosome_ids as a list column, one typed column per
+    property and per non-binary fingerprint, and bit fingerprints packed
+    into a fixed-size binary column, fingerprint_bits. Names of the bit
+    and non-binary fingerprints are saved in the file's metadata.
+
+    Attributes:
+
+        folder (str):
+            Path of the census folder.
+    """
+    def __init__(self, save_folder: str):
+        # Fail when the planet is made, not at its first census
+        _import_pyarrow()
+        self.connect(save_folder)
+
+    def connect(self, save_folder: str):
+        """Uses census folder in save_folder"""
+        self.folder = os.path.join(save_folder, 'census')
+        os.makedirs(self.folder, exist_ok=True)
+
+    def write(self, nation, population, chunk_size: int = 10000):
+        """Saves population of nation"""
+        pa, pq = _import_pyarrow()
+        birthplaces = population.birthplaces
+        generation = int(population.generation[0]) if len(population) else (
+                nation.generation)
+        columns = {
+                   'planetary_id': pa.array(population.planetary_id),
+                   'parent_1_id': pa.array(population.parent_1_id),
+                   'parent_2_id': pa.array(population.parent_2_id),
+                   'is_parent': pa.array(population.is_parent),
+                   'num_chromosomes': pa.array(population.num_chromosomes),
+                   'smiles_string': pa.array(population.smiles.tolist(),
+                                             type=pa.string()),
+                   'birth_planet': pa.array(birthplaces.decode(
+                       population.birthplace, 0).tolist(), type=pa.string()),
+                   'birth_land': pa.array(birthplaces.decode(
+                       population.birthplace, 1).tolist(), type=pa.string()),
+                   'birth_nation': pa.array(birthplaces.decode(
+                       population.birthplace, 2).tolist(), type=pa.string()),
+                   'chromosome_ids': pa.ListArray.from_arrays(
+                       pa.array(population.offsets.astype(np.int32)),
+                       pa.array(population.chromosomes)),
+                   'settled_planet': pa.array([nation.land.planet.name]
+                       * len(population), type=pa.string()),
+                   'settled_land': pa.array([nation.land.name]
+                       * len(population), type=pa.string()),
+                  }
+        for prop, values in population.properties.items():
+            columns[prop] = pa.array(values.tolist() if values.dtype == object
+                                     else np.asarray(values))
+        fingerprints = population.fingerprints
+        for i, col in enumerate(fingerprints.dense_headers):
+            columns[col] = pa.array(np.asarray(fingerprints.dense[:, i]))
+        width = fingerprints.bits.shape[1] * 8
+        if width != 0:
+            bits = np.ascontiguousarray(fingerprints.bits)
+            columns['fingerprint_bits'] = pa.Array.from_buffers(
+                    pa.binary(width), len(bits), [None, pa.py_buffer(bits)])
+        table = pa.table(columns).replace_schema_metadata({
+            'polyga_fp_headers': json.dumps(fingerprints.headers),
+            'polyga_bit_headers': json.dumps(fingerprints.bit_headers),
+            'polyga_dense_headers': json.dumps(fingerprints.dense_headers),
+            })
+        folder = os.path.join(self.folder,
+                              'settled_nation={}'.format(nation.name),
+                              'generation={}'.format(generation))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, 'part-0.parquet')
+        # Readers never see a partial file
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def rollback(self, planet: str, generations: dict):
+        """Deletes census of generations nations have not reached.
+
+        Args:
+            planet (str):
+                Name of the planet. Unused, the folder is the planet's.
+
+            generations (dict):
+                Keys are nation names, values the first generation deleted.
+        """
+        for nation, first in generations.items():
+            folder = os.path.join(self.folder,
+                                  'settled_nation={}'.format(nation))
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if int(name.split('=')[1]) >= first:
+                    shutil.rmtree(os.path.join(folder, name))
+
+def _import_pyarrow():
+    """Returns pyarrow and pyarrow.parquet, raising ImportError if missing"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("The parquet census backend needs pyarrow. "
+                          + "Install it with pip install pyarrow.")
+    return pyarrow, pyarrow.parquet
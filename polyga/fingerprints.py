@@ -0,0 +1,588 @@
+"""Fingerprinting, fingerprint storage, and similarity kernels.
+
+Fingerprints are mostly bits, so FingerprintStore packs binary columns 64 to
+a uint64 word and keeps the few non-binary columns (e.g., counts) as a small
+dense matrix. Similarities are computed with popcounts on the packed words.
+
+Fingerprinter is a ready made fingerprint_function for PolyPlanet that
+fingerprints a whole population with RDKit into one preallocated array.
+"""
+from typing import List
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from rdkit import Chem, DataStructs, RDLogger
+from rdkit.Chem import MACCSkeys, rdFingerprintGenerator
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words: np.ndarray) -> np.ndarray:
+        """Returns number of set bits in each row of packed words"""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)],
+                               dtype=np.uint8)
+
+    def popcount(words: np.ndarray) -> np.ndarray:
+        """Returns number of set bits in each row of packed words"""
+        words = np.ascontiguousarray(words)
+        return _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=-1,
+                                                         dtype=np.int64)
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """Packs (n, num_bits) 0/1 matrix into (n, ceil(num_bits/64)) uint64"""
+    bits = np.asarray(bits)
+    n, num_bits = bits.shape
+    num_words = (num_bits + 63) // 64
+    packed = np.zeros((n, num_words * 8), dtype=np.uint8)
+    packed[:, :(num_bits + 7) // 8] = np.packbits(bits.astype(bool), axis=1,
+                                                  bitorder='little')
+    return packed.view(np.uint64)
+
+def unpack_bits(words: np.ndarray, num_bits: int) -> np.ndarray:
+    """Unpacks uint64 words into (n, num_bits) uint8 0/1 matrix"""
+    words = np.ascontiguousarray(words)
+    return np.unpackbits(words.view(np.uint8), axis=1, count=num_bits,
+                         bitorder='little')
+
+def to_memmap(array: np.ndarray, path: str,
+              chunk_size: int = 10000) -> np.ndarray:
+    """Copies array into a memory-mapped .npy file, chunk_size rows at a time.
+
+    Returns the memory map, or array itself if it is empty (empty files
+    can't be mapped) or has object dtype.
+    """
+    if array.size == 0 or array.dtype == object:
+        return array
+    memmap = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype,
+                                       shape=array.shape)
+    for start in range(0, len(array), chunk_size):
+        memmap[start:start + chunk_size] = array[start:start + chunk_size]
+    memmap.flush()
+    return memmap
+
+def tanimoto(query: np.ndarray, words: np.ndarray) -> np.ndarray:
+    """Returns Tanimoto similarity of packed query row to each packed row.
+
+    nan where both fingerprints are empty.
+    """
+    common = popcount(words & query)
+    union = popcount(query) + popcount(words) - common
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union != 0, common / union, np.nan)
+
+def dice(query: np.ndarray, words: np.ndarray) -> np.ndarray:
+    """Returns Dice similarity of packed query row to each packed row.
+
+    nan where both fingerprints are empty.
+    """
+    common = popcount(words & query)
+    total = popcount(query) + popcount(words)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total != 0, 2 * common / total, np.nan)
+
+def hamming(query: np.ndarray, words: np.ndarray) -> np.ndarray:
+    """Returns Hamming distance of packed query row to each packed row"""
+    return popcount(words ^ query)
+
+
+class FingerprintStore:
+    """Fingerprints of a population, one row per polymer.
+
+    Binary columns are bit-packed, the rest are kept dense. Rows are in the
+    same order as the population's planetary ids.
+
+    Attributes:
+
+        headers (list):
+            Fingerprint column names in original order.
+
+        bit_headers (list):
+            Names of binary columns, in packed bit order.
+
+        bits (np.ndarray):
+            (n, num_words) uint64 packed binary columns.
+
+        dense_headers (list):
+            Names of non-binary columns.
+
+        dense (np.ndarray):
+            (n, len(dense_headers)) non-binary columns.
+    """
+    def __init__(self, headers: list, bit_headers: list, bits: np.ndarray,
+                 dense_headers: list, dense: np.ndarray):
+        self.headers = list(headers)
+        self.bit_headers = list(bit_headers)
+        self.bits = bits
+        self.dense_headers = list(dense_headers)
+        self.dense = dense
+
+    @classmethod
+    def empty(cls, n: int = 0) -> 'FingerprintStore':
+        """Returns store of n polymers without fingerprints"""
+        return cls([], [], np.zeros((n, 0), dtype=np.uint64), [],
+                   np.zeros((n, 0)))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, headers: list) -> 'FingerprintStore':
+        """Returns store of fingerprint columns of a dataframe"""
+        headers = list(headers)
+        bit_headers = []
+        dense_headers = []
+        for col in headers:
+            values = df[col].to_numpy()
+            if (values.dtype != object
+                and np.all((values == 0) | (values == 1))):
+                bit_headers.append(col)
+            else:
+                dense_headers.append(col)
+        bits = pack_bits(df[bit_headers].to_numpy()) if bit_headers else (
+               np.zeros((len(df), 0), dtype=np.uint64))
+        dense = df[dense_headers].to_numpy() if dense_headers else (
+                np.zeros((len(df), 0)))
+        return cls(headers, bit_headers, bits, dense_headers, dense)
+
+    @classmethod
+    def from_matrix(cls, matrix, headers: list,
+                    chunk_size: int = 10000) -> 'FingerprintStore':
+        """Returns store of (n, len(headers)) fingerprint matrix.
+
+        Args:
+            matrix (np.ndarray or scipy.sparse matrix):
+                Fingerprints, one row per polymer.
+
+            headers (list):
+                Column names of matrix.
+
+            chunk_size (int):
+                Rows of a sparse matrix made dense at once while packing.
+        """
+        if not sparse.issparse(matrix):
+            matrix = np.asarray(matrix)
+            binary = np.all((matrix == 0) | (matrix == 1), axis=0)
+            return cls(headers, [col for col, b in zip(headers, binary) if b],
+                       pack_bits(matrix[:, binary]),
+                       [col for col, b in zip(headers, binary) if not b],
+                       matrix[:, ~binary])
+        matrix = sparse.csr_matrix(matrix)
+        binary = np.ones(matrix.shape[1], dtype=bool)
+        binary[matrix.indices[(matrix.data != 0) & (matrix.data != 1)]] = False
+        bit_cols = np.flatnonzero(binary)
+        num_words = (len(bit_cols) + 63) // 64
+        bits = np.zeros((matrix.shape[0], num_words), dtype=np.uint64)
+        for start in range(0, matrix.shape[0], chunk_size):
+            chunk = matrix[start:start + chunk_size][:, bit_cols]
+            bits[start:start + chunk_size] = pack_bits(chunk.toarray())
+        return cls(headers, [col for col, b in zip(headers, binary) if b],
+                   bits, [col for col, b in zip(headers, binary) if not b],
+                   matrix[:, np.flatnonzero(~binary)].toarray())
+
+    @classmethod
+    def concat(cls, stores: List['FingerprintStore']) -> 'FingerprintStore':
+        """Returns stores joined one after another.
+
+        Columns missing from a store are filled with 0.
+        """
+        headers = []
+        for store in stores:
+            headers.extend([col for col in store.headers if col not in headers])
+        bit_headers = []
+        dense_headers = []
+        for col in headers:
+            if all(col in store.bit_headers or col not in store.headers
+                   for store in stores):
+                bit_headers.append(col)
+            else:
+                dense_headers.append(col)
+        if all(store.bit_headers == bit_headers for store in stores):
+            bits = np.concatenate([store.bits for store in stores])
+        else:
+            bits = pack_bits(np.concatenate([store.columns(bit_headers)
+                                             for store in stores]))
+        dense = np.concatenate([store.columns(dense_headers)
+                                for store in stores])
+        if len(dense_headers) == 0:
+            dense = np.zeros((len(bits), 0))
+        return cls(headers, bit_headers, bits, dense_headers, dense)
+
+    def __len__(self):
+        return len(self.bits)
+
+    @property
+    def shape(self) -> tuple:
+        """(number of polymers, number of fingerprint columns)"""
+        return (len(self), len(self.headers))
+
+    def columns(self, headers: list, rows=None) -> np.ndarray:
+        """Returns dense matrix of columns. Missing columns are 0.
+
+        Args:
+            headers (list):
+                Columns to return, in order.
+
+            rows (np.ndarray):
+                Rows to return. Default all rows.
+        """
+        bits = self.bits if rows is None else self.bits[rows]
+        dense = self.dense if rows is None else self.dense[rows]
+        dtype = np.result_type(np.uint8, dense.dtype) if len(
+                self.dense_headers) != 0 else np.uint8
+        matrix = np.zeros((len(bits), len(headers)), dtype=dtype)
+        bit_positions = {col: k for k, col in enumerate(self.bit_headers)}
+        dense_positions = {col: k for k, col in enumerate(self.dense_headers)}
+        from_bits = [(i, bit_positions[col]) for i, col in enumerate(headers)
+                     if col in bit_positions]
+        from_dense = [(i, dense_positions[col]) for i, col in
+                      enumerate(headers) if col in dense_positions]
+        if len(from_bits) != 0:
+            to, source = zip(*from_bits)
+            unpacked = unpack_bits(bits, len(self.bit_headers))
+            matrix[:, list(to)] = unpacked[:, list(source)]
+        if len(from_dense) != 0:
+            to, source = zip(*from_dense)
+            matrix[:, list(to)] = dense[:, list(source)]
+        return matrix
+
+    def to_dense(self, rows=None) -> np.ndarray:
+        """Returns dense matrix of all columns in header order"""
+        return self.columns(self.headers, rows)
+
+    def to_frame(self, rows=None) -> pd.DataFrame:
+        """Returns dataframe with one column per fingerprint"""
+        bits = self.bits if rows is None else self.bits[rows]
+        dense = self.dense if rows is None else self.dense[rows]
+        df = pd.concat([pd.DataFrame(unpack_bits(bits, len(self.bit_headers)),
+                                     columns=self.bit_headers),
+                        pd.DataFrame(dense, columns=self.dense_headers)],
+                       axis=1)
+        return df[self.headers]
+
+    def take(self, positions) -> 'FingerprintStore':
+        """Returns store of rows at positions"""
+        return FingerprintStore(self.headers, self.bit_headers,
+                                self.bits[positions], self.dense_headers,
+                                self.dense[positions])
+
+    def to_memmap(self, folder: str, chunk_size: int = 10000):
+        """Moves bits and dense columns to memory-mapped files in folder"""
+        self.bits = to_memmap(self.bits, os.path.join(folder, 'bits.npy'),
+                              chunk_size)
+        self.dense = to_memmap(self.dense, os.path.join(folder, 'dense.npy'),
+                               chunk_size)
+
+    def drop_zero_columns(self, chunk_size: int = 10000):
+        """Drops columns that are 0 for every polymer.
+
+        Kept bits are repacked chunk_size rows at a time.
+        """
+        any_set = unpack_bits(np.bitwise_or.reduce(self.bits, axis=0)[None],
+                              len(self.bit_headers))[0]
+        zero_bits = [col for col, nonzero in zip(self.bit_headers, any_set)
+                     if not nonzero]
+        zero_dense = [col for col, zero in zip(self.dense_headers,
+                      np.all(self.dense == 0, axis=0)) if zero]
+        if len(zero_bits) != 0:
+            keep = [col for col in self.bit_headers if col not in zero_bits]
+            self.bits = np.concatenate([np.zeros((0, (len(keep) + 63) // 64),
+                                                 dtype=np.uint64)]
+                    + [pack_bits(self.columns(keep, slice(start,
+                                                          start + chunk_size)))
+                       for start in range(0, len(self), chunk_size)])
+            self.bit_headers = keep
+        if len(zero_dense) != 0:
+            keep = [i for i, col in enumerate(self.dense_headers)
+                    if col not in zero_dense]
+            self.dense = self.dense[:, keep]
+            self.dense_headers = [self.dense_headers[i] for i in keep]
+        dropped = set(zero_bits) | set(zero_dense)
+        self.headers = [col for col in self.headers if col not in dropped]
+
+    def __parts(self, i, rows):
+        """Returns packed and dense parts of row i and of rows"""
+        if rows is None:
+            rows = np.arange(len(self))
+        return self.bits[i], self.bits[rows], self.dense[i], self.dense[rows]
+
+    def tanimoto(self, i: int, rows=None) -> np.ndarray:
+        """Returns Tanimoto similarity of row i to rows.
+
+        Non-binary columns use the continuous form x.y/(x.x + y.y - x.y).
+        nan where the denominator is 0.
+        """
+        query, words, dense_query, dense = self.__parts(i, rows)
+        dense = dense.astype(np.float64)
+        dense_query = dense_query.astype(np.float64)
+        dots = popcount(words & query) + dense @ dense_query
+        denominators = (popcount(query) + dense_query @ dense_query
+                        + popcount(words) + np.einsum('ij,ij->i', dense, dense)
+                        - dots)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(denominators != 0, dots / denominators, np.nan)
+
+    def dice(self, i: int, rows=None) -> np.ndarray:
+        """Returns Dice similarity of row i to rows. nan if both empty."""
+        query, words, dense_query, dense = self.__parts(i, rows)
+        dense = dense.astype(np.float64)
+        dense_query = dense_query.astype(np.float64)
+        dots = popcount(words & query) + dense @ dense_query
+        totals = (popcount(query) + dense_query @ dense_query
+                  + popcount(words) + np.einsum('ij,ij->i', dense, dense))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(totals != 0, 2 * dots / totals, np.nan)
+
+    def hamming(self, i: int, rows=None) -> np.ndarray:
+        """Returns Hamming distance of row i to rows.
+
+        Non-binary columns add their absolute difference.
+        """
+        query, words, dense_query, dense = self.__parts(i, rows)
+        return (popcount(words ^ query)
+                + np.abs(dense - dense_query).sum(axis=1))
+
+
+def minibatch_kmeans(store: FingerprintStore, num_clusters: int, rng,
+                     batch_size: int = 1024, num_iterations: int = 30,
+                     chunk_size: int = 4096) -> (np.ndarray, np.ndarray):
+    """Clusters fingerprints with mini-batch k-means.
+
+    Only one batch of fingerprints is unpacked at a time, so the cost is 
+    O(n k) per pass over the store and memory stays small.
+
+    Args:
+        store (FingerprintStore):
+            Fingerprints to cluster.
+
+        num_clusters (int):
+            Number of clusters. Reduced to len(store) if larger.
+
+        rng (np.random.Generator):
+            Random number generator used for initial centers and batches.
+
+        batch_size (int):
+            Fingerprints per center update.
+
+        num_iterations (int):
+            Number of center updates.
+
+        chunk_size (int):
+            Fingerprints unpacked at once when assigning clusters.
+
+    Returns:
+        labels (np.ndarray):
+            Cluster of each fingerprint.
+
+        centers (np.ndarray):
+            (num_clusters, num_fingerprints) cluster centers.
+    """
+    n = len(store)
+    num_clusters = min(num_clusters, n)
+    if num_clusters <= 1 or store.shape[1] == 0:
+        return (np.zeros(n, dtype=np.int64),
+                store.to_dense(np.arange(min(n, 1))).astype(np.float32))
+    centers = store.to_dense(np.sort(rng.choice(n, num_clusters,
+                                                replace=False)))
+    centers = centers.astype(np.float32)
+    counts = np.zeros(num_clusters)
+    for _ in range(num_iterations):
+        rows = np.sort(rng.choice(n, min(batch_size, n), replace=False))
+        batch = store.to_dense(rows).astype(np.float32)
+        labels = _nearest(batch, centers)
+        for k in np.unique(labels):
+            members = batch[labels == k]
+            counts[k] += len(members)
+            # Each member moves its center by 1/count, as in Sculley (2010)
+            rate = len(members) / counts[k]
+            centers[k] += rate * (members.mean(axis=0) - centers[k])
+    labels = np.concatenate([
+        _nearest(store.to_dense(slice(start, start + chunk_size)).astype(
+            np.float32), centers) for start in range(0, n, chunk_size)])
+    return labels, centers
+
+def _nearest(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Returns index of nearest (euclidean) center of each point"""
+    distances = ((centers ** 2).sum(axis=1)[None] 
+                 - 2 * points @ centers.T)
+    return np.argmin(distances, axis=1)
+
+
+FINGERPRINT_KINDS = ['morgan', 'rdkit', 'maccs']
+# MACCS keys have a fixed length
+MACCS_NUM_BITS = 167
+
+def smiles_to_mol(smiles: str, ladder_symbols: str = 'etdg'):
+    """Returns RDKit molecule of polymer smiles. None if it can't be parsed.
+
+    Ladder polymer connection symbols (e.g., [e] or a bare e) are replaced by
+    stars first. Symbols that are part of an element, like the e of [Se], 
+    are left alone.
+    """
+    if not isinstance(smiles, str) or smiles == '':
+        return None
+    if ladder_symbols:
+        pattern = r'\[([{0}])\]|(?<![A-Za-z])[{0}](?![a-z])'.format(
+                re.escape(ladder_symbols))
+        smiles = re.sub(pattern, '[*]', smiles)
+    return Chem.MolFromSmiles(smiles)
+
+def num_fingerprint_bits(kind: str, num_bits: int) -> int:
+    """Returns length of fingerprint kind"""
+    return MACCS_NUM_BITS if kind == 'maccs' else num_bits
+
+def fingerprint_smiles(smiles: list, kind: str = 'morgan', radius: int = 2,
+                       num_bits: int = 2048, counts: bool = False,
+                       packed: bool = False, ladder_symbols: str = 'etdg'
+                       ) -> (np.ndarray, np.ndarray):
+    """Fingerprints smiles strings into one preallocated array.
+
+    Args:
+        smiles (list):
+            Smiles strings of polymers.
+
+        kind (str):
+            'morgan', 'rdkit' (path based), or 'maccs'. Default 'morgan'.
+
+        radius (int):
+            Radius of morgan fingerprints. Default 2.
+
+        num_bits (int):
+            Length of morgan and rdkit fingerprints. Default 2048.
+
+        counts (bool):
+            If true, fingerprints count how often each bit is hit. Not 
+            available for 'maccs'. Default False.
+
+        packed (bool):
+            If true, bits are returned packed 64 to a uint64 word (see 
+            pack_bits). Not available with counts. Default False.
+
+        ladder_symbols (str):
+            Characters used as ladder polymer connection points. See 
+            smiles_to_mol. Default 'etdg'.
+
+    Returns:
+        fingerprints (np.ndarray):
+            (len(smiles), num_bits) uint8 bits or uint32 counts, or 
+            (len(smiles), num_words) uint64 if packed. Rows of failed 
+            smiles are 0.
+
+        failures (np.ndarray):
+            Indices of smiles that could not be fingerprinted.
+    """
+    if kind not in FINGERPRINT_KINDS:
+        raise ValueError("Choose a valid fingerprint kind. {} invalid.".format(
+            kind))
+    if counts and kind == 'maccs':
+        raise ValueError("Count fingerprints are not available for maccs.")
+    if counts and packed:
+        raise ValueError("Count fingerprints can't be packed.")
+    length = num_fingerprint_bits(kind, num_bits)
+    if kind == 'morgan':
+        generator = rdFingerprintGenerator.GetMorganGenerator(radius=radius,
+                fpSize=length)
+    elif kind == 'rdkit':
+        generator = rdFingerprintGenerator.GetRDKitFPGenerator(fpSize=length)
+    if counts:
+        fingerprints = np.zeros((len(smiles), length), dtype=np.uint32)
+    else:
+        # Bits are written straight into packed rows
+        num_words = (length + 63) // 64
+        fingerprints = np.zeros((len(smiles), num_words), dtype=np.uint64)
+        rows = fingerprints.view(np.uint8)
+    failures = []
+    RDLogger.DisableLog('rdApp.*')
+    try:
+        for i, smi in enumerate(smiles):
+            try:
+                m = smiles_to_mol(smi, ladder_symbols)
+                if m is None:
+                    failures.append(i)
+                    continue
+                if counts:
+                    hits = generator.GetCountFingerprint(m).GetNonzeroElements()
+                    fingerprints[i, list(hits.keys())] = list(hits.values())
+                    continue
+                if kind == 'maccs':
+                    fp = MACCSkeys.GenMACCSKeys(m)
+                else:
+                    fp = generator.GetFingerprint(m)
+                text = DataStructs.BitVectToBinaryText(fp)
+                rows[i, :len(text)] = np.frombuffer(text, dtype=np.uint8)
+            except Exception:
+                failures.append(i)
+                fingerprints[i] = 0
+    finally:
+        RDLogger.EnableLog('rdApp.*')
+    if not counts and not packed:
+        fingerprints = unpack_bits(fingerprints, length)
+    return fingerprints, np.array(failures, dtype=np.int64)
+
+
+class Fingerprinter:
+    """RDKit fingerprint_function for PolyPlanet.
+
+    Polymers that can't be fingerprinted are logged with their planetary ids
+    and left out, so they die like any other failed fingerprint. Each of the
+    planet's workers fingerprints its share of the population.
+
+    Example:
+        planet = PolyPlanet('Planet', predict_function=predict,
+                            fingerprint_function=Fingerprinter('morgan'),
+                            fingerprint_protocol='matrix')
+
+    Attributes:
+
+        kind, radius, num_bits, counts, ladder_symbols:
+            See fingerprint_smiles.
+
+        protocol (str):
+            Must match the planet's fingerprint_protocol. 'matrix' returns
+            (planetary_ids, matrix, fp_headers). 'dataframe' returns 
+            (df, fp_headers) with one column per bit.
+
+        prefix (str):
+            Prefix of fingerprint headers.
+    """
+    def __init__(self, kind: str = 'morgan', radius: int = 2,
+                 num_bits: int = 2048, counts: bool = False,
+                 ladder_symbols: str = 'etdg', protocol: str = 'matrix',
+                 prefix: str = 'fp_'):
+        if kind not in FINGERPRINT_KINDS:
+            raise ValueError("Choose a valid fingerprint kind. {} invalid.".format(
+                kind))
+        if protocol not in ['matrix', 'dataframe']:
+            raise ValueError("Choose a valid fingerprint protocol. {} invalid.".format(
+                protocol))
+        self.kind = kind
+        self.radius = radius
+        self.num_bits = num_bits
+        self.counts = counts
+        self.ladder_symbols = ladder_symbols
+        self.protocol = protocol
+        self.prefix = prefix
+
+    @property
+    def fp_headers(self) -> list:
+        """Column names of fingerprints"""
+        return [self.prefix + str(i) for i in 
+                range(num_fingerprint_bits(self.kind, self.num_bits))]
+
+    def __call__(self, df: pd.DataFrame):
+        fingerprints, failures = fingerprint_smiles(
+                df['smiles_string'].tolist(), self.kind, self.radius, 
+                self.num_bits, self.counts, ladder_symbols=self.ladder_symbols)
+        keep = np.ones(len(df), dtype=bool)
+        keep[failures] = False
+        if len(failures) != 0:
+            logging.warning("Failed to fingerprint {} polymers with planetary "
+                    "ids {}".format(len(failures), 
+                    df['planetary_id'].values[failures].tolist()))
+            fingerprints = fingerprints[keep]
+        fp_headers = self.fp_headers
+        if self.protocol == 'matrix':
+            return df['planetary_id'].values[keep], fingerprints, fp_headers
+        fp_df = pd.DataFrame(fingerprints, columns=fp_headers)
+        df = pd.concat([df.loc[keep].reset_index(drop=True), fp_df], axis=1)
+        return df, fp_headers
@@ -0,0 +1,281 @@
+"""Building blocks for fitness functions.
+
+Each class here is a fitness function that can be passed straight to
+PolyLand(fitness_function=...). Properties are read from the population
+dataframe once as a (num_polymers, num_properties) matrix and scored in a
+single numpy pass, so no per-polymer python loops or scalers are needed.
+
+Example:
+    fitness_function = WeightedSum({'Polymer_Coolness': 1/3,
+                                    'Polymer_Intelligence': 1/3,
+                                    'Polymer_Funnyness': 1/3})
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+SCALINGS = ['minmax', 'zscore', 'none']
+
+def scale(values: np.ndarray, scaling: str = 'minmax') -> np.ndarray:
+    """Scales each column of values.
+
+    Args:
+        values (np.ndarray):
+            (n, k) matrix of property values.
+
+        scaling (str):
+            'minmax' scales columns to [0, 1], 'zscore' to zero mean and
+            unit standard deviation, and 'none' leaves them alone. Constant
+            columns become 0. Default 'minmax'.
+
+    Returns (np.ndarray):
+        Scaled (n, k) matrix.
+    """
+    if scaling not in SCALINGS:
+        raise ValueError("Choose a valid scaling. {} invalid.".format(scaling))
+    values = np.asarray(values, dtype=np.float64)
+    if scaling == 'none' or len(values) == 0:
+        return values
+    if scaling == 'minmax':
+        shift = np.nanmin(values, axis=0)
+        spread = np.nanmax(values, axis=0) - shift
+    else:
+        shift = np.nanmean(values, axis=0)
+        spread = np.nanstd(values, axis=0)
+    spread = np.where(spread == 0, np.inf, spread)
+    return (values - shift) / spread
+
+def target_distance(values: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Returns absolute distance of each column from its target"""
+    return np.abs(np.asarray(values, dtype=np.float64) - targets)
+
+def range_distance(values: np.ndarray, lows: np.ndarray,
+                   highs: np.ndarray) -> np.ndarray:
+    """Returns distance of each column outside of [low, high]. 0 inside."""
+    values = np.asarray(values, dtype=np.float64)
+    return np.maximum(lows - values, 0) + np.maximum(values - highs, 0)
+
+def desirability(values: np.ndarray, lows: np.ndarray, highs: np.ndarray,
+                 goals: List[str], targets: np.ndarray = None,
+                 shape: float = 1.0) -> np.ndarray:
+    """Returns Derringer desirability of each column, between 0 and 1.
+
+    Args:
+        values (np.ndarray):
+            (n, k) matrix of property values.
+
+        lows, highs (np.ndarray):
+            Values below low (above high) are entirely undesirable when
+            maximizing (minimizing).
+
+        goals (list):
+            'max', 'min', or 'target' for each column.
+
+        targets (np.ndarray):
+            Most desirable value of 'target' columns.
+
+        shape (float):
+            Exponent of the desirability curve. Above 1 favors values near
+            the goal, below 1 is more lenient. Default 1.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+    goals = np.asarray(goals)
+    if targets is None:
+        targets = (lows + highs) / 2
+    targets = np.asarray(targets, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rising = (values - lows) / (np.where(goals == 'target', targets,
+                                             highs) - lows)
+        falling = (highs - values) / (highs - np.where(goals == 'target',
+                                                       targets, lows))
+    d = np.where(goals == 'max', rising,
+                 np.where(goals == 'min', falling,
+                          np.where(values <= targets, rising, falling)))
+    return np.clip(d, 0, 1) ** shape
+
+
+class Penalty:
+    """Lowers fitness of polymers with a property outside [low, high].
+
+    Attributes:
+
+        prop (str):
+            Property name.
+
+        low, high (float):
+            Allowed range. None means unbounded.
+
+        weight (float):
+            Fitness lost per unit the property is outside the range.
+
+        hard (bool):
+            If true, polymers outside the range get a fitness of -inf.
+    """
+    def __init__(self, prop: str, low: float = None, high: float = None,
+                 weight: float = 1.0, hard: bool = False):
+        self.prop = prop
+        self.low = -np.inf if low is None else low
+        self.high = np.inf if high is None else high
+        self.weight = weight
+        self.hard = hard
+
+    def __call__(self, df: pd.DataFrame) -> np.ndarray:
+        """Returns fitness to subtract from each polymer"""
+        distance = range_distance(df[self.prop].to_numpy(), self.low,
+                                  self.high)
+        if self.hard:
+            return np.where(distance > 0, np.inf, 0.0)
+        return self.weight * distance
+
+
+class FitnessFunction:
+    """Base of the fitness functions in this module.
+
+    Subclasses implement score, which returns the fitness of each polymer
+    before penalties.
+    """
+    def __init__(self, penalties: List[Penalty] = None):
+        self.penalties = penalties if penalties is not None else []
+
+    def __call__(self, df: pd.DataFrame, fp_headers: list) -> pd.DataFrame:
+        fitness = self.score(df)
+        for penalty in self.penalties:
+            fitness = fitness - penalty(df)
+        df['fitness'] = fitness
+        return df
+
+    def score(self, df: pd.DataFrame) -> np.ndarray:
+        raise NotImplementedError
+
+    @staticmethod
+    def _matrix(df: pd.DataFrame, properties: list) -> np.ndarray:
+        """Returns (n, k) float matrix of properties"""
+        return df[list(properties)].to_numpy(dtype=np.float64)
+
+
+class WeightedSum(FitnessFunction):
+    """Fitness is the weighted sum of scaled property scores.
+
+    Properties are maximized unless listed in minimize, targets, or ranges.
+    Targeted properties score the negative distance from their target and
+    ranged properties the negative distance outside their range. Scores are
+    then scaled column by column before weighting.
+
+    Attributes:
+
+        weights (dict):
+            Keys are property names, values their weight.
+
+        scaling (str):
+            'minmax', 'zscore', or 'none'. See scale.
+
+        minimize (list):
+            Properties where lower is better.
+
+        targets (dict):
+            Keys are property names, values the best value.
+
+        ranges (dict):
+            Keys are property names, values (low, high) of the best values.
+
+        penalties (list):
+            Penalty objects applied after the sum.
+    """
+    def __init__(self, weights: Dict[str, float], scaling: str = 'minmax',
+                 minimize: list = None, targets: Dict[str, float] = None,
+                 ranges: Dict[str, tuple] = None,
+                 penalties: List[Penalty] = None):
+        super().__init__(penalties)
+        if scaling not in SCALINGS:
+            raise ValueError("Choose a valid scaling. {} invalid.".format(
+                scaling))
+        self.weights = dict(weights)
+        self.scaling = scaling
+        self.minimize = list(minimize) if minimize is not None else []
+        self.targets = dict(targets) if targets is not None else {}
+        self.ranges = dict(ranges) if ranges is not None else {}
+        properties = list(self.weights)
+        self.__sign = np.array([-1.0 if prop in self.minimize else 1.0
+                                for prop in properties])
+        self.__targeted = np.array([prop in self.targets for prop in
+                                    properties])
+        self.__target_values = np.array([self.targets.get(prop, 0.0) for
+                                         prop in properties])
+        self.__ranged = np.array([prop in self.ranges for prop in properties])
+        self.__lows = np.array([self.ranges.get(prop, (0, 0))[0] for prop in
+                                properties], dtype=np.float64)
+        self.__highs = np.array([self.ranges.get(prop, (0, 0))[1] for prop in
+                                 properties], dtype=np.float64)
+
+    def score(self, df: pd.DataFrame) -> np.ndarray:
+        values = self._matrix(df, self.weights.keys())
+        scores = values * self.__sign
+        scores = np.where(self.__targeted,
+                          -target_distance(values, self.__target_values),
+                          scores)
+        scores = np.where(self.__ranged,
+                          -range_distance(values, self.__lows, self.__highs),
+                          scores)
+        return scale(scores, self.scaling) @ np.array(
+                list(self.weights.values()), dtype=np.float64)
+
+
+class Desirability(FitnessFunction):
+    """Fitness is the weighted geometric mean of property desirabilities.
+
+    A polymer with any entirely undesirable property has fitness 0, so
+    unlike a weighted sum one great property can't make up for a bad one.
+
+    Attributes:
+
+        limits (dict):
+            Keys are property names, values (low, high). See desirability.
+
+        goals (dict):
+            Keys are property names, values 'max', 'min', or 'target'.
+            Default 'max'.
+
+        targets (dict):
+            Best value of 'target' properties. Default middle of limits.
+
+        weights (dict):
+            Weight of each property in the geometric mean. Default 1.
+
+        shape (float):
+            Exponent of the desirability curves.
+
+        penalties (list):
+            Penalty objects applied after the mean.
+    """
+    def __init__(self, limits: Dict[str, tuple], goals: Dict[str, str] = None,
+                 targets: Dict[str, float] = None,
+                 weights: Dict[str, float] = None, shape: float = 1.0,
+                 penalties: List[Penalty] = None):
+        super().__init__(penalties)
+        self.limits = dict(limits)
+        self.goals = dict(goals) if goals is not None else {}
+        for prop, goal in self.goals.items():
+            if goal not in ['max', 'min', 'target']:
+                raise ValueError("Choose a valid goal. {} invalid.".format(
+                    goal))
+        self.targets = dict(targets) if targets is not None else {}
+        self.weights = dict(weights) if weights is not None else {}
+        self.shape = shape
+
+    def score(self, df: pd.DataFrame) -> np.ndarray:
+        properties = list(self.limits)
+        values = self._matrix(df, properties)
+        lows = np.array([self.limits[prop][0] for prop in properties])
+        highs = np.array([self.limits[prop][1] for prop in properties])
+        targets = np.array([self.targets.get(prop, (low + high) / 2) for
+                            prop, low, high in zip(properties, lows, highs)])
+        d = desirability(values, lows, highs,
+                         [self.goals.get(prop, 'max') for prop in properties],
+                         targets, self.shape)
+        weights = np.array([self.weights.get(prop, 1.0) for prop in
+                            properties])
+        with np.errstate(divide='ignore'):
+            return np.exp(np.log(d) @ weights / weights.sum())
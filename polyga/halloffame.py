@@ -0,0 +1,173 @@
+"""Best polymers a planet has seen, kept up to date while it runs.
+
+HallOfFame keeps a bounded archive of the top polymers for the fitness of
+each land and for each score passed to the planet. Archives are min-heaps,
+so a generation only looks at polymers beating the worst one kept, and
+polymers are unique by canonical repeat unit (see polyga.canonical). The
+archives are saved to the hall_of_fame table every generation. Read them
+with polyga.analysis.load_hall_of_fame.
+
+Example:
+    planet = PolyPlanet('Planet_Silly', ..., hall_of_fame_size=100,
+                        hall_of_fame_scores={'cool': 'Polymer_Coolness'})
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from polyga.canonical import polymer_key
+from polyga.models import HallOfFameEntry
+
+COLUMNS = ['archive', 'rank', 'score', 'planetary_id', 'smiles_string',
+           'canonical_key', 'generation', 'settled_land', 'settled_nation']
+
+
+class HallOfFame:
+    """Top polymers of each fitness function and score.
+
+    Attributes:
+
+        size (int):
+            Most polymers kept in each archive.
+
+        scores (dict):
+            Keys are names of user archives, values a property name or a
+            function taking the population dataframe and returning one
+            score per polymer. Higher scores are better.
+
+        archives (dict):
+            Keys are archive names, 'fitness:<land>' for the fitness of a
+            land, values dicts of canonical key to entry. An entry is a
+            dict with the keys of COLUMNS except archive and rank.
+    """
+    def __init__(self, size: int = 100, scores: dict = None):
+        self.size = size
+        self.scores = dict(scores) if scores is not None else {}
+        self.archives = {}
+        self.__heaps = {}
+
+    def update(self, nation, population):
+        """Offers scored population of nation to every archive"""
+        if self.size < 1 or len(population) == 0:
+            return
+        # Canonical keys are slow, so archives share them
+        keys = {}
+        self.offer('fitness:' + nation.land.name, population.fitness,
+                   nation, population, keys)
+        df = None
+        for name, score in self.scores.items():
+            if callable(score):
+                if df is None:
+                    df = population.to_frame(fingerprints=False)
+                values = score(df)
+            elif score in population.properties:
+                values = population.properties[score]
+            else:
+                continue
+            self.offer(name, values, nation, population, keys)
+
+    def offer(self, name: str, scores: np.ndarray, nation, population,
+              keys: dict = None):
+        """Adds polymers beating the worst of archive name to it.
+
+        Args:
+            name (str):
+                Name of the archive.
+
+            scores (np.ndarray):
+                Score of each polymer of population. Polymers with a
+                non-finite score are left out.
+
+            nation (PolyNation):
+                Nation the population settled in.
+
+            population (Population):
+                Population offered.
+
+            keys (dict):
+                Canonical keys already known, by position in population.
+                Keys found are added to it.
+        """
+        if keys is None:
+            keys = {}
+        archive = self.archives.setdefault(name, {})
+        heap = self.__heaps.setdefault(name, [])
+        scores = np.asarray(scores, dtype=np.float64)
+        candidates = np.flatnonzero(np.isfinite(scores))
+        if len(archive) >= self.size:
+            candidates = candidates[scores[candidates] > heap[0][0]]
+        candidates = candidates[np.argsort(-scores[candidates],
+                                           kind='stable')]
+        for i in candidates:
+            score = float(scores[i])
+            if len(archive) >= self.size and score <= heap[0][0]:
+                # Sorted, so no later polymer gets in either
+                break
+            if i not in keys:
+                keys[i] = polymer_key(population.smiles[i])
+            key = keys[i]
+            if key in archive:
+                if score <= archive[key]['score']:
+                    continue
+                # The old heap item is skipped once it reaches the top
+            elif len(archive) >= self.size:
+                worst = heapq.heappop(heap)
+                del archive[worst[2]]
+            archive[key] = {
+                            'score': score,
+                            'planetary_id': int(population.planetary_id[i]),
+                            'smiles_string': population.smiles[i],
+                            'canonical_key': key,
+                            'generation': nation.generation,
+                            'settled_land': nation.land.name,
+                            'settled_nation': nation.name,
+                           }
+            # Of equal scores, the newest polymer is worst
+            heapq.heappush(heap, (score, -archive[key]['planetary_id'], key))
+            self.__prune(name)
+
+    def __prune(self, name: str):
+        """Drops heap items of replaced entries off the top of the heap"""
+        archive = self.archives[name]
+        heap = self.__heaps[name]
+        while heap and (heap[0][2] not in archive
+                        or archive[heap[0][2]]['score'] != heap[0][0]
+                        or archive[heap[0][2]]['planetary_id']
+                        != -heap[0][1]):
+            heapq.heappop(heap)
+        if len(heap) > 2 * self.size:
+            self.__heaps[name] = [(entry['score'], -entry['planetary_id'],
+                                   key) for key, entry in archive.items()]
+            heapq.heapify(self.__heaps[name])
+
+    def to_frame(self, name: str = None) -> pd.DataFrame:
+        """Returns archives, best first, as a dataframe.
+
+        Args:
+            name (str):
+                Archive to return. Default None, meaning all.
+        """
+        rows = []
+        for archive, entries in self.archives.items():
+            if name is not None and archive != name:
+                continue
+            ranked = sorted(entries.values(), key=lambda entry:
+                            (-entry['score'], entry['planetary_id']))
+            for rank, entry in enumerate(ranked):
+                rows.append(dict(entry, archive=archive, rank=rank))
+        return pd.DataFrame(rows, columns=COLUMNS)
+
+    def save(self, database: str):
+        """Replaces hall_of_fame table of database with the archives"""
+        engine = create_engine(f"sqlite:///{database}")
+        table = HallOfFameEntry.__table__
+        table.create(engine, checkfirst=True)
+        rows = self.to_frame().to_dict('records')
+        # One transaction, so readers never see a half saved hall of fame
+        with engine.begin() as conn:
+            conn.execute(table.delete())
+            if len(rows) != 0:
+                conn.execute(table.insert(), rows)
+        engine.dispose()
@@ -0,0 +1,177 @@
+"""Memory accounting of the generation loop.
+
+MemoryMonitor records, for each phase of each nation, the resident set size
+(RSS) of the process before and after the phase, its peak, and optionally
+the python allocations tracemalloc saw. If the planet has a memory budget,
+phases that end near it are logged and the planet is asked to relieve the
+pressure (smaller chunks, populations spilled to memory-mapped files).
+"""
+from contextlib import contextmanager
+from time import time
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+def current_rss() -> int:
+    """Returns resident set size of this process in bytes.
+
+    Falls back to the peak resident set size where /proc is unavailable.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+def peak_rss() -> int:
+    """Returns peak resident set size of this process in bytes.
+
+    0 where the platform doesn't report it.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def parse_size(size) -> int:
+    """Returns number of bytes in size, e.g., 2**30, '512MB', or '4 GB'"""
+    if size is None or isinstance(size, (int, float)):
+        return size
+    units = {'B': 1, 'KB': 2**10, 'MB': 2**20, 'GB': 2**30, 'TB': 2**40}
+    text = size.strip().upper()
+    for unit in sorted(units, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * units[unit])
+    return int(float(text))
+
+
+class MemoryMonitor:
+    """Records memory used by each phase of the generation loop.
+
+    Attributes:
+
+        budget (int):
+            Planet wide memory budget in bytes. None means no budget.
+
+        pressure (float):
+            Fraction of the budget above which memory is under pressure.
+
+        trace (bool):
+            If true, tracemalloc measures python allocations of each phase.
+            Slows the run down, so off by default.
+
+        records (list):
+            One dict per phase with keys nation, generation, phase,
+            seconds, rss_start, rss_end, rss_peak, allocated, allocated_peak
+            and under_pressure. Sizes are in bytes. allocated and
+            allocated_peak are None unless trace is true.
+    """
+    def __init__(self, budget=None, pressure: float = 0.9,
+                 trace: bool = False):
+        self.budget = parse_size(budget)
+        self.pressure = pressure
+        self.trace = trace
+        self.records = []
+        self.relief = []
+
+    def on_pressure(self, relieve: callable):
+        """Registers relieve(record), called when a phase ends under pressure"""
+        self.relief.append(relieve)
+
+    def under_pressure(self, rss: int = None) -> bool:
+        """Returns true if rss (default current RSS) is near the budget"""
+        if self.budget is None:
+            return False
+        if rss is None:
+            rss = current_rss()
+        return rss >= self.pressure * self.budget
+
+    @contextmanager
+    def phase(self, nation: str, generation: int, name: str):
+        """Context manager that records memory used by a phase.
+
+        Args:
+            nation (str):
+                Name of the nation running the phase.
+
+            generation (int):
+                Generation of the nation.
+
+            name (str):
+                Name of the phase, e.g., 'selection'.
+        """
+        tracing = self.trace and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.trace:
+            # Before python 3.9 the peak can't be reset, so like the RSS
+            # peak it only tells us about this phase if the phase raised it
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            allocated_start, allocated_peak_start = (
+                    tracemalloc.get_traced_memory())
+        rss_start = current_rss()
+        peak_start = peak_rss()
+        st = time()
+        try:
+            yield
+        finally:
+            rss_end = current_rss()
+            peak_end = peak_rss()
+            record = {
+                      'nation': nation,
+                      'generation': generation,
+                      'phase': name,
+                      'seconds': time() - st,
+                      'rss_start': rss_start,
+                      'rss_end': rss_end,
+                      # The process peak only tells us about this phase if
+                      # the phase raised it
+                      'rss_peak': max(rss_start, rss_end, peak_end
+                                      if peak_end > peak_start else 0),
+                      'allocated': None,
+                      'allocated_peak': None,
+                     }
+            if self.trace:
+                allocated, allocated_peak = tracemalloc.get_traced_memory()
+                if allocated_peak <= allocated_peak_start:
+                    allocated_peak = max(allocated_start, allocated)
+                record['allocated'] = allocated - allocated_start
+                record['allocated_peak'] = allocated_peak - allocated_start
+            if tracing:
+                tracemalloc.stop()
+            record['under_pressure'] = self.under_pressure(record['rss_peak'])
+            self.records.append(record)
+            if record['under_pressure']:
+                self.__relieve(record)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns records as a dataframe"""
+        return pd.DataFrame(self.records, columns=['nation', 'generation',
+                'phase', 'seconds', 'rss_start', 'rss_end', 'rss_peak',
+                'allocated', 'allocated_peak', 'under_pressure'])
+
+    def summary(self) -> pd.DataFrame:
+        """Returns highest peak RSS and total seconds of each phase"""
+        return self.to_frame().groupby('phase').agg(
+                rss_peak=('rss_peak', 'max'), seconds=('seconds', 'sum'))
+
+    def __relieve(self, record):
+        logging.warning('Memory pressure: {} phase of {} peaked at {} MB, '
+                        'budget is {} MB.'.format(record['phase'],
+                            record['nation'], record['rss_peak'] // 2**20,
+                            self.budget // 2**20))
+        gc.collect()
+        for relieve in self.relief:
+            relieve(record)
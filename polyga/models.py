@@ -1,4 +1,4 @@
-from sqlalchemy import Column
+from sqlalchemy import Column, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.types import Integer, Text, String, JSON, Boolean, Float
 
@@ -7,18 +7,24 @@ Base = declarative_base()
 class Polymer(Base):
     """Defines polymer"""
     __tablename__ = "polymer"
+    # Analyses read by nation and generation, and lineage queries walk 
+    # parent ids both ways
+    __table_args__ = (
+                      Index('ix_polymer_settled_nation_generation', 
+                            'settled_nation', 'generation'),
+                     )
 
     planetary_id = Column(Integer, primary_key=True, unique=True)
-    parent_1_id = Column(Integer, nullable=False)
-    parent_2_id = Column(Integer, nullable=False)
+    parent_1_id = Column(Integer, nullable=False, index=True)
+    parent_2_id = Column(Integer, nullable=False, index=True)
     is_parent = Column(Boolean, nullable=False)
     num_chromosomes = Column(Integer, nullable=False)
     smiles_string = Column(String(1000), nullable=False)
     birth_land = Column(String(255), nullable=False)
-    birth_nation = Column(String(255), nullable=False)
+    birth_nation = Column(String(255), nullable=False, index=True)
     birth_planet = Column(String(255), nullable=False)
     str_chromosome_ids = Column(String(255), nullable=False)
-    generation = Column(Integer, nullable=False)
+    generation = Column(Integer, nullable=False, index=True)
     settled_planet = Column(String(255), nullable=False)
     settled_land = Column(String(255), nullable=False)
     settled_nation = Column(String(255), nullable=False)
@@ -27,3 +33,38 @@ class Polymer(Base):
 
     def __repr__(self):
         return f"{self.smiles_string}"
+
+
+class CensusLog(Base):
+    """Marks a generation of a nation as completely saved in the census"""
+    __tablename__ = "census_log"
+
+    id = Column(Integer, primary_key=True)
+    settled_planet = Column(String(255), nullable=False)
+    settled_land = Column(String(255), nullable=False)
+    settled_nation = Column(String(255), nullable=False)
+    generation = Column(Integer, nullable=False)
+    num_polymers = Column(Integer, nullable=False)
+    written_at = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return f"{self.settled_nation} generation {self.generation}"
+
+
+class HallOfFameEntry(Base):
+    """Polymer in an archive of the hall of fame (see polyga.halloffame)"""
+    __tablename__ = "hall_of_fame"
+
+    id = Column(Integer, primary_key=True)
+    archive = Column(String(255), nullable=False, index=True)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    planetary_id = Column(Integer, nullable=False)
+    smiles_string = Column(String(1000), nullable=False)
+    canonical_key = Column(String(1000), nullable=False)
+    generation = Column(Integer, nullable=False)
+    settled_land = Column(String(255), nullable=False)
+    settled_nation = Column(String(255), nullable=False)
+
+    def __repr__(self):
+        return f"{self.archive} {self.rank}: {self.smiles_string}"
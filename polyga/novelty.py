@@ -0,0 +1,172 @@
+"""Planet-wide record of every polymer that has ever been born.
+
+The novelty index lets nations check, at birth time, whether a child has
+already existed anywhere on the planet so duplicate polymers do not take up
+population slots or property evaluations.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+
+import numpy as np
+
+from polyga.analysis import connect, str_to_list
+from polyga.canonical import chromosome_key, polymer_key
+
+class BloomFilter:
+    """Fixed-memory probabilistic set of strings.
+
+    False positives happen at roughly ``error_rate`` once ``capacity`` keys
+    have been added. False negatives never happen.
+
+    Attributes:
+
+        capacity (int):
+            Number of keys the filter is sized for.
+
+        error_rate (float):
+            Target false positive rate at capacity.
+
+        num_bits (int):
+            Size of the bit array.
+
+        num_hashes (int):
+            Number of bit positions set per key.
+    """
+    def __init__(self, capacity: int = 10**7, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(
+            self.num_bits / capacity * math.log(2))))
+        self.bits = np.zeros(int(math.ceil(self.num_bits / 8)), dtype=np.uint8)
+        self.count = 0
+
+    def __contains__(self, key: str) -> bool:
+        positions = self.__positions(key)
+        return bool(np.all(
+            self.bits[positions >> 3] & (1 << (positions & 7)).astype(np.uint8)
+            ))
+
+    def __len__(self):
+        return self.count
+
+    def add(self, key: str):
+        """Adds key to the filter"""
+        positions = self.__positions(key)
+        np.bitwise_or.at(self.bits, positions >> 3,
+                (1 << (positions & 7)).astype(np.uint8))
+        self.count += 1
+
+    def __positions(self, key):
+        """Returns bit positions of key using double hashing"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return np.array([(h1 + i * h2) % self.num_bits
+                         for i in range(self.num_hashes)], dtype=np.int64)
+
+
+class NoveltyIndex:
+    """Index of the smiles strings and chromosome sequences already born.
+
+    Attributes:
+
+        kind (str):
+            'set' keeps every key exactly in a python set. 'bloom' keeps keys
+            in a BloomFilter with bounded memory and a small false positive
+            rate.
+
+        retries (int):
+            Number of times a duplicate child is re-bred before it is
+            accepted anyway.
+    """
+    def __init__(self, kind: str = 'set', retries: int = 5,
+                 capacity: int = 10**7, error_rate: float = 0.001):
+        """Initialize novelty index.
+
+        Args:
+
+            kind (str):
+                'set' or 'bloom'. Default 'set'.
+
+            retries (int):
+                Number of times a duplicate child is re-bred before it is
+                accepted anyway. Default 5.
+
+            capacity (int):
+                Expected number of polymers. Only used by 'bloom'.
+
+            error_rate (float):
+                False positive rate at capacity. Only used by 'bloom'.
+        """
+        if kind == 'set':
+            self.keys = set()
+        elif kind == 'bloom':
+            self.keys = BloomFilter(capacity, error_rate)
+        else:
+            raise ValueError("Choose a valid novelty index. {} invalid.".format(
+                kind))
+        self.kind = kind
+        self.retries = retries
+
+    def __len__(self):
+        return len(self.keys)
+
+    def cleared(self) -> 'NoveltyIndex':
+        """Returns index with the same settings and no polymers"""
+        if self.kind == 'bloom':
+            return NoveltyIndex('bloom', self.retries, self.keys.capacity,
+                                self.keys.error_rate)
+        return NoveltyIndex(self.kind, self.retries)
+
+    def add(self, smiles: str, chromosome_ids: list):
+        """Records polymer as born"""
+        self.keys.add(self.chromosome_key(chromosome_ids))
+        if smiles:
+            self.keys.add(self.smiles_key(smiles))
+
+    def has_chromosomes(self, chromosome_ids: list) -> bool:
+        """Returns True if chromosome sequence already born"""
+        return self.chromosome_key(chromosome_ids) in self.keys
+
+    def has_smiles(self, smiles: str) -> bool:
+        """Returns True if smiles already born"""
+        return self.smiles_key(smiles) in self.keys
+
+    def rehydrate(self, database: str, batch_size: int = 100000):
+        """Adds every polymer stored in a planetary database to the index.
+
+        Args:
+
+            database (str):
+                Path to planetary_database.sqlite, or to a planet folder,
+                which may have a sharded census.
+
+            batch_size (int):
+                Number of rows read from the database at once.
+        """
+        if os.path.isdir(database):
+            conn = connect(database)
+        else:
+            conn = sqlite3.connect(database)
+        cursor = conn.execute(
+            "SELECT smiles_string, str_chromosome_ids FROM polymer")
+        rows = cursor.fetchmany(batch_size)
+        while rows:
+            for smiles, str_chromosome_ids in rows:
+                self.add(smiles, str_to_list(str_chromosome_ids))
+            rows = cursor.fetchmany(batch_size)
+        conn.close()
+
+    @staticmethod
+    def chromosome_key(chromosome_ids: list) -> str:
+        """Returns key of chromosome sequence up to rotation and reversal"""
+        return 'c:' + '-'.join(str(x) for x in chromosome_key(chromosome_ids))
+
+    @staticmethod
+    def smiles_key(smiles: str) -> str:
+        """Returns key of repeat unit smiles. See polyga.canonical."""
+        return 's:' + polymer_key(smiles)
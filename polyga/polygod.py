@@ -3,22 +3,31 @@ from typing import Dict, Union
 import os
 import sys
 import gc
+import shutil
+import tempfile
 from time import time
 import sqlite3
 import math
+import pickle
+from collections import deque
 from multiprocessing import Pool
 import logging
 
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from numpy.random import default_rng
 from scipy.special import comb
 
+from polyga.canonical import chromosome_key
+from polyga.census import CENSUS_BACKENDS, SHARD_KEYS, make_census
+from polyga.fingerprints import FingerprintStore, minibatch_kmeans
+from polyga.halloffame import HallOfFame
+from polyga.memory import MemoryMonitor
 from polyga.models import Polymer
+from polyga.novelty import NoveltyIndex
+from polyga.population import Birthplaces, Population, GLOBAL_COLUMNS
 from polyga.selection_schemes import elite
-from polyga.analysis import str_to_list
+from polyga.analysis import str_to_list, load_generation
 
 class PolyPlanet:
     """PolyPlanet contains the PolyLands and PolyNations of the world. 
@@ -58,7 +67,11 @@ class PolyPlanet:
             properties.
 
         emigration_list (list):  
-            Stores emigration information for a generation.
+            Stores emigration information for a generation. List of 
+            (Population, immigration locations) pairs.
+
+        birthplaces (Birthplaces):  
+            Codes of the planet, land, and nation polymers were born in.
 
         num_nations (int):  
             Number of nations on the planet.
@@ -80,6 +93,36 @@ class PolyPlanet:
             Number of cpus to use when fingerprinting and predicting 
             properties. If number on computer exceeded, number set to
             number on computer. Default is one.
+
+        novelty (NoveltyIndex):  
+            Index of every polymer born on the planet. None if children
+            may repeat polymers that already existed.
+
+        callback_contract (str):  
+            How population dataframes are shared with fitness functions and
+            selection schemes. See __init__.
+
+        fingerprint_protocol (str):  
+            What fingerprint_function returns and predict_function is 
+            passed. See __init__.
+
+        chunk_size (int):  
+            Number of polymers streamed through workers at once when 
+            generating random initial populations or fingerprinting. Halved under memory 
+            pressure.
+
+        memory (MemoryMonitor):  
+            Peak memory of each phase of each nation. See polyga.memory.
+
+        checkpoint_interval (int):  
+            Number of ages between checkpoints. 0 means never.
+
+        census (SQLiteCensus or ParquetCensus):  
+            Where nations save each generation. See polyga.census.
+
+        hall_of_fame (HallOfFame):  
+            Best polymers seen so far by fitness of each land and by each
+            hall of fame score. See polyga.halloffame.
     """
     def __init__(self, name: str,
                  predict_function: callable,
@@ -89,7 +132,20 @@ class PolyPlanet:
                  random_seed : int = 0,
                  path_to_dna : str = None,
                  save_folder: str = None,
-                 species: str = 'polymers'):
+                 species: str = 'polymers',
+                 novelty_index: str = None,
+                 novelty_retries: int = 5,
+                 novelty_capacity: int = 10**7,
+                 callback_contract: str = 'copy',
+                 fingerprint_protocol: str = 'dataframe',
+                 chunk_size: int = 10000,
+                 memory_budget: Union[int, str] = None,
+                 trace_memory: bool = False,
+                 checkpoint_interval: int = 0,
+                 census_backend: str = 'sqlite',
+                 census_shard_by: str = 'nation',
+                 hall_of_fame_size: int = 0,
+                 hall_of_fame_scores: Dict[str, Union[str, callable]] = None):
         """Initialize planet
           
         Args:
@@ -131,19 +187,123 @@ class PolyPlanet:
 
             species (str):  
                 Name of predominant species on the planet. Default is polymers.
+
+            novelty_index (str):  
+                Index used to stop polymers that already existed anywhere on
+                the planet from being born again. 'set' stores every smiles
+                and chromosome sequence exactly, 'bloom' uses a bloom filter
+                of bounded memory. Default None, meaning no index is used.
+
+            novelty_retries (int):  
+                Number of times a duplicate child is re-bred (re-mutated) 
+                before it is born anyway. Default 5.
+
+            novelty_capacity (int):  
+                Expected number of polymers on the planet. Sizes the bloom
+                filter. Default 10**7.
+
+            callback_contract (str):  
+                'copy' means fitness functions and selection schemes are
+                passed their own copy of the population dataframe and may 
+                change it freely. 'readonly' means they promise not to change
+                the values they are passed: fingerprint columns are shared
+                read-only with the population instead of copied, and only
+                columns they add (and fitness) are merged back. 'validate' is
+                'readonly' plus a check, for debugging, that raises a 
+                ValueError if a returned dataframe changed passed values. 
+                Default 'copy'.
+
+            fingerprint_protocol (str):  
+                'dataframe' means fingerprint_function(df) returns 
+                (df, fp_headers) with one column per fingerprint and 
+                predict_function(df, fp_headers, models) returns df with 
+                properties attached. 'matrix' means fingerprint_function(df)
+                returns (planetary_ids, matrix, fp_headers), where matrix is
+                a numpy array or scipy.sparse matrix with one row per 
+                planetary id (polymers left out failed fingerprinting), and
+                predict_function(df, matrix, fp_headers, models) is passed
+                the matrix directly, with df rows in the order of the matrix
+                rows, and returns df with properties attached. 
+                Default 'dataframe'.
+
+            chunk_size (int):  
+                Number of polymers streamed through workers at once when 
+                generating random initial populations or fingerprinting with
+                more than one cpu. Bounds the memory 
+                used on top of the population itself. Default 10000.
+
+            memory_budget (int or str):  
+                Planet wide memory budget in bytes, or a string like '8GB'.
+                When a phase ends above 90% of the budget, the phase is 
+                logged, chunk_size is halved, and every nation moves its 
+                population to memory-mapped storage. Default None, meaning
+                no budget.
+
+            trace_memory (bool):  
+                If true, python allocations of each phase are measured with
+                tracemalloc as well as the resident set size. Slows the run
+                down. Default False.
+
+            checkpoint_interval (int):  
+                If above 0, the planet is checkpointed to checkpoint.pkl in
+                its save folder every checkpoint_interval ages, once its 
+                polymers are scored. See checkpoint and resume. Default 0.
+
+            census_backend (str):  
+                'sqlite' saves the census in planetary_database.sqlite. 
+                'sharded' saves each nation's (or land's) census in its own
+                database in the shards folder, so nations don't share a 
+                writer lock. polyga.analysis reads the shards as one 
+                database. 'parquet' saves one Parquet file per nation and generation
+                in the census folder, read with analysis.load_census. Needs
+                pyarrow. See polyga.census. Default 'sqlite'.
+
+            census_shard_by (str):  
+                'nation' or 'land', what gets its own database when 
+                census_backend is 'sharded'. Default 'nation'.
+
+            hall_of_fame_size (int):  
+                Number of polymers kept in each archive of the hall of 
+                fame, which is saved to the hall_of_fame table every 
+                generation (hall_of_fame.sqlite unless census_backend is 
+                'sqlite'). Default 0, meaning no hall of fame is kept.
+
+            hall_of_fame_scores (dict):  
+                Archives kept besides the fitness of each land. Keys are 
+                archive names, values a property name or a function taking 
+                the population dataframe and returning one score per 
+                polymer. Higher scores are better. Default None.
         """
+        if callback_contract not in ['copy', 'readonly', 'validate']:
+            raise ValueError("Choose a valid callback contract. {} invalid.".format(
+                    callback_contract))
+        if fingerprint_protocol not in ['dataframe', 'matrix']:
+            raise ValueError("Choose a valid fingerprint protocol. {} invalid.".format(
+                    fingerprint_protocol))
+        if census_backend not in CENSUS_BACKENDS:
+            raise ValueError("Choose a valid census backend. {} invalid.".format(
+                    census_backend))
+        if census_shard_by not in SHARD_KEYS:
+            raise ValueError("Choose a valid census shard key. {} invalid.".format(
+                    census_shard_by))
+        self.callback_contract = callback_contract
+        self.fingerprint_protocol = fingerprint_protocol
         self.species = species
-        self.global_cols = ['planetary_id', 'parent_1_id', 
-                'parent_2_id', 'is_parent', 'num_chromosomes', 'smiles_string',
-                'land', 'nation', 'planet', 'str_chromosome_ids', 'generation',
-                'birth_planet', 'birth_land', 'birth_nation', 'chromosome_ids',
-                'fitness', 'immigration_loc']
+        self.global_cols = list(GLOBAL_COLUMNS)
+        self.birthplaces = Birthplaces()
         self.name = name
         self.predict_function = predict_function
         self.fingerprint_function = fingerprint_function
         self.models = models
         self.age = 0
         self.num_cpus = num_cpus
+        self.chunk_size = chunk_size
+        self.checkpoint_interval = checkpoint_interval
+        # True between scoring and breeding, so a planet resumed from a 
+        # checkpoint doesn't score its polymers again
+        self.scored = False
+        self.memory = MemoryMonitor(memory_budget, trace=trace_memory)
+        self.memory.on_pressure(self.relieve_memory)
         cores_on_comp = os.cpu_count()
         if self.num_cpus > cores_on_comp:
             self.num_cpus = cores_on_comp
@@ -164,6 +324,11 @@ class PolyPlanet:
             self.rng = default_rng(seed=random_seed)
         else:
             self.rng = default_rng()
+        if novelty_index is not None:
+            self.novelty = NoveltyIndex(novelty_index, novelty_retries, 
+                    novelty_capacity)
+        else:
+            self.novelty = None
 
         if path_to_dna == None:
             path_to_dna = os.path.join(
@@ -186,7 +351,11 @@ class PolyPlanet:
 
         self.database = os.path.join(self.save_folder, 
                                      'planetary_database.sqlite')
-        self.__initialize_database()
+        self.census_backend = census_backend
+        self.census_shard_by = census_shard_by
+        self.census = make_census(census_backend, self.save_folder,
+                                  census_shard_by)
+        self.hall_of_fame = HallOfFame(hall_of_fame_size, hall_of_fame_scores)
         
 
     def add(self, land: 'PolyLand'):
@@ -210,36 +379,156 @@ class PolyPlanet:
         """
         if narrate:
             logging.info("Age of planet {}: {}".format(self.name, self.age))
-        self.age += 1
-        for land in self.lands:
-            land.score_and_emigrate(narrate)
+        if not self.scored:
+            self.age += 1
+            for land in self.lands:
+                land.score_and_emigrate(narrate)
+            self.scored = True
+            if (self.checkpoint_interval > 0 
+                and self.age % self.checkpoint_interval == 0):
+                self.checkpoint()
         if len(self.emigration_list) != 0:
-            self.immigrate()        
+            with self.memory.phase(self.name, self.age, 'immigration'):
+                self.immigrate()        
             # Clear emigration list
             self.emigration_list = []
         for land in self.lands:
             land.propagate_nations(take_census, narrate)
+        if take_census and self.hall_of_fame.size > 0:
+            self.hall_of_fame.save(self.hall_of_fame_database)
+        self.scored = False
         gc.collect()
 
+    def checkpoint(self, path: str = None, novelty: bool = True):
+        """Saves everything needed to resume the planet.
+
+        Ages, ids, random generators, populations with their fingerprints 
+        and pending emigrants are pickled, so fingerprint, predict, fitness,
+        generative, and selection functions must be picklable (e.g., 
+        defined at the top level of a module). The file is written next to 
+        path and then moved over it, so a crash never leaves a partial 
+        checkpoint.
+
+        Args:  
+            path (str):  
+                File to save to. Default checkpoint.pkl in save folder.
+
+            novelty (bool):  
+                If false, the novelty index is left out of the checkpoint,
+                which keeps it small, and resume rebuilds it from the 
+                census. Not supported by the parquet census. Default True.
+        """
+        if path is None:
+            path = os.path.join(self.save_folder, 'checkpoint.pkl')
+        index = self.novelty
+        if not novelty and index is not None:
+            if self.census_backend == 'parquet':
+                raise ValueError("Choose a sqlite census to rebuild the "
+                        + "novelty index from. {} invalid.".format(
+                            self.census_backend))
+            self.novelty = index.cleared()
+        self.census.commit()
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            self.novelty = index
+        os.replace(tmp, path)
+        logging.info("Planet {} checkpointed at age {}.".format(self.name,
+                                                                self.age))
+
+    @classmethod
+    def resume(cls, path: str) -> 'PolyPlanet':
+        """Returns planet saved by checkpoint.
+
+        Census rows taken after the checkpoint are deleted, since the 
+        resumed planet takes them again. A novelty index left out of the
+        checkpoint is rebuilt from the census and the living populations.
+        If the planet was checkpointed 
+        after scoring, the next advance_time continues from immigration 
+        without fingerprinting or predicting again.
+
+        Args:  
+            path (str):  
+                Checkpoint file, or save folder containing checkpoint.pkl.
+                The planet's database is expected next to the checkpoint.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, 'checkpoint.pkl')
+        with open(path, 'rb') as f:
+            planet = pickle.load(f)
+        planet.save_folder = os.path.dirname(os.path.abspath(path))
+        planet.database = os.path.join(planet.save_folder, 
+                                       'planetary_database.sqlite')
+        planet.census.connect(planet.save_folder)
+        planet.census.rollback(planet.name, {nation.name: nation.generation 
+                                             for land in planet.lands 
+                                             for nation in land.nations})
+        if planet.novelty is not None and len(planet.novelty) == 0:
+            planet.novelty.rehydrate(planet.save_folder)
+            # Children born since the last census aren't in it yet
+            populations = [nation.population for land in planet.lands 
+                           for nation in land.nations]
+            populations += [emigrants for emigrants, locs in 
+                            planet.emigration_list]
+            for population in populations:
+                for i in range(len(population)):
+                    planet.novelty.add(population.smiles[i],
+                                       population.chromosome_ids(i))
+        logging.info("Planet {} resumed at age {}.".format(planet.name,
+                                                           planet.age))
+        return planet
+
+    @property
+    def hall_of_fame_database(self) -> str:
+        """Database the hall of fame is saved in"""
+        if self.census_backend == 'sqlite':
+            return self.database
+        return os.path.join(self.save_folder, 'hall_of_fame.sqlite')
+
+    @property
+    def session(self):
+        """Session of the sqlite census"""
+        return self.census.session
+
+    def relieve_memory(self, record: dict):
+        """Lowers memory use after a phase ended near the memory budget.
+
+        Args:  
+            record (dict):  
+                MemoryMonitor record of the phase.
+        """
+        self.chunk_size = max(100, self.chunk_size // 2)
+        for land in self.lands:
+            for nation in land.nations:
+                if nation.storage != 'memmap':
+                    logging.warning('Moving {} to memory-mapped storage.'.format(
+                            nation.name))
+                    nation.storage = 'memmap'
+        logging.warning('Chunk size lowered to {}.'.format(self.chunk_size))
+
     def complete_run(self):
         """Close database connection"""
-        self.session.close()
+        self.census.close()
         logging.info("Planet {} passes into oblivion...".format(self.name))
 
     def immigrate(self):
         """Immigrates polymers in emigration list"""
-        df = pd.DataFrame()
-        for emigration_df in self.emigration_list:
-            df = df.append(emigration_df)
-        df = df.fillna(0) 
+        migrants = Population.concat([emigrants for emigrants, locs in 
+                                      self.emigration_list])
+        immigration_locs = np.concatenate([np.asarray(locs, dtype=object) 
+                                   for emigrants, locs in self.emigration_list])
+        birth_nations = migrants.birth_nations()
         nation_names = []
         for land in self.lands:
             for nation in land.nations:
                 nation_names.append(nation.name)
-        immigration_locs = df['immigration_loc'].values
         for i in range(len(immigration_locs)):
             loc = immigration_locs[i]
-            birth_nation = df.iloc[i].birth_nation
+            birth_nation = birth_nations[i]
             if loc == 'random':
                 new_loc = birth_nation
                 # Don't want to immigrate back home
@@ -247,24 +536,18 @@ class PolyPlanet:
                     new_loc = self.rng.choice(nation_names,
                                               size=1,
                                               replace=False
-                                             )
+                                             )[0]
                 immigration_locs[i] = new_loc
             elif loc not in nation_names:
                 raise ValueError("Error, {} not a nation. Cannot immigrate there".format(
                        loc))
-        df['immigration_loc'] = immigration_locs
         for land in self.lands:
             for nation in land.nations:
-                old_cols = nation.population.columns
-                name = nation.name
-                temp_df = df.loc[df.immigration_loc == name]
-                if len(temp_df) != 0:
-                    nation.population = nation.population.append(
-                                                                  temp_df
-                                                                ).fillna(0)
-                    add_fp_headers = [col for col in nation.population.columns
-                            if col not in old_cols and col != 'immigration_loc']
-                    nation.fp_headers.extend(add_fp_headers)
+                positions = np.flatnonzero(immigration_locs == nation.name)
+                if len(positions) != 0:
+                    nation.population = Population.concat(
+                            [nation.population, migrants.take(positions)])
+                    nation.fp_headers = nation.population.fp_headers
 
     def random_seed(self):
         """Returns random generator seed or None if seed is 0"""
@@ -296,13 +579,12 @@ class PolyPlanet:
         self.num_citizens += 1
         return self.num_citizens
 
-    def __initialize_database(self):
-        """Initialize database."""
-        engine = create_engine(f"sqlite:///{self.database}")
-        Polymer.__table__.create(engine)
-        Session = sessionmaker()
-        Session.configure(bind=engine)
-        self.session = Session()
+    def uids(self, n: int) -> np.ndarray:
+        """Returns n contiguous unique ids for new polymers"""
+        ids = np.arange(self.num_citizens + 1, self.num_citizens + n + 1,
+                        dtype=np.int64)
+        self.num_citizens += n
+        return ids
 
 
 
@@ -366,6 +648,11 @@ class PolyLand:
             dataframe. Must return
             a list or 1d np.array thats order is in the same 
             order as the population dataframe.
+
+        fitness_fingerprints (bool):  
+            If true, fitness function is passed fingerprint columns. If 
+            false, fingerprints stay bit-packed and are not expanded into 
+            the dataframe. Default True.
     """
     def __init__(self, name: str, planet: PolyPlanet, 
                  generative_function: callable,
@@ -375,11 +662,13 @@ class PolyLand:
                  fraction_mutation: float = 0.2,
                  mutation_sigma_offset: float = 0.25,
                  fraction_mutate_additional_block: float = 0.05,
-                 generative_function_parameters: dict = {}
+                 generative_function_parameters: dict = {},
+                 fitness_fingerprints: bool = True
                  ):
         self.name = name
         self.age = 0
         self.fitness_function = fitness_function
+        self.fitness_fingerprints = fitness_fingerprints
         self.generative_function = generative_function
         self.generative_function_parameters = generative_function_parameters
         self.planet = planet
@@ -494,18 +783,36 @@ class PolyNation:
         generation (int):  
             Current generation of polymers in this nation.
 
+        population (Population):  
+            Columnar store of the polymers living in the nation. Use
+            ``population.to_frame()`` for a pandas dataframe.
+
+        fp_headers (list):  
+            Column names of the fingerprints of the population.
+
         selection_scheme (str):   
             callable representing how polymers in this nation choose
             to mate. See polyga.selection_schemes for more details.
             Default is elite.
 
+        selection_fingerprints (bool):  
+            If true, selection scheme is passed fingerprint columns. 
+            Default True.
+
         partner_selection (str):  
             str representing how parents choose their mate.
-            'diversity' means highest scoring parents choose
-            partner based on least similar tanimoto similarity
-            score. 'random' means partner chosen randomly.
+            'diversity' means parents, in the order the selection 
+            scheme returns them, choose partner based on least 
+            similar tanimoto similarity score. 'random' means partner chosen randomly.
+            'cluster' means parent fingerprints are clustered and
+            highest scoring parents choose partners from the 
+            clusters furthest from their own, which scales to
+            many more parents than 'diversity'.
             Default 'diversity'.
 
+        num_partner_clusters (int):  
+            Number of clusters used by 'cluster' partner_selection.
+
         emigration_rate (float):  
             Value between 0 and 0.5 representing the % of polymers that will
             emigrate to a new nation. Values greater than
@@ -540,6 +847,15 @@ class PolyNation:
         random_seed (int):   
             Random seed to use for nation. If 0, no
             random seed is used.
+
+        storage (str):  
+            'memory' or 'memmap'. Where fingerprints and properties of the
+            population are kept.
+
+        initial_planet (str):  
+            Optional. Planet whose database the initial population is 
+            loaded from, with its fingerprints and properties. See 
+            __init__.
     """
     def __init__(self, name: str, land: PolyLand, 
                  initial_population_file: str = None,
@@ -550,12 +866,17 @@ class PolyNation:
                  num_parents_per_family: int = 3,
                  num_children_per_family: int = 12,
                  selection_scheme: callable = elite,
+                 selection_fingerprints: bool = True,
                  partner_selection: str = 'diversity',
+                 num_partner_clusters: int = None,
                  emigration_rate: float  = 0.1,
                  emigration_selection: str = 'best_worst',
                  parent_migrant_percentage: float = 0.1,
                  immigration_pattern: dict = {},
-                 random_seed: int = 0):
+                 random_seed: int = 0,
+                 storage: str = 'memory',
+                 initial_planet: str = None,
+                 initial_planet_filters: dict = None):
         """Intialize nation.
 
         Args:
@@ -595,12 +916,27 @@ class PolyNation:
                 to mate. See polyga.selection_schemes for more details.
                 Default is elite.
 
+            selection_fingerprints (bool):  
+                If true, selection scheme is passed fingerprint columns. If
+                false, fingerprints stay bit-packed and are not expanded 
+                into the dataframe, which saves memory for schemes that 
+                only read properties, like the built-in ones. Default True.
+
             partner_selection (str):  
                 str representing how parents choose their mate.
-                'diversity' means highest scoring parents choose
-                partner based on least similar tanimoto similarity
-                score. 'random' means partner chosen randomly.
-                Default 'diversity'.
+                'diversity' means parents, in the order the selection 
+                scheme returns them, choose partner based on least 
+                similar tanimoto similarity score. 'random' means partner chosen randomly.
+                'cluster' means parent fingerprints are clustered with
+                mini-batch k-means and highest scoring parents choose
+                their partners from the clusters furthest from their own.
+                Costs O(parents * clusters) instead of the O(parents^2)
+                of 'diversity'. Default 'diversity'.
+
+            num_partner_clusters (int):  
+                Number of clusters used by 'cluster' partner_selection. 
+                Default None, meaning the square root of the number of 
+                parents, between num_parents_per_family and 256.
 
             emigration_rate (float):  
                 Value between 0 and 0.5 representing the % of polymers that will
@@ -633,11 +969,46 @@ class PolyNation:
                 summed to less than one, remaining polymers sent to random
                 locations. If location indicated that doesn't exist, error
                 is thrown.
+
+            random_seed (int):  
+                Random seed to use for nation. If 0, no random seed is used.
+
+            storage (str):  
+                'memory' keeps the population in memory. 'memmap' moves 
+                fingerprints and properties into memory-mapped files under
+                the planet's save folder once they are scored, so nations 
+                larger than memory are paged in as they are read. Files are
+                written and rewritten the planet's chunk_size polymers at a 
+                time and replaced every generation. Default 'memory'.
+
+            initial_planet (str):  
+                Optional. Full path to the folder of another planet. The 
+                initial population is loaded from its database with the 
+                stored fingerprints and properties, so the first generation
+                is not fingerprinted or predicted again. The stored 
+                fingerprints must be those this planet's fingerprint 
+                function makes. Loaded polymers have no parents in this 
+                planet. Used if initial_population and 
+                initial_population_file are None. Default None.
+
+            initial_planet_filters (dict):  
+                Keyword arguments of polyga.analysis.load_generation 
+                choosing which polymers of initial_planet are loaded, e.g.,
+                ``{'generation': 3, 'nations': ['Cool'], 'top_k': 100, 
+                'by': 'Polymer_Coolness'}``. Default None, meaning the last 
+                generation of all nations.
         """
+        if storage not in ['memory', 'memmap']:
+            raise ValueError("Choose a valid storage. {} invalid.".format(
+                    storage))
         self.name = name
         self.land = land
         self.selection_scheme = selection_scheme
+        self.selection_fingerprints = selection_fingerprints
         self.partner_selection = partner_selection
+        self.num_partner_clusters = num_partner_clusters
+        self.storage = storage
+        self.memmap_folder = None
         self.land.add(self)
         self.random_seed = random_seed
         # set random seed
@@ -676,16 +1047,26 @@ class PolyNation:
                 for key in self.immigration_pattern:
                     self.immigration_pattern[key] /= tot_percent
         self.generation = 0
+        self.fp_headers = []
+        # True if the population already has fingerprints and properties
+        self.evaluated = False
+        self.birthplace = self.land.planet.birthplaces.code(
+                self.land.planet.name, self.land.name, self.name)
         if initial_population is not None:
             self.population = self.__load_population(initial_population)
         elif initial_population_file is not None:
             df = pd.read_csv(initial_population_file)
             self.population = self.__load_population(df)
+        elif initial_planet is not None:
+            self.population = self.__load_planet(initial_planet,
+                    initial_planet_filters if initial_planet_filters 
+                    is not None else {})
         else:
-            self.population = self.__generate_random_population(
+            with self.__phase('initial_population'):
+                self.population = self.__generate_random_population(
                                                 num_population_initial,
                                                 num_chromosomes_initial
-                                                               ) 
+                                                                   ) 
 
     def family_demographics(self):
         """Returns demographics of family (number of parents and children)"""
@@ -710,32 +1091,36 @@ class PolyNation:
                                                       self.land.name))
         # Reassess fitness here due to emigration.
         st = time()
-        self.population = self.land.fitness_function(self.population.copy(),
-                self.fp_headers)
+        with self.__phase('fitness'):
+            self.__assess_fitness()
+            self.land.planet.hall_of_fame.update(self, self.population)
         if narrate:
             logging.info('The {} of {} worked for {} years.'.format(
                self.land.planet.species, self.name, round((time() - st), 4))) 
         st = time()
-        families = self.__selection()
+        with self.__phase('selection'):
+            families = self.__selection()
         if narrate:
             logging.info('The {} of {} married!'.format(self.land.planet.species,
                 self.name)) 
         # Take census here so we know if polymer is selected as parent
         st = time()
         if take_census:
-            self.take_census()
+            with self.__phase('census'):
+                self.take_census()
         if narrate:
             logging.info('The nation of {} took {} years to finish their census!'.format(
                self.name, round((time() - st), 4))) 
             logging.info('There are {} {} in the nation'.format(
                len(self.population), self.land.planet.species))
         st = time()
-        children, parents = self.__crossover(families)
-        children = [self.__mutate(child) for child in children]
-        if narrate:
-            logging.info(f'After '
-            + f'{round((time() - st), 4)} years they had children.')
-        self.population = self.__log_births(children, parents)
+        with self.__phase('births'):
+            children, parents = self.__crossover(families)
+            children = [self.__mutate(child) for child in children]
+            if narrate:
+                logging.info(f'After '
+                + f'{round((time() - st), 4)} years they had children.')
+            self.population = self.__log_births(children, parents)
         logging.info("Generation {} of {} have all passed away".format(self.generation,
                                                       self.name))
         self.generation += 1
@@ -749,117 +1134,127 @@ class PolyNation:
             narrate (bool):
                 If true narration message occur
         """
+        with self.__phase('fingerprint'):
+            if self.evaluated:
+                # Loaded with fingerprints and properties
+                self.evaluated = False
+            else:
+                self.__fingerprint_and_predict(narrate)
+        self.fp_headers = self.population.fp_headers
         st = time()
-        if self.land.planet.num_cpus == 1:
-            self.population, self.fp_headers = (
-                    self.land.planet.fingerprint_function(self.population.copy())
-            )
-            if narrate:
-                logging.info(f'The {self.land.planet.species} of {self.name} '
-                + f'took {round((time() - st), 4)} years to mature.')
+        with self.__phase('fitness'):
+            self.__assess_fitness()
+        if narrate:
+            logging.info(f'The {self.land.planet.species} of {self.name} worked for '
+            + f'{round((time() - st), 4)} years.')
+        # skip emigration if no other nations exist
+        if self.land.planet.num_nations > 1:
             st = time()
-            self.population = (
-                    self.land.planet.predict_function(self.population.copy(),
-                        self.fp_headers, self.land.planet.models)
-            )
+            with self.__phase('emigration'):
+                self.__emigrate()
             if narrate:
                 logging.info(f'The {self.land.planet.species} of {self.name} '
-                + f'took {round((time() - st), 4)} years to graduate college.')
-        elif self.land.planet.num_cpus > 1:
+                + f'emigrated over {round((time() - st), 4)} years.')
+        else:
+            logging.info(f"No other nations exist for the polymers of "
+                    + f"{self.name} to immigrate to")
+
+    def __fingerprint_and_predict(self, narrate):
+        """Fingerprints population and predicts its properties"""
+        st = time()
+        planet = self.land.planet
+        df = self.population.to_frame(fingerprints=False, properties=False)
+        if planet.num_cpus == 1:
+            df, fingerprints = parallelize(df, planet.fingerprint_function,
+                    planet.predict_function, planet.models, 
+                    planet.fingerprint_protocol)
+            if narrate:
+                logging.info(f'The {planet.species} of {self.name} '
+                + f'took {round((time() - st), 4)} years to grow up.')
+        elif planet.num_cpus > 1:
             st = time()
-            split_df = np.array_split(self.population.copy(), 
-                    self.land.planet.num_cpus)
+            # At most chunk_size polymers are fingerprinted at once
+            num_chunks = max(planet.num_cpus, 
+                             math.ceil(len(df) / planet.chunk_size))
+            split_df = np.array_split(df, num_chunks)
             # Can't pass method, need to pass function, so we must pass
             # models and appropriate functions as parameters
             iterables = []
-            for i in range(self.land.planet.num_cpus):
-                iterable = (split_df[i], self.land.planet.fingerprint_function,
-                        self.land.planet.predict_function, 
-                        self.land.planet.models)
+            for i in range(num_chunks):
+                iterable = (split_df[i], planet.fingerprint_function,
+                        planet.predict_function, planet.models,
+                        planet.fingerprint_protocol)
                 iterables.append(iterable)
-            pool = Pool(self.land.planet.num_cpus)
-            return_dfs_and_headers = pool.starmap(parallelize, iterables)
+            pool = Pool(planet.num_cpus)
+            returns = pool.starmap(parallelize, iterables)
             pool.close()
             pool.join()
-            valid_dfs = []
-            valid_headers = []
-            # Join returned dfs and headers
-            for return_df_and_header in return_dfs_and_headers:
-                if return_df_and_header[0] is not None:
-                    valid_dfs.append(return_df_and_header[0])
-                    valid_headers.extend(return_df_and_header[1])
-
-            self.population = pd.concat(valid_dfs).fillna(0)
-            self.fp_headers = list(set(valid_headers))
+            # Join returned dfs and fingerprints
+            returns = [r for r in returns if r[0] is not None]
+            df = pd.concat([r[0] for r in returns]).fillna(0)
+            fingerprints = FingerprintStore.concat([r[1] for r in returns])
 
             if narrate:
-                logging.info(f'The {self.land.planet.species} of {self.name} took '
+                logging.info(f'The {planet.species} of {self.name} took '
                 + f'{round((time() - st), 4)} years to grow up.')
         else:
             raise ValueError('num_cpus to use must be >= 1')
-        st = time()
-        self.population = self.land.fitness_function(self.population.copy(),
-                self.fp_headers)
-        if narrate:
-            logging.info(f'The {self.land.planet.species} of {self.name} worked for '
-            + f'{round((time() - st), 4)} years.')
-        # skip emigration if no other nations exist
-        if self.land.planet.num_nations > 1:
-            st = time()
-            self.__emigrate()
-            if narrate:
-                logging.info(f'The {self.land.planet.species} of {self.name} '
-                + f'emigrated over {round((time() - st), 4)} years.')
-        else:
-            logging.info(f"No other nations exist for the polymers of "
-                    + f"{self.name} to immigrate to")
+        self.population.absorb(df, fingerprints=fingerprints)
 
     def take_census(self):
         """Take census of population (save data)"""
-        # Save in folder planet_name/nation_name
-        self.population['generation'] = self.generation
-        self.population['nation'] = self.name
-        self.population['land'] = self.land.name
-        self.population['planet'] = self.land.planet.name
-        self.population['str_chromosome_ids'] = [str(ids) for ids in 
-                                     self.population['chromosome_ids'].values]
+        population = self.population
+        population.generation[:] = self.generation
         # Drop zero columns
-        cols_to_compare = [col for col in self.population.columns if col not in
-                self.land.planet.global_cols]
-        temp = self.population[cols_to_compare]
-        temp = temp.loc[:, (temp == 0).all(axis=0)]
-        self.population.drop(labels=temp.columns, axis=1, inplace=True)
-        del temp
-
-        self.fp_headers = [col for col in self.population.columns if col in 
-                self.fp_headers]
-        # Can't add lists to database and don't want to save fitness or 
-        # immigration location
-        property_cols = [col for col in self.population.columns if col not 
-                in self.fp_headers and col 
-                not in self.land.planet.global_cols]
-        
-        for index, row in self.population.iterrows():
-            fingerprint = row[self.fp_headers].to_dict()
-            properties = row[property_cols].to_dict()
-            polymer = Polymer(planetary_id=row['planetary_id'],
-                    parent_1_id=row['parent_1_id'], 
-                    parent_2_id=row['parent_2_id'], 
-                    is_parent=row['is_parent'], 
-                    num_chromosomes = row['num_chromosomes'],
-                    smiles_string = row['smiles_string'], 
-                    birth_land = row['birth_land'], 
-                    birth_nation = row['birth_nation'], 
-                    birth_planet = row['birth_planet'],
-                    str_chromosome_ids = row['str_chromosome_ids'], 
-                    generation = row['generation'], 
-                    settled_planet = row['planet'], 
-                    settled_land = row['land'], 
-                    settled_nation = row['nation'], 
-                    fingerprint = fingerprint,
-                    properties = properties)
-            self.land.planet.session.add(polymer)
-        self.land.planet.session.commit()
+        population.drop_zero_columns(self.land.planet.chunk_size)
+        self.fp_headers = population.fp_headers
+        self.land.planet.census.write(self, population, 
+                                      self.land.planet.chunk_size)
+
+    def __phase(self, name: str):
+        """Returns context manager recording memory used by a phase"""
+        return self.land.planet.memory.phase(self.name, self.generation, name)
+
+    def __assess_fitness(self):
+        """Runs land's fitness function on the population"""
+        share = self.land.planet.callback_contract != 'copy'
+        df = self.population.to_frame(
+                fingerprints=self.land.fitness_fingerprints, share=share)
+        passed = list(df.columns) if share else None
+        df = self.land.fitness_function(df, self.fp_headers)
+        self.__check_contract(df, 'fitness_function')
+        self.population.absorb(df, passed=passed)
+        self.__store()
+
+    def __store(self):
+        """Moves population to new memory-mapped files if storage is memmap.
+
+        Files of the previous population are removed.
+        """
+        if self.storage != 'memmap':
+            return
+        planet = self.land.planet
+        root = os.path.join(planet.save_folder, 'memmap', self.name)
+        os.makedirs(root, exist_ok=True)
+        folder = tempfile.mkdtemp(dir=root)
+        self.population.to_memmap(folder, planet.chunk_size)
+        if self.memmap_folder is not None:
+            shutil.rmtree(self.memmap_folder, ignore_errors=True)
+        self.memmap_folder = folder
+
+    def __check_contract(self, df, callback_name):
+        """Raises ValueError if callback changed values it was passed.
+
+        Only checked if planet's callback_contract is 'validate'.
+        """
+        if self.land.planet.callback_contract != 'validate':
+            return
+        changed = self.population.changed_columns(df)
+        if len(changed) != 0:
+            raise ValueError(f"{callback_name} of {self.name} changed "
+                    + f"columns {changed} it was passed. Callbacks may not "
+                    + "change their inputs when callback_contract is "
+                    + "'validate'.")
 
     def __crossover(self, families):
         """Performs crossover on polymers and returns resulting chromosome_id
@@ -869,7 +1264,8 @@ class PolyNation:
         Mating will occur between parent pairs sequentially [0, 1] -> [0, 2]
         -> [0, 3] -> [1, 2] -> etc... and then cycle back. 
         Half chosen per parent will be random, but if one combination
-        already exists, it will be thrown out, unless number of children
+        already exists (up to rotation and reversal of the chromosome ids), 
+        it will be thrown out, unless number of children
         per family > combination(parents, 2)*4. This scheme is not perfect,
         as the first parent will be oversamples, but if diverse choice
         is used, this parent will have the highest fitness score of the
@@ -893,11 +1289,12 @@ class PolyNation:
             
             parent_combinations = comb(len(family), 2)
             chromosome_ids_of_children = []
-            df_of_parents = (
-              self.population.loc[self.population['planetary_id'].isin(family)]
-                            )
-            chromosome_ids_of_parents = df_of_parents['chromosome_ids'].values
-            planetary_ids_of_parents = df_of_parents['planetary_id'].values
+            keys_of_children = set()
+            positions_of_parents = np.sort(self.population.positions(family))
+            chromosome_ids_of_parents = [self.population.chromosome_ids(i) 
+                                         for i in positions_of_parents]
+            planetary_ids_of_parents = (
+                    self.population.planetary_id[positions_of_parents])
             crossover_pos = []
             for chromosome_ids in chromosome_ids_of_parents:
                 if self.land.crossover_position == 'relative_center':
@@ -966,7 +1363,9 @@ class PolyNation:
                                         ] 
                                       )
                 else:
-                    if child_chromosome_ids not in chromosome_ids_of_children:
+                    key = chromosome_key(child_chromosome_ids)
+                    if key not in keys_of_children:
+                        keys_of_children.add(key)
                         chromosome_ids_of_children.append(child_chromosome_ids)
                         all_parents.append(
                                             [
@@ -983,43 +1382,47 @@ class PolyNation:
 
     def __emigrate(self):
         """Polymers in nation emigrate according to emigration parameters"""
+        # Highest fitness first. Ties keep population order.
+        by_fitness = np.argsort(-self.population.fitness, kind='stable')
+        n = round(len(self.population) * self.emigration_rate) 
         if self.emigration_selection == 'random':
-            to_emigrate = self.population.sample(frac=self.emigration_rate,
-                                                replace=False)
+            to_emigrate = self.rng.choice(len(self.population), size=n,
+                                          replace=False)
         elif self.emigration_selection == 'elite':
-            n = round(len(self.population) * self.emigration_rate) 
-            to_emigrate = self.population.nlargest(n, 'fitness')
+            to_emigrate = by_fitness[:n]
         elif self.emigration_selection == 'best_worst':
             num_parents = self.num_parents_per_family * self.num_families
-            n = round(len(self.population) * self.emigration_rate) 
-            parents = self.population.nlargest(num_parents, 'fitness')
-            pop_no_parents = self.population[~self.population.isin(parents)
-                                            ].dropna()
-            to_emigrate = pop_no_parents.nlargest(n, 'fitness')
-        self.population = self.population[~self.population.isin(to_emigrate)
-                                         ].dropna()
-        immigration_loc = ['random']*len(to_emigrate)
+            to_emigrate = by_fitness[num_parents:num_parents + n]
+        else:
+            raise ValueError("Choose a valid emigration selection. "
+                    + "{} invalid.".format(self.emigration_selection))
+        stay = np.ones(len(self.population), dtype=bool)
+        stay[to_emigrate] = False
+        emigrants = self.population.take(to_emigrate)
+        self.population = self.population.take(np.flatnonzero(stay))
+        self.__store()
+        immigration_loc = ['random']*len(emigrants)
         # Randomly choose where each polymer is sent, but number to send to
         # each place is user defined
         if len(self.immigration_pattern) != 0:
             tot_percent = 0
             for val in self.immigration_pattern.values():
                 tot_percent += val
-            indices = [x for x in range(len(to_emigrate))]
-            num_to_change = round(tot_percent * len(to_emigrate))
+            indices = [x for x in range(len(emigrants))]
+            num_to_change = round(tot_percent * len(emigrants))
             indices_to_change = self.rng.choice(indices,
                                                 size=num_to_change,
                                                 replace=False
                                                )
             index = 0
             for key, val in self.immigration_pattern.items():
-                n_to_mutate = round(val * len(to_emigrate))
+                n_to_mutate = round(val * len(emigrants))
                 for i in range(n_to_mutate):
                     immigration_loc[indices_to_change[index]] = key
                     index += 1
-        to_emigrate['immigration_loc'] = immigration_loc
-        if len(to_emigrate) != 0:
-            self.land.planet.emigration_list.append(to_emigrate)
+        if len(emigrants) != 0:
+            self.land.planet.emigration_list.append((emigrants, 
+                                                     immigration_loc))
 
 
     def __generate_random_population(self, num_population_initial, 
@@ -1035,34 +1438,75 @@ class PolyNation:
                 int representing number of blocks each 
                 randomly generated polymer has
         
-        Returns (pd.DataFrame):  
-            Pandas dataframe of population
+        Returns (Population):  
+            Population of randomly generated polymers
+
+        Polymers are assembled in chunks of the planet's chunk_size, spread 
+        over its cpus. Each chunk draws its chromosome ids as one matrix and
+        seeds its own random number generator, so populations don't depend
+        on the number of cpus.
         """
-        population = []
-        for i in range(num_population_initial):         
-            polymer_chromosomes_ids = list(self.rng.choice(
-                                           self.land.land_chromosomes,
+        planet = self.land.planet
+        def chunks():
+            # Drawn in the main thread, in order, so populations don't 
+            # depend on the number of cpus or on worker timing
+            for start in range(0, num_population_initial, planet.chunk_size):
+                size = min(planet.chunk_size, num_population_initial - start)
+                yield (self.rng.choice(self.land.land_chromosomes, 
+                                       size=(size, num_chromosomes_initial)),
+                       planet.chromosomes, self.land.generative_function,
+                       self.land.generative_function_parameters,
+                       int(self.rng.integers(2**63)))
+        population = [Population.from_records(planet.birthplaces, [], [], [],
+                                              self.birthplace, [], [])]
+        if planet.num_cpus > 1:
+            with Pool(planet.num_cpus) as pool:
+                # At most two chunks per cpu are in memory at once
+                for chunk, assembled in bounded_starmap(pool, assemble_chunk,
+                        chunks(), 2 * planet.num_cpus):
+                    population.append(self.__settle_chunk(*assembled, 
+                        chunk[-1], num_chromosomes_initial))
+        else:
+            for chunk in chunks():
+                population.append(self.__settle_chunk(*assemble_chunk(*chunk),
+                    chunk[-1], num_chromosomes_initial))
+        return Population.concat(population)
+
+    def __settle_chunk(self, chromosome_ids, smiles, seed, 
+                       num_chromosomes_initial):
+        """Returns Population of the valid polymers of an assembled chunk.
+
+        With a novelty index, repeats are re-bred from a random number 
+        generator of the chunk's seed, so re-breeding doesn't touch the 
+        nation's generator.
+        """
+        planet = self.land.planet
+        smiles = list(smiles)
+        novelty = planet.novelty
+        if novelty is not None:
+            rng = default_rng([seed, 1])
+            draw = lambda: list(rng.choice(self.land.land_chromosomes,
                                            size=num_chromosomes_initial))
-            smiles = self.land.generative_function(polymer_chromosomes_ids, 
-                    self.land.planet.chromosomes, self.rng, 
-                    **self.land.generative_function_parameters) 
-            if smiles == None or smiles == '':
-                continue
-            else:
-                population.append(
-                                  {
-                               'chromosome_ids': polymer_chromosomes_ids,
-                               'num_chromosomes': len(polymer_chromosomes_ids),
-                               'planetary_id': self.land.planet.uid(),
-                               'parent_1_id': 0,
-                               'parent_2_id': 0,
-                               'smiles_string': smiles,
-                               'birth_land': self.land.name,
-                               'birth_nation': self.name,
-                               'birth_planet': self.land.planet.name
-                                  }
-                                 )
-        return pd.DataFrame(population)
+            for i in range(len(smiles)):
+                if not isinstance(smiles[i], str) or smiles[i] == '':
+                    continue
+                if (novelty.has_chromosomes(chromosome_ids[i]) 
+                    or novelty.has_smiles(smiles[i])):
+                    chromosome_ids[i], smiles[i] = self.__give_birth(
+                            draw(), draw, rng)
+                else:
+                    novelty.add(smiles[i], chromosome_ids[i])
+        # Anything but a nonempty string, e.g. None, failed to generate
+        valid = np.array([isinstance(s, str) and s != '' for s in smiles], 
+                         dtype=bool)
+        chromosome_ids = chromosome_ids[valid]
+        smiles = np.array([s for s, ok in zip(smiles, valid) if ok], 
+                          dtype=object)
+        n = len(smiles)
+        return Population(planet.birthplaces, planet.uids(n),
+                np.zeros(n), np.zeros(n), np.full(n, self.birthplace),
+                smiles, chromosome_ids.ravel(), 
+                np.arange(n + 1) * num_chromosomes_initial)
 
     def __load_population(self, df):
         """Loads pandas dataframe from csv file containing initial population"""
@@ -1083,22 +1527,54 @@ class PolyNation:
             raise KeyError(f"Must have {necessary_cols} columns in your "
                     + f"manual first generation. You only have {cols}.")
             
-        chromosomes = []
-        ids = []
-        for index, row in df.iterrows():
-            ids.append(self.land.planet.uid())
-            if isinstance(row['chromosome_ids'], str):
-                chromosomes.append(str_to_list(row['chromosome_ids']))
-            else:
-                chromosomes.append(row['chromosome_ids'])
-        pd.options.mode.chained_assignment = None
-        df['chromosome_ids'] = chromosomes
-        df['planetary_id'] = ids
-        pd.options.mode.chained_assignment = 'warn'
-        return df
+        chromosomes = [str_to_list(ids) if isinstance(ids, str) else list(ids)
+                       for ids in df['chromosome_ids'].values]
+        ids = self.land.planet.uids(len(df))
+        novelty = self.land.planet.novelty
+        if novelty is not None:
+            for smiles, chromosome_ids in zip(df['smiles_string'].values,
+                                              chromosomes):
+                novelty.add(smiles, chromosome_ids)
+        birthplaces = self.land.planet.birthplaces
+        birthplace = [birthplaces.code(planet, land, nation) for 
+                      planet, land, nation in zip(df['birth_planet'].values,
+                          df['birth_land'].values, df['birth_nation'].values)]
+        return Population.from_records(birthplaces, ids, 
+                df['parent_1_id'].values, df['parent_2_id'].values, 
+                birthplace, df['smiles_string'].values, chromosomes)
             
 
 
+    def __load_planet(self, planet, filters):
+        """Loads population with fingerprints and properties from a planet.
+
+        Args:  
+            planet (str):  
+                Full path to folder of planet.
+
+            filters (dict):  
+                Keyword arguments of analysis.load_generation.
+        """
+        df, fp_df = load_generation(planet, **filters)
+        if len(df) == 0:
+            raise ValueError("No polymers of {} match {}.".format(planet,
+                                                                  filters))
+        df['chromosome_ids'] = [list(ids) for ids in df['chromosome_ids']]
+        population = self.__load_population(df)
+        # Parent ids are planetary ids of the other planet, so they would
+        # point at unrelated polymers of this one
+        population.parent_1_id[:] = 0
+        population.parent_2_id[:] = 0
+        fp_df = fp_df.loc[df['planetary_id'].values].fillna(0)
+        population.fingerprints = FingerprintStore.from_frame(fp_df, 
+                                                              fp_df.columns)
+        stored = set(Polymer.__table__.columns.keys()) | set(GLOBAL_COLUMNS)
+        population.properties = {col: df[col].to_numpy() for col in 
+                                 df.columns if col not in stored}
+        self.fp_headers = population.fp_headers
+        self.evaluated = True
+        return population
+
     def __log_births(self, children, parents):
         """Logs details of the birth of the new children and returns population
 
@@ -1110,86 +1586,139 @@ class PolyNation:
                 list of pairs parents and their planetary_ids.
         """
         population = []
+        born_parents = []
         for i in range(len(children)):
-            child = children[i]
-            parent1 = parents[i][0]
-            parent2 = parents[i][1]
-            smiles = self.land.generative_function(child, 
-                        self.land.planet.chromosomes, self.rng,
-                        **self.land.generative_function_parameters) 
+            child, smiles = self.__give_birth(children[i], 
+                    lambda: self.__mutate(list(children[i])))
             if smiles == None or smiles == '':
                 continue
             else:
-                population.append(
-                                  {
-                               'chromosome_ids': child,
-                               'num_chromosomes': len(child),
-                               'planetary_id': self.land.planet.uid(),
-                               'parent_1_id': parent1,
-                               'parent_2_id': parent2,
-                               'smiles_string': smiles,
-                               'birth_land': self.land.name,
-                               'birth_nation': self.name,
-                               'birth_planet': self.land.planet.name
-                                  }
-                                 )
-        return pd.DataFrame(population)
-
-
-    def __mating(self, df):
+                population.append((child, smiles))
+                born_parents.append(parents[i])
+        return self.__population_of(population, born_parents)
+
+    def __population_of(self, children, parents):
+        """Returns population of children born in this nation.
+
+        Args:  
+            children (list):  
+                list of (chromosome ids, smiles) of each child
+
+            parents (list):  
+                list of pairs of parent planetary_ids of each child
+        """
+        ids = self.land.planet.uids(len(children))
+        parents = np.asarray(parents, dtype=np.int64).reshape(-1, 2)
+        return Population.from_records(self.land.planet.birthplaces, ids,
+                parents[:, 0], parents[:, 1], self.birthplace, 
+                [smiles for chromosome_ids, smiles in children],
+                [chromosome_ids for chromosome_ids, smiles in children])
+
+    def __give_birth(self, chromosome_ids, rebreed, rng=None):
+        """Returns chromosome ids and smiles of a child new to the planet.
+
+        If the planet has a novelty index, children whose chromosome ids or
+        smiles already exist on the planet are re-bred up to the index's
+        retry budget. The last attempt is born even if it is a repeat.
+
+        Args:  
+            chromosome_ids (list):  
+                list of chromosome ids of the child
+
+            rebreed (callable):  
+                Returns new list of chromosome ids to try instead.
+
+            rng (np.random.Generator):  
+                Generator passed to the generative function. Default the 
+                nation's.
+
+        Returns:  
+            chromosome_ids (list):  
+                chromosome ids of the child that is born
+
+            smiles (str):  
+                smiles of the child. None or '' if invalid.
+        """
+        novelty = self.land.planet.novelty
+        if rng is None:
+            rng = self.rng
+        attempt = 0
+        while True:
+            last_attempt = novelty is None or attempt >= novelty.retries
+            attempt += 1
+            if not last_attempt and novelty.has_chromosomes(chromosome_ids):
+                chromosome_ids = rebreed()
+                continue
+            smiles = self.land.generative_function(chromosome_ids, 
+                        self.land.planet.chromosomes, rng,
+                        **self.land.generative_function_parameters) 
+            if smiles == None or smiles == '':
+                return chromosome_ids, smiles
+            if last_attempt or not novelty.has_smiles(smiles):
+                break
+            chromosome_ids = rebreed()
+        if novelty is not None:
+            novelty.add(smiles, chromosome_ids)
+        return chromosome_ids, smiles
+
+
+    def __mating(self, positions):
         """Returns list of planetary ids of parent groups.
 
         Polymers that can't find a mate die.
+
+        Args:  
+            positions (np.ndarray):  
+                Positions of selected parents in the population, in the 
+                order the selection scheme returned them.
         """
         # Families should be chosen by uid
         families = []
-        df = df.sort_values(by='fitness', ascending=False)
-        # Set id = planetary_id so we can drop rows by index
-        df['id'] = df['planetary_id']
-        df = df.set_index('id')
+        population = self.population
+        planetary_ids = population.planetary_id[positions]
         if self.partner_selection == 'diversity':
-            while len(df) > 0: 
-                for index, row in df.iterrows():
-                    fp1 = row[self.fp_headers]
-                    family = [row['planetary_id']]
-                    similarities = {}
-                    for index2, row2 in df.iterrows():
-                        if index != index2:
-                            fp2 = row2[self.fp_headers]
-                            score = self.__tanimoto_similarity(fp1, fp2)
-                            # error check
-                            if score == -1:
-                                continue
-                            if score < 0.5: 
-                                family.append(row2['planetary_id'])
-                                if len(family) == self.num_parents_per_family:
-                                    break
-                            else:
-                                similarities[row2['planetary_id']] = score         
-                    if len(family) < self.num_parents_per_family:
-                        num_to_add = self.num_parents_per_family - len(family)
-                        for i in range(num_to_add):
-                            if len(similarities) == 0:
-                                break
-                            uid = min(similarities, key=similarities.get) 
-                            # Don't want to grab a second time
-                            similarities.pop(uid, None)
-                            family.append(uid) 
-                    if len(family) != 1:
-                        families.append(family)
-                    df = df.drop(index=family)
-                    break
+            fps = population.fingerprints.take(positions)
+            remaining = np.arange(len(positions))
+            while len(remaining) > 0: 
+                first = remaining[0]
+                others = remaining[1:]
+                family = [first]
+                # Tanimoto similarity of first to all others
+                scores = fps.tanimoto(first, others)
+                valid = ~np.isnan(scores)
+                scores[~valid] = np.inf
+                num_to_add = self.num_parents_per_family - 1
+                dissimilar = others[scores < 0.5][:num_to_add]
+                family.extend(dissimilar)
+                if len(family) < self.num_parents_per_family:
+                    # Fill with the least similar of the rest
+                    similar = valid & (scores >= 0.5)
+                    order = np.argsort(scores[similar], kind='stable')
+                    num_to_add = self.num_parents_per_family - len(family)
+                    family.extend(others[similar][order][:num_to_add])
+                if len(family) != 1:
+                    families.append(list(planetary_ids[family]))
+                remaining = remaining[~np.isin(remaining, family)]
                         
+        elif self.partner_selection == 'cluster':
+            # Highest fitness first. Ties keep selection order.
+            positions = positions[np.argsort(-population.fitness[positions], 
+                                             kind='stable')]
+            planetary_ids = population.planetary_id[positions]
+            families = [list(planetary_ids[family]) for family in 
+                        self.__cluster_families(positions)]
+
         elif self.partner_selection == 'random':
-            while len(df) > 0:
-                if len(df) < self.num_parents_per_family:
-                    family = df.planetary_id.values
+            remaining = np.arange(len(positions))
+            while len(remaining) > 0:
+                if len(remaining) < self.num_parents_per_family:
+                    family = remaining
                 else:
-                    family = df.sample(n=self.num_parents_per_family)[
-                                'planetary_id'].values
+                    family = self.rng.choice(remaining, 
+                            size=self.num_parents_per_family, replace=False)
                 if len(family) != 1:
-                    families.append(family)
-                df = df.drop(index=family)
+                    families.append(list(planetary_ids[family]))
+                remaining = remaining[~np.isin(remaining, family)]
                                             
         else:
             raise ValueError("Please choose a valid selection scheme. {} invalid.".format(
@@ -1198,6 +1727,57 @@ class PolyNation:
         return families
 
 
+    def __cluster_families(self, positions):
+        """Returns families as lists of indices into positions.
+
+        Parents are clustered on their fingerprints. Going from highest
+        fitness down, each remaining parent takes the best remaining parent
+        of each of the clusters whose centers are furthest from its own.
+
+        Args:  
+            positions (np.ndarray):  
+                Positions of parents in the population, highest fitness 
+                first.
+        """
+        num_clusters = self.num_partner_clusters
+        if num_clusters is None:
+            num_clusters = int(np.clip(np.sqrt(len(positions)),
+                    self.num_parents_per_family, 256))
+        labels, centers = minibatch_kmeans(
+                self.population.fingerprints.take(positions), num_clusters,
+                self.rng)
+        num_clusters = len(centers)
+        squares = (centers ** 2).sum(axis=1)
+        distances = squares[:, None] + squares[None] - 2 * centers @ centers.T
+        # Members of each cluster, highest fitness first
+        order = np.argsort(labels, kind='stable')
+        starts = np.searchsorted(labels[order], np.arange(num_clusters + 1))
+        heads = starts[:-1].copy()
+        used = np.zeros(len(positions), dtype=bool)
+        families = []
+        for first in range(len(positions)):
+            if used[first]:
+                continue
+            family = [first]
+            used[first] = True
+            heads[labels[first]] += 1
+            while len(family) < self.num_parents_per_family:
+                available = np.flatnonzero(heads < starts[1:])
+                if len(available) == 0:
+                    break
+                num_to_add = self.num_parents_per_family - len(family)
+                # Furthest clusters first, own cluster last
+                far = available[np.argsort(-distances[labels[first], 
+                                                      available], 
+                                           kind='stable')][:num_to_add]
+                members = order[heads[far]]
+                heads[far] += 1
+                used[members] = True
+                family.extend(members.tolist())
+            if len(family) != 1:
+                families.append(family)
+        return families
+
     def __mutate(self, chromosome_ids):
         """Mutates some chromosomes in the list of chromosome ids
 
@@ -1246,7 +1826,13 @@ class PolyNation:
         polymers will be mated.
         """
         num_parents = self.num_families * self.num_parents_per_family
-        national_origins = np.unique(self.population['birth_nation'])
+        # Count polymers per birth nation on the integer birthplace codes
+        codes, counts = np.unique(self.population.birthplace, 
+                                  return_counts=True)
+        national_origins, nations = np.unique(
+                self.population.birthplaces.decode(codes, 2), 
+                return_inverse=True)
+        counts = np.bincount(nations, weights=counts).astype(np.int64)
         num_parents_per_nationality = {}
         # Will subtract number from each other nation
         num_migrant_parents = round(num_parents
@@ -1262,78 +1848,157 @@ class PolyNation:
         # Don't try to find migrants if none exist or if none mandatory.
         if (len(national_origins) != 1 
             or self.parent_migrant_percentage == 0):
-            # Count number of migrants per foreign nation
-            num_migrants_per_nation = {}
-            for nation in national_origins:
-                if nation != self.name:
-                    tdf = self.population.loc[self.population[
-                                                      'birth_nation'
-                                                              ] == nation]
-                    num_migrants_per_nation[nation] = len(tdf)
-                    num_parents_per_nationality[nation] = 0
             # Evenly distribute parents per each nation until 
             # num_migrant_parents met or no more migrants exist.
-            tot_num_migrant_parents = 0
-            while tot_num_migrant_parents != num_migrant_parents:
-                no_more_migrants = True
-                for nation in num_migrants_per_nation:
-                    if num_migrants_per_nation[nation] > 0:
-                        num_migrants_per_nation[nation] -= 1
-                        num_parents_per_nationality[nation] += 1 
-                        tot_num_migrant_parents += 1
-                        no_more_migrants = False
-                    if tot_num_migrant_parents == num_migrant_parents:
-                        break
-                if no_more_migrants:
-                    break
+            foreign = national_origins != self.name
+            num_migrants = allocate_evenly(counts[foreign], 
+                                           num_migrant_parents)
+            num_parents_per_nationality.update(zip(
+                national_origins[foreign].tolist(), num_migrants.tolist()))
         if (num_parents > len(self.population)):
-            df = self.population.copy()
+            positions = np.arange(len(self.population))
         else: 
-            df = self.selection_scheme(self.population.copy(), 
+            share = self.land.planet.callback_contract != 'copy'
+            df = self.selection_scheme(
+                    self.population.to_frame(
+                        fingerprints=self.selection_fingerprints, 
+                        share=share), 
                     num_parents_per_nationality)
+            self.__check_contract(df, 'selection_scheme')
+            positions = self.population.positions(df['planetary_id'].values)
 
-        families = self.__mating(df)
+        families = self.__mating(positions)
         # Save who is parent
-        is_parent = []
         all_parent_planetary_ids = [x for l in families for x in l] 
-        for index, row in self.population.iterrows():
-            if row['planetary_id'] in all_parent_planetary_ids:
-                is_parent.append(True)
-            else:
-                is_parent.append(False)
-        self.population['is_parent'] = is_parent
+        self.population.is_parent = np.isin(self.population.planetary_id,
+                                            all_parent_planetary_ids)
         return families
             
 
 
-    def __tanimoto_similarity(self, x, y):
-        """Returns tanimoto similarity score of polymers.
+def allocate_evenly(capacities: np.ndarray, total: int) -> np.ndarray:
+    """Splits total as evenly as possible without exceeding capacities.
 
-        Returns -1 if division by zero occurs.
-        """
-        numerator = np.dot(x,y)
-        denominator = np.dot(x,x) + np.dot(y,y) - np.dot(x,y)
-        if denominator == 0:
-            return -1
-        tanimoto_similarity=np.dot(x,y)/(np.dot(x,x)+np.dot(y,y)-np.dot(x,y))
-        return tanimoto_similarity
-
-def parallelize(df, fingerprint_function, predict_function, models):
+    Same result as handing out one at a time, round robin in order, to 
+    whoever still has capacity, but computed in closed form: every 
+    capacity is filled up to a common level, and what is left goes one 
+    each to the first capacities above that level.
+
+    Args:  
+        capacities (np.ndarray):  
+            Most each can take.  
+        total (int):  
+            Amount to split. If more than the capacities sum to, every 
+            capacity is filled.
+
+    Returns (np.ndarray):  
+        Amount given to each.
+    """
+    capacities = np.asarray(capacities, dtype=np.int64)
+    if capacities.sum() <= total:
+        return capacities.copy()
+    k = len(capacities)
+    ordered = np.sort(capacities)
+    filled = np.zeros(k + 1, dtype=np.int64)
+    np.cumsum(ordered, out=filled[1:])
+    # Amount handed out once every capacity is filled up to ordered[j]
+    handed_out = filled[:-1] + ordered * (k - np.arange(k))
+    j = np.searchsorted(handed_out, total, side='right')
+    level = (total - filled[j]) // (k - j)
+    given = np.minimum(capacities, level)
+    above = np.flatnonzero(capacities > level)
+    given[above[:total - given.sum()]] += 1
+    return given
+
+def assemble_chunk(chromosome_ids: np.ndarray, chromosomes: dict,
+                   generative_function: callable, parameters: dict,
+                   seed: int) -> (np.ndarray, list):
+    """Assembles a chunk of polymers. Run by workers.
+
+    Args:  
+        chromosome_ids (np.ndarray):  
+            (n, k) chromosome ids of n polymers.
+
+        chromosomes (dict):  
+            Keys are chromosome ids, values their smiles.
+
+        generative_function (callable):  
+            Land's generative function.
+
+        parameters (dict):  
+            Extra parameters of generative function.
+
+        seed (int):  
+            Seed of the chunk's random number generator.
+
+    Returns:  
+        chromosome_ids and list of smiles of each polymer. Invalid polymers
+        have smiles None or ''.
+    """
+    rng = default_rng(seed)
+    return chromosome_ids, [generative_function(ids, chromosomes, rng,
+                                                **parameters) 
+                            for ids in chromosome_ids.tolist()]
+
+def bounded_starmap(pool, function: callable, arguments, limit: int):
+    """Yields (args, function(*args)) for each args of arguments, in order.
+
+    Unlike Pool.imap, arguments are drawn in the calling thread and at most
+    limit calls are submitted to pool at once.
+    """
+    pending = deque()
+    for args in arguments:
+        pending.append((args, pool.apply_async(function, args)))
+        if len(pending) >= limit:
+            args, result = pending.popleft()
+            yield args, result.get()
+    while pending:
+        args, result = pending.popleft()
+        yield args, result.get()
+
+def parallelize(df, fingerprint_function, predict_function, models,
+                fingerprint_protocol='dataframe'):
     """Parallelize the running of fingerprinting and property prediction.
 
     Args:
         df (pd.DataFrame):  
             Polymers to fingerprint and predict on
 
+        fingerprint_protocol (str):  
+            'dataframe' or 'matrix'. See PolyPlanet.
+
     Returns:  
-        dataframe with all generated polymers
+        dataframe of polymers and their properties, without fingerprint 
+        columns, and FingerprintStore of their fingerprints in the same 
+        order. (None, None) if all polymers failed fingerprinting.
     """
-    fingerprint_df, fp_headers = fingerprint_function(df)
+    if fingerprint_protocol == 'matrix':
+        planetary_ids, matrix, fp_headers = fingerprint_function(df)
+        planetary_ids = np.asarray(planetary_ids, dtype=np.int64)
+        if matrix.shape[0] != len(planetary_ids):
+            raise ValueError("fingerprint_function returned {} rows for "
+                    "{} planetary ids.".format(matrix.shape[0], 
+                                               len(planetary_ids)))
+    else:
+        fingerprint_df, fp_headers = fingerprint_function(df)
+        planetary_ids = fingerprint_df['planetary_id'].to_numpy(
+                dtype=np.int64)
 
     # If all polymers dropped, we just want to return None
-    if len(fingerprint_df) == 0:
+    if len(planetary_ids) == 0:
         return [None, None]
 
-    prediction_df = predict_function(fingerprint_df, fp_headers, models)
-
-    return [prediction_df, fp_headers]
+    if fingerprint_protocol == 'matrix':
+        rows = pd.Index(df['planetary_id']).get_indexer(planetary_ids)
+        prediction_df = predict_function(
+                df.iloc[rows].reset_index(drop=True), matrix, fp_headers, 
+                models)
+        fingerprints = FingerprintStore.from_matrix(matrix, fp_headers)
+    else:
+        prediction_df = predict_function(fingerprint_df, fp_headers, models)
+        fingerprints = FingerprintStore.from_frame(fingerprint_df, fp_headers)
+    # Predictions may drop polymers, so fingerprints follow the returned rows
+    rows = pd.Index(planetary_ids).get_indexer(prediction_df['planetary_id'])
+    prediction_df = prediction_df.drop(columns=[col for col in fp_headers 
+                                       if col in prediction_df.columns])
+    return [prediction_df, fingerprints.take(rows)]
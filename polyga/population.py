@@ -0,0 +1,416 @@
+"""Columnar store of the polymers living in a PolyNation.
+
+Populations keep each column as a numpy array so the generation loop can
+select, breed, and emigrate polymers without copying dataframes. A pandas
+dataframe is only built when a user supplied function (fingerprinting,
+prediction, fitness, or selection) needs one.
+"""
+from typing import List
+import os
+
+import numpy as np
+import pandas as pd
+
+from polyga.fingerprints import FingerprintStore, to_memmap
+
+# Columns managed by polyga. Anything else a user function returns is either
+# a fingerprint (listed in fp_headers) or a property.
+GLOBAL_COLUMNS = ['planetary_id', 'parent_1_id', 'parent_2_id', 'is_parent',
+                  'num_chromosomes', 'smiles_string', 'land', 'nation',
+                  'planet', 'str_chromosome_ids', 'generation',
+                  'birth_planet', 'birth_land', 'birth_nation',
+                  'chromosome_ids', 'fitness', 'immigration_loc']
+
+class Birthplaces:
+    """Integer codes of the (planet, land, nation) polymers are born in.
+
+    Shared by all populations on a planet so birthplaces are stored as one
+    small integer per polymer.
+    """
+    def __init__(self):
+        self.places = []
+        self.codes = {}
+
+    def __getitem__(self, code: int) -> tuple:
+        return self.places[code]
+
+    def __len__(self):
+        return len(self.places)
+
+    def code(self, planet: str, land: str, nation: str) -> int:
+        """Returns code of birthplace, adding it if new"""
+        place = (planet, land, nation)
+        if place not in self.codes:
+            self.codes[place] = len(self.places)
+            self.places.append(place)
+        return self.codes[place]
+
+    def decode(self, codes: np.ndarray, part: int) -> np.ndarray:
+        """Returns planet (0), land (1), or nation (2) names of codes"""
+        names = np.array([place[part] for place in self.places] + [''],
+                         dtype=object)
+        return names[codes]
+
+
+class Population:
+    """Columnar store of polymers.
+
+    Attributes:
+
+        birthplaces (Birthplaces):
+            Planet wide birthplace codes.
+
+        planetary_id (np.ndarray):
+            Planetary ids of polymers.
+
+        parent_1_id (np.ndarray):
+            Planetary id of first parent. 0 if no parent.
+
+        parent_2_id (np.ndarray):
+            Planetary id of second parent. 0 if no parent.
+
+        birthplace (np.ndarray):
+            Birthplace codes of polymers.
+
+        generation (np.ndarray):
+            Generation polymers were last counted in a census.
+
+        smiles (np.ndarray):
+            Smiles strings of polymers.
+
+        chromosomes (np.ndarray):
+            Chromosome ids of all polymers, one after another.
+
+        offsets (np.ndarray):
+            Polymer i has chromosomes[offsets[i]:offsets[i+1]].
+
+        is_parent (np.ndarray):
+            True if polymer was chosen as a parent.
+
+        fitness (np.ndarray):
+            Fitness of polymers. nan until scored.
+
+        fingerprints (FingerprintStore):
+            Bit-packed fingerprints, one row per polymer.
+
+        fp_headers (list):
+            Column names of fingerprints. Read-only, set via fingerprints.
+
+        dense_fingerprints (np.ndarray):
+            Read-only (n, len(fp_headers)) fingerprints, unpacked once and
+            kept until fingerprints change.
+
+        properties (dict):
+            Keys are property names, values are arrays of property values.
+    """
+    def __init__(self, birthplaces: Birthplaces, planetary_id, parent_1_id,
+                 parent_2_id, birthplace, smiles, chromosomes, offsets,
+                 generation=None, is_parent=None, fitness=None,
+                 fingerprints=None, properties=None):
+        n = len(planetary_id)
+        self.birthplaces = birthplaces
+        self.planetary_id = np.asarray(planetary_id, dtype=np.int64)
+        self.parent_1_id = np.asarray(parent_1_id, dtype=np.int64)
+        self.parent_2_id = np.asarray(parent_2_id, dtype=np.int64)
+        self.birthplace = np.asarray(birthplace, dtype=np.int32)
+        self.smiles = np.asarray(smiles, dtype=object)
+        self.chromosomes = np.asarray(chromosomes, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if generation is None:
+            generation = np.zeros(n, dtype=np.int64)
+        self.generation = np.asarray(generation, dtype=np.int64)
+        if is_parent is None:
+            is_parent = np.zeros(n, dtype=bool)
+        self.is_parent = np.asarray(is_parent, dtype=bool)
+        if fitness is None:
+            fitness = np.full(n, np.nan)
+        self.fitness = np.asarray(fitness, dtype=np.float64)
+        if fingerprints is None:
+            fingerprints = FingerprintStore.empty(n)
+        self.fingerprints = fingerprints
+        self.properties = properties if properties is not None else {}
+
+    @classmethod
+    def from_records(cls, birthplaces: Birthplaces, planetary_id,
+                     parent_1_id, parent_2_id, birthplace, smiles,
+                     chromosome_ids: List[list]) -> 'Population':
+        """Returns population of newly born polymers.
+
+        Args:
+            birthplaces (Birthplaces):
+                Planet wide birthplace codes.
+
+            planetary_id, parent_1_id, parent_2_id, birthplace, smiles:
+                Values of each polymer. birthplace may be a single code
+                shared by all polymers.
+
+            chromosome_ids (list):
+                List of lists of chromosome ids of each polymer.
+        """
+        lengths = np.array([len(ids) for ids in chromosome_ids],
+                           dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if len(chromosome_ids) != 0:
+            chromosomes = np.concatenate([np.asarray(ids, dtype=np.int64)
+                                          for ids in chromosome_ids])
+        else:
+            chromosomes = np.zeros(0, dtype=np.int64)
+        birthplace = np.broadcast_to(np.asarray(birthplace, dtype=np.int32),
+                                     len(lengths))
+        return cls(birthplaces, planetary_id, parent_1_id, parent_2_id,
+                   birthplace, smiles, chromosomes, offsets)
+
+    @classmethod
+    def concat(cls, populations: List['Population']) -> 'Population':
+        """Returns populations joined one after another.
+
+        Fingerprints and properties missing from a population are filled
+        with 0.
+        """
+        prop_names = []
+        for population in populations:
+            prop_names.extend([prop for prop in population.properties
+                               if prop not in prop_names])
+        properties = {prop: [] for prop in prop_names}
+        for population in populations:
+            n = len(population)
+            for prop in prop_names:
+                properties[prop].append(population.properties.get(prop,
+                    np.zeros(n)))
+        offsets = [np.zeros(1, dtype=np.int64)]
+        start = 0
+        for population in populations:
+            offsets.append(population.offsets[1:] + start)
+            start += population.offsets[-1]
+        join = lambda name: np.concatenate([getattr(population, name) for
+                                            population in populations])
+        return cls(populations[0].birthplaces, join('planetary_id'),
+                   join('parent_1_id'), join('parent_2_id'),
+                   join('birthplace'), join('smiles'), join('chromosomes'),
+                   np.concatenate(offsets), join('generation'),
+                   join('is_parent'), join('fitness'),
+                   FingerprintStore.concat([population.fingerprints for
+                                            population in populations]),
+                   {prop: np.concatenate(values) for prop, values in
+                    properties.items()})
+
+    def __len__(self):
+        return len(self.planetary_id)
+
+    @property
+    def fp_headers(self) -> list:
+        """Column names of fingerprints"""
+        return self.fingerprints.headers
+
+    @property
+    def fingerprints(self) -> FingerprintStore:
+        """Bit-packed fingerprints"""
+        return self.__fingerprints
+
+    @fingerprints.setter
+    def fingerprints(self, fingerprints: FingerprintStore):
+        self.__fingerprints = fingerprints
+        self.__dense = None
+
+    @property
+    def dense_fingerprints(self) -> np.ndarray:
+        """Read-only dense fingerprints, unpacked on first use"""
+        if self.__dense is None:
+            self.__dense = self.fingerprints.to_dense()
+            self.__dense.flags.writeable = False
+        return self.__dense
+
+    def __getstate__(self):
+        # Dense fingerprints are unpacked again after loading
+        state = self.__dict__.copy()
+        state['_Population__dense'] = None
+        return state
+
+    @property
+    def num_chromosomes(self) -> np.ndarray:
+        """Number of chromosomes of each polymer"""
+        return np.diff(self.offsets)
+
+    def birth_nations(self) -> np.ndarray:
+        """Returns name of nation each polymer was born in"""
+        return self.birthplaces.decode(self.birthplace, 2)
+
+    def chromosome_ids(self, i: int) -> list:
+        """Returns list of chromosome ids of polymer at position i"""
+        return self.chromosomes[self.offsets[i]:self.offsets[i+1]].tolist()
+
+    def positions(self, planetary_ids) -> np.ndarray:
+        """Returns positions of planetary ids in the population"""
+        planetary_ids = np.asarray(planetary_ids, dtype=np.int64)
+        sorter = np.argsort(self.planetary_id, kind='stable')
+        idx = np.searchsorted(self.planetary_id, planetary_ids, sorter=sorter)
+        idx[idx == len(sorter)] = 0
+        positions = sorter[idx] if len(sorter) != 0 else idx
+        if np.any(self.planetary_id[positions] != planetary_ids):
+            missing = planetary_ids[
+                self.planetary_id[positions] != planetary_ids]
+            raise KeyError("Planetary ids {} not in population".format(
+                missing.tolist()))
+        return positions
+
+    def take(self, positions) -> 'Population':
+        """Returns population of polymers at positions, in that order"""
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        chromosome_idx = (np.repeat(starts - offsets[:-1], lengths)
+                          + np.arange(offsets[-1]))
+        return Population(self.birthplaces, self.planetary_id[positions],
+                   self.parent_1_id[positions], self.parent_2_id[positions],
+                   self.birthplace[positions], self.smiles[positions],
+                   self.chromosomes[chromosome_idx], offsets,
+                   self.generation[positions], self.is_parent[positions],
+                   self.fitness[positions], self.fingerprints.take(positions),
+                   {prop: values[positions] for prop, values
+                                     in self.properties.items()})
+
+    def to_frame(self, fingerprints: bool = True,
+                 properties: bool = True, share: bool = False) -> pd.DataFrame:
+        """Returns dataframe of population for user functions.
+
+        Args:
+            fingerprints (bool):
+                If true, one column per fingerprint is included.
+
+            properties (bool):
+                If true, properties and fitness are included.
+
+            share (bool):
+                If true, fingerprint columns are the read-only block of
+                dense_fingerprints, unpacked once for every dataframe 
+                shared until fingerprints change. Writing to them raises 
+                a ValueError.
+        """
+        frame = {
+                 'planetary_id': self.planetary_id,
+                 'parent_1_id': self.parent_1_id,
+                 'parent_2_id': self.parent_2_id,
+                 'num_chromosomes': self.num_chromosomes,
+                 'smiles_string': self.smiles,
+                 'birth_land': self.birthplaces.decode(self.birthplace, 1),
+                 'birth_nation': self.birthplaces.decode(self.birthplace, 2),
+                 'birth_planet': self.birthplaces.decode(self.birthplace, 0),
+                 'chromosome_ids': [self.chromosome_ids(i) for i in
+                                    range(len(self))],
+                }
+        if properties:
+            frame.update(self.properties)
+            if not np.all(np.isnan(self.fitness)):
+                frame['fitness'] = self.fitness
+        df = pd.DataFrame(frame)
+        if fingerprints and len(self.fp_headers) != 0:
+            if share:
+                fps = self.dense_fingerprints
+            else:
+                fps = self.fingerprints.to_dense()
+            fp_df = pd.DataFrame(fps, columns=self.fp_headers, copy=False)
+            df = pd.concat([df, fp_df], axis=1, copy=False)
+        return df
+
+    def absorb(self, df: pd.DataFrame, fp_headers: list = None,
+               passed: list = None, fingerprints: FingerprintStore = None):
+        """Takes results of a user function back into the population.
+
+        Rows are matched by planetary_id, so polymers the function dropped
+        are dropped from the population. Columns that are neither polyga's
+        nor fingerprints are stored as properties.
+
+        Args:
+            df (pd.DataFrame):
+                Dataframe returned by user function.
+
+            fp_headers (list):
+                If passed, fingerprints are read from these columns of df.
+                Otherwise the population keeps its fingerprints.
+
+            passed (list):
+                Columns the user function was passed and promised not to
+                change. Only the other columns (and fitness) are read from
+                df. If None, all properties are read from df.
+
+            fingerprints (FingerprintStore):
+                If passed, new fingerprints with rows in the order of df.
+        """
+        positions = self.positions(df['planetary_id'].values)
+        if (len(positions) != len(self)
+            or np.any(positions != np.arange(len(self)))):
+            subset = self.take(positions)
+            self.__dict__.update(subset.__dict__)
+        if fp_headers is not None:
+            self.fingerprints = FingerprintStore.from_frame(df, fp_headers)
+        elif fingerprints is not None:
+            self.fingerprints = fingerprints
+        if 'fitness' in df.columns:
+            self.fitness = df['fitness'].to_numpy(dtype=np.float64)
+        if passed is None:
+            self.properties = {col: df[col].to_numpy() for col in df.columns
+                               if col not in GLOBAL_COLUMNS
+                               and col not in self.fp_headers}
+        else:
+            passed = set(passed)
+            self.properties.update({col: df[col].to_numpy() for col in 
+                                    df.columns if col not in passed
+                                    and col not in GLOBAL_COLUMNS
+                                    and col not in self.fp_headers})
+
+    def changed_columns(self, df: pd.DataFrame) -> list:
+        """Returns columns of df whose values differ from the population.
+
+        Used to check user functions did not change what they were passed.
+        Fitness and columns the population does not have are not checked.
+        """
+        positions = self.positions(df['planetary_id'].values)
+        expected = {
+                    'parent_1_id': self.parent_1_id,
+                    'parent_2_id': self.parent_2_id,
+                    'num_chromosomes': self.num_chromosomes,
+                    'smiles_string': self.smiles,
+                    'birth_land': self.birthplaces.decode(self.birthplace, 1),
+                    'birth_nation': self.birthplaces.decode(self.birthplace, 2),
+                    'birth_planet': self.birthplaces.decode(self.birthplace, 0),
+                   }
+        expected.update(self.properties)
+        changed = [col for col, values in expected.items() if col in df.columns
+                   and not np.array_equal(df[col].to_numpy(), 
+                                          values[positions])]
+        if 'chromosome_ids' in df.columns:
+            if any(list(ids) != self.chromosome_ids(i) for ids, i in 
+                   zip(df['chromosome_ids'].values, positions)):
+                changed.append('chromosome_ids')
+        fp_headers = [col for col in self.fp_headers if col in df.columns]
+        if len(fp_headers) != 0:
+            fps = df[fp_headers].to_numpy()
+            unchanged = fps == self.fingerprints.columns(fp_headers, positions)
+            changed.extend([col for col, same in 
+                            zip(fp_headers, unchanged.all(axis=0)) if not same])
+        return changed
+
+    def to_memmap(self, folder: str, chunk_size: int = 10000):
+        """Moves fingerprints and properties to memory-mapped files in folder.
+
+        Lets populations larger than memory be paged in as they are read.
+        Properties with object dtype stay in memory.
+        """
+        self.fingerprints.to_memmap(folder, chunk_size)
+        # The dense copy would keep fingerprints in memory
+        self.__dense = None
+        self.properties = {prop: to_memmap(values, os.path.join(folder, 
+                               'property_{}.npy'.format(i)), chunk_size)
+                           for i, (prop, values) in 
+                           enumerate(self.properties.items())}
+
+    def drop_zero_columns(self, chunk_size: int = 10000):
+        """Drops fingerprints and properties that are 0 for every polymer"""
+        self.fingerprints.drop_zero_columns(chunk_size)
+        self.__dense = None
+        self.properties = {prop: values for prop, values in
+                           self.properties.items()
+                           if not np.all(values == 0)}
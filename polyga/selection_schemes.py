@@ -1,5 +1,6 @@
 """Script for polymer different selection schemes"""
 from typing import Dict
+from bisect import bisect_left, bisect_right
 import pandas as pd
 import numpy as np
 
@@ -50,3 +51,356 @@ def random(population: pd.DataFrame,
         df = df.append(tdf)
 
     return df
+
+def non_dominated_sort(objectives: np.ndarray, num_needed: int = None,
+                       block_size: int = 256) -> np.ndarray:
+    """Ranks points by Pareto front. All objectives are minimized.
+
+    Uses efficient non-dominated sorting: points are visited in 
+    lexicographic order, so a point can only be dominated by points already
+    placed, and each point is placed in the first front that does not 
+    dominate it, found by binary search over the fronts. With two 
+    objectives a front dominates a point if and only if its last point 
+    does, so sorting is O(N log N). With three objectives each front keeps
+    a staircase of its best second and third objective values, so checking
+    a front is O(log N). With more objectives, block_size points at a time
+    are checked against each front in one numpy pass.
+
+    Args:  
+        objectives (np.ndarray):  
+            (n, m) matrix of objective values. nan counts as worst.  
+        num_needed (int):  
+            If passed, fronts stop being built once the first fronts hold 
+            at least num_needed points, and points of later fronts may be 
+            left unranked. Default None, meaning rank every point.  
+        block_size (int):  
+            Points checked at once when there are more than three 
+            objectives.
+
+    Returns:  
+        ranks (np.ndarray):  
+            Front of each point, 0 being the Pareto front. Unranked points
+            have rank n.
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    objectives = np.where(np.isnan(objectives), np.inf, objectives)
+    n, m = objectives.shape
+    ranks = np.full(n, n, dtype=np.int64)
+    if n == 0:
+        return ranks
+    order = np.lexsort(objectives.T[::-1])
+    ordered = objectives[order]
+    fronts = _Fronts(num_needed)
+    if m == 2:
+        # Last (lowest second objective) point of each front
+        last = []
+        for i, (first, second) in zip(order.tolist(), ordered.tolist()):
+            low, high = 0, fronts.limit()
+            while low < high:
+                mid = (low + high) // 2
+                last_first, last_second = last[mid]
+                if last_second < second or (last_second == second 
+                                            and last_first < first):
+                    low = mid + 1
+                else:
+                    high = mid
+            if fronts.place(low):
+                ranks[i] = low
+                if low == len(last):
+                    last.append(None)
+                last[low] = (first, second)
+        return ranks
+
+    if m == 3:
+        staircases = []
+        for i, point in zip(order.tolist(), ordered.tolist()):
+            low, high = 0, fronts.limit()
+            while low < high:
+                mid = (low + high) // 2
+                if staircases[mid].dominates(point):
+                    low = mid + 1
+                else:
+                    high = mid
+            if fronts.place(low):
+                ranks[i] = low
+                if low == len(staircases):
+                    staircases.append(_Staircase())
+                staircases[low].add(point)
+        return ranks
+
+    members = []
+    for start in range(0, n, block_size):
+        block = ordered[start:start + block_size]
+        active = min(len(members), fronts.limit())
+        # dominated[k][j] is True if front k dominates block point j
+        dominated = [np.any(np.all(front[None] <= block[:, None], axis=2) 
+                            & np.any(front[None] < block[:, None], axis=2),
+                            axis=1).tolist() for front in members[:active]]
+        # Bitmask of block points dominating each block point
+        within = (np.all(block[:, None] <= block[None], axis=2)
+                  & np.any(block[:, None] < block[None], axis=2))
+        packed = np.packbits(within, axis=0, bitorder='little')
+        dominators = [int.from_bytes(packed[:, j].tobytes(), 'little') 
+                      for j in range(len(block))]
+        placed = {}
+        for j, i in enumerate(order[start:start + block_size].tolist()):
+            low, high = 0, fronts.limit()
+            while low < high:
+                mid = (low + high) // 2
+                if ((mid < active and dominated[mid][j]) 
+                    or placed.get(mid, 0) & dominators[j]):
+                    low = mid + 1
+                else:
+                    high = mid
+            if fronts.place(low):
+                ranks[i] = low
+                placed[low] = placed.get(low, 0) | (1 << j)
+        for k, mask in placed.items():
+            rows = [j for j in range(len(block)) if mask >> j & 1]
+            if k == len(members):
+                members.append(block[rows])
+            elif k < len(members):
+                members[k] = np.concatenate([members[k], block[rows]])
+        del members[fronts.limit():]
+    return ranks
+
+
+class _Staircase:
+    """Front of three objective points visited in lexicographic order.
+
+    Every point added or queried later has a first objective at least as 
+    large as the points in the front, so a front point dominates a query 
+    if it is no worse in the second and third objectives and is not the 
+    same point. Only points not dominated in those two objectives are kept,
+    sorted by second objective with strictly falling third objective.
+    """
+    def __init__(self):
+        self.second = []
+        self.third = []
+        # Lowest first objective of points with exactly these values
+        self.first = []
+
+    def dominates(self, point) -> bool:
+        """Returns True if a point of the front dominates point"""
+        first, second, third = point
+        k = bisect_right(self.second, second) - 1
+        if k < 0 or self.third[k] > third:
+            return False
+        if self.third[k] < third or self.second[k] < second:
+            return True
+        return self.first[k] < first
+
+    def add(self, point):
+        """Adds point to the front"""
+        first, second, third = point
+        k = bisect_right(self.second, second) - 1
+        if k >= 0 and self.third[k] <= third:
+            if self.second[k] == second and self.third[k] == third:
+                self.first[k] = min(self.first[k], first)
+            return
+        # Drop points the new point dominates in second and third objective
+        start = bisect_left(self.second, second)
+        end = start
+        while end < len(self.third) and self.third[end] >= third:
+            end += 1
+        self.second[start:end] = [second]
+        self.third[start:end] = [third]
+        self.first[start:end] = [first]
+
+
+class _Fronts:
+    """Sizes of Pareto fronts while sorting, with the lazy front limit"""
+    def __init__(self, num_needed: int = None):
+        self.num_needed = num_needed
+        self.sizes = []
+        self.max_fronts = None
+        self.kept = 0
+
+    def limit(self) -> int:
+        """Returns number of fronts points may still be placed in"""
+        if self.max_fronts is None:
+            return len(self.sizes)
+        return self.max_fronts
+
+    def place(self, k: int) -> bool:
+        """Counts a point placed in front k. False if front k not needed."""
+        if self.max_fronts is not None and k >= self.max_fronts:
+            return False
+        if k == len(self.sizes):
+            self.sizes.append(0)
+        self.sizes[k] += 1
+        self.kept += 1
+        if self.num_needed is not None:
+            if self.max_fronts is None and self.kept >= self.num_needed:
+                self.max_fronts = len(self.sizes)
+            while (self.max_fronts is not None and self.max_fronts > 1
+                   and self.kept - self.sizes[self.max_fronts - 1] 
+                   >= self.num_needed):
+                self.max_fronts -= 1
+                self.kept -= self.sizes[self.max_fronts]
+        return True
+
+def crowding_distance(objectives: np.ndarray) -> np.ndarray:
+    """Returns NSGA-II crowding distance of points in one front.
+
+    Boundary points of each objective get an infinite distance.
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    n, m = objectives.shape
+    distance = np.zeros(n)
+    if n < 3:
+        return np.full(n, np.inf)
+    order = np.argsort(objectives, axis=0, kind='stable')
+    ordered = np.take_along_axis(objectives, order, axis=0)
+    spread = ordered[-1] - ordered[0]
+    spread[spread == 0] = np.inf
+    gaps = (ordered[2:] - ordered[:-2]) / spread
+    for j in range(m):
+        distance[order[1:-1, j]] += gaps[:, j]
+        distance[order[[0, -1], j]] = np.inf
+    return distance
+
+def select_nondominated(objectives: np.ndarray, num: int) -> np.ndarray:
+    """Returns positions of num points chosen by rank, then crowding.
+
+    Whole fronts are taken until the next one does not fit. The front that
+    does not fit is cut down to its least crowded points.
+    """
+    n = len(objectives)
+    if num <= 0:
+        # Nations left without parent slots
+        return np.zeros(0, dtype=int)
+    if num >= n:
+        return np.arange(n)
+    ranks = non_dominated_sort(objectives, num)
+    boundary = np.sort(ranks)[num - 1]
+    chosen = np.flatnonzero(ranks < boundary)
+    candidates = np.flatnonzero(ranks == boundary)
+    distance = crowding_distance(objectives[candidates])
+    keep = np.argsort(-distance, kind='stable')[:num - len(chosen)]
+    return np.concatenate([chosen, candidates[keep]])
+
+def objective_matrix(df: pd.DataFrame, objectives: Dict[str, str]
+                     ) -> np.ndarray:
+    """Returns objective values of df for minimization.
+
+    Args:  
+        df (pd.DataFrame):  
+            Dataframe with a column for each objective.  
+        objectives (Dict[str, str]):  
+            Keys are column names, values 'max' or 'min'.
+    """
+    signs = np.array([-1.0 if goal == 'max' else 1.0 for goal in 
+                      objectives.values()])
+    return df[list(objectives)].to_numpy(dtype=np.float64) * signs
+
+
+class ParetoArchive:
+    """Non-dominated polymers seen across generations.
+
+    Attributes:  
+        objectives (Dict[str, str]):  
+            Keys are property names, values 'max' or 'min'.  
+        max_size (int):  
+            If not None, the archive is cut to its least crowded max_size
+            polymers.  
+        members (pd.DataFrame):  
+            planetary_id and objective values of archived polymers.
+    """
+    def __init__(self, objectives: Dict[str, str], max_size: int = None):
+        for goal in objectives.values():
+            if goal not in ['max', 'min']:
+                raise ValueError("Choose a valid objective goal. {} invalid.".format(
+                    goal))
+        self.objectives = dict(objectives)
+        self.max_size = max_size
+        self.members = pd.DataFrame({'planetary_id': pd.Series(dtype=np.int64),
+            **{prop: pd.Series(dtype=np.float64) for prop in self.objectives}})
+
+    def __len__(self):
+        return len(self.members)
+
+    def update(self, df: pd.DataFrame):
+        """Adds the non-dominated polymers of df to the archive.
+
+        Only the Pareto front of df is merged, so the archive is never
+        sorted together with a whole population.
+        """
+        columns = ['planetary_id'] + list(self.objectives)
+        df = df[columns]
+        front = non_dominated_sort(objective_matrix(df, self.objectives), 1)
+        candidates = pd.concat([self.members, df.loc[front == 0]],
+                               ignore_index=True)
+        candidates = candidates.drop_duplicates('planetary_id', keep='last')
+        values = objective_matrix(candidates, self.objectives)
+        front = np.flatnonzero(non_dominated_sort(values, 1) == 0)
+        if self.max_size is not None and len(front) > self.max_size:
+            distance = crowding_distance(values[front])
+            front = front[np.argsort(-distance, kind='stable')[
+                :self.max_size]]
+            front.sort()
+        self.members = candidates.iloc[front].reset_index(drop=True)
+
+
+class NSGA2:
+    """Multi-objective selection scheme using non-dominated sorting.
+
+    Parents of each nationality are chosen by Pareto rank, and ties in the
+    last front that fits are broken by crowding distance, as in NSGA-II.
+
+    Attributes:  
+        objectives (Dict[str, str]):  
+            Keys are property names, values 'max' or 'min'.  
+        archive (ParetoArchive):  
+            Pareto front of every population selected from. None if not 
+            kept. Share one NSGA2 between nations for a planet wide archive.
+    """
+    def __init__(self, objectives: Dict[str, str], archive: bool = True,
+                 archive_size: int = None):
+        """Initialize NSGA-II selection.
+
+        Args:  
+            objectives (Dict[str, str]):  
+                Keys are property names, values 'max' or 'min'.  
+            archive (bool):  
+                If true, a ParetoArchive is kept across generations. 
+                Default True.  
+            archive_size (int):  
+                Maximum size of the archive. Default None, no maximum.
+        """
+        for goal in objectives.values():
+            if goal not in ['max', 'min']:
+                raise ValueError("Choose a valid objective goal. {} invalid.".format(
+                    goal))
+        self.objectives = dict(objectives)
+        if archive:
+            self.archive = ParetoArchive(self.objectives, archive_size)
+        else:
+            self.archive = None
+
+    def __call__(self, population: pd.DataFrame, 
+            num_parents_per_nationality: Dict[str, int]) -> pd.DataFrame:
+        """Selects parents of next generation by non-dominated sorting.
+       
+        Args:  
+            population (pd.DataFrame):  
+                Current population dataframe.  
+            num_parents_per_nationality (Dict[str, int]):  
+                Dictionary indicating how many parents should come from each nation.
+
+        Returns:  
+            df (pd.DataFrame):  
+                Parents of next generation. 
+        """
+        if self.archive is not None:
+            self.archive.update(population)
+        values = objective_matrix(population, self.objectives)
+        nations = population['birth_nation'].to_numpy()
+        positions = []
+        for nation in np.unique(nations):
+            members = np.flatnonzero(nations == nation)
+            # Nations without a quota, e.g. of immigrants, give no parents
+            chosen = select_nondominated(values[members], 
+                    num_parents_per_nationality.get(nation, 0))
+            positions.append(members[chosen])
+        return population.iloc[np.concatenate(positions)]
@@ -5,7 +5,7 @@ import itertools
 import numpy as np
 import pandas as pd
 from numpy.random import default_rng
-from rdkit import Chem
+from rdkit import Chem, RDLogger
 
 def longest_smiles(smiles):
     """Returns longest chain of polymer with more than two stars.
@@ -61,7 +61,10 @@ def chromosome_ids_to_smiles(chromosome_ids: list, chromosomes: dict,
     """Combined chromosome ids to create new polymer smiles
        
     Combines chromosomes sequentially according to index, but combines
-    joints randomly.
+    joints randomly. The polymer is assembled on the RDKit graph: joined
+    end atoms are removed and their neighbors bonded directly. If more than
+    two end atoms remain, only the two furthest apart are kept so a linear
+    chain is returned.
 
     Args:
         chromosome_ids (list): 
@@ -75,99 +78,75 @@ def chromosome_ids_to_smiles(chromosome_ids: list, chromosomes: dict,
     Returns (str):
         smiles string of combined chromosomes
     """
-    chromosomes = [chromosomes[chromosome_id] for 
-                   chromosome_id in chromosome_ids]
     mols_of_chromosomes = list()
-    for chromosome in chromosomes:
-        m = Chem.MolFromSmiles(chromosome)
+    for chromosome_id in chromosome_ids:
+        m = Chem.MolFromSmiles(chromosomes[chromosome_id])
         if m is not None:
             mols_of_chromosomes.append(m)
         # Error occurs
         else:
             return None
 
-    # Get Ids of 'Bi' atoms in each fragment
-    # edtg stands for symbols used in ladder polymers
-    mols_edtg = list()
-    mols_at_idx = list()
-
-    # Iterate for each fragment (m) in the list ms
-    for m, i in zip(mols_of_chromosomes, range(len(mols_of_chromosomes))):
-        at_idx = []  # Indices of Bi atoms in this fragment
-        num_atom_m = m.GetNumAtoms()  # Number of atoms in this fragment
-        atom_i = 0
-        for atom in m.GetAtoms():
-            atom_i = atom_i + 1
-            if atom.GetSymbol() == 'Bi':
-                at_idx.append(atom.GetIdx())
-            if atom_i == num_atom_m:
-                break
-        edtg = [''] * len(at_idx)
+    polymer = Chem.RWMol()
+    # End atoms ('Bi') still open on the polymer and joined end atoms to drop
+    open_ends = []
+    joined_ends = []
+    L_index_of_t = None
+    for m in mols_of_chromosomes:
+        offset = polymer.GetNumAtoms()
+        at_idx = [atom.GetIdx() + offset for atom in m.GetAtoms() 
+                  if atom.GetSymbol() == 'Bi']
+        # Select random end atoms to join to the previous ('e') and next 
+        # ('t') chromosomes
         temp_list_idx = list(range(len(at_idx)))
-
         temp_rnd_e = rng.choice(temp_list_idx)
-        edtg[temp_rnd_e] = 'e'
         temp_list_idx.remove(temp_rnd_e)
-
-        # Select random index and set the element of the index as 't'
         temp_rnd_t = rng.choice(temp_list_idx)
-        edtg[temp_rnd_t] = 't'
-        temp_list_idx.remove(temp_rnd_t)
-
-        mols_at_idx.append(at_idx)
-        mols_edtg.append(edtg)
-
-    # Convert edtg to endatom symbols
-    endatom = {
-               'e': ['Sb', 51], 't': ['Po', 84], 
-              }
-
-    for m, i in zip(mols_of_chromosomes, range(len(mols_of_chromosomes))):
-        for key in endatom.keys():
-            try:
-                m.GetAtomWithIdx(
-                    mols_at_idx[i][
-                        mols_edtg[i].index(key)
-                                ]
-                                ).SetAtomicNum(endatom[key][1])
-            except ValueError as e:
-                pass
-
-    # Time to connect fragments.
-
-    L_mol = mols_of_chromosomes[0]
-    L_n_atoms = mols_of_chromosomes[0].GetNumAtoms()
-    L_ms_edtg = mols_edtg[0]
-    L_ms_at_idx = mols_at_idx[0]
-
-    for i in range(1, len(mols_of_chromosomes)):
-        R_mol = mols_of_chromosomes[i]
-        R_ms_edtg = mols_edtg[i]
-        R_ms_at_idx = mols_at_idx[i]
-
-        # if 't' in L_ms_edtg and 'e' in R_ms_edtg:
-        L_index_of_t = L_ms_at_idx[L_ms_edtg.index('t')]
-        R_index_of_e = R_ms_at_idx[R_ms_edtg.index('e')]
-
-        combo = Chem.CombineMols(L_mol, R_mol)
-        edcombo = Chem.EditableMol(combo)
-
-        edcombo.AddBond(L_index_of_t, R_index_of_e + L_n_atoms, order=Chem.rdchem.BondType.SINGLE)
-
-        L_mol = edcombo.GetMol()
-        L_ms_edtg = [''] * len(L_ms_edtg)
-        L_ms_edtg.extend(mols_edtg[i])
-        L_ms_at_idx.extend([x + L_n_atoms for x in mols_at_idx[i]])
-        L_n_atoms = L_mol.GetNumAtoms()
-
-    SMILES_connected = Chem.MolToSmiles(L_mol)
-    SMILES_connected = SMILES_connected.replace("[Po][Sb]", "")
-    SMILES_connected = SMILES_connected.replace("[Sb][Po]", "")
-    SMILES_connected = SMILES_connected.replace("[Po]", "[*]")
-    SMILES_connected = SMILES_connected.replace("[Sb]", "[*]")
-    SMILES_connected = SMILES_connected.replace("[Bi]", "[*]")
-
-    if SMILES_connected.count('*') > 2:
-        SMILES_connected = longest_smiles(SMILES_connected)
-
-    return SMILES_connected
+        R_index_of_e = at_idx[temp_rnd_e]
+
+        polymer.InsertMol(m)
+        if L_index_of_t is None:
+            open_ends.append(R_index_of_e)
+        else:
+            _join(polymer, L_index_of_t, R_index_of_e)
+            joined_ends.extend([L_index_of_t, R_index_of_e])
+        open_ends.extend([idx for idx in at_idx 
+                          if idx != R_index_of_e and idx != at_idx[temp_rnd_t]])
+        L_index_of_t = at_idx[temp_rnd_t]
+    open_ends.append(L_index_of_t)
+
+    # Keep only the two ends furthest apart for a linear chain
+    if len(open_ends) > 2:
+        distances = Chem.GetDistanceMatrix(polymer)
+        end_distances = distances[np.ix_(open_ends, open_ends)]
+        i, j = np.unravel_index(np.argmax(np.triu(end_distances)), 
+                                end_distances.shape)
+        joined_ends.extend([idx for k, idx in enumerate(open_ends) 
+                            if k != i and k != j])
+        open_ends = [open_ends[i], open_ends[j]]
+
+    for idx in open_ends:
+        polymer.GetAtomWithIdx(int(idx)).SetAtomicNum(0)
+    for idx in sorted(joined_ends, reverse=True):
+        polymer.RemoveAtom(int(idx))
+    RDLogger.DisableLog('rdApp.*')
+    try:
+        Chem.SanitizeMol(polymer)
+    except Exception:
+        return ''
+    finally:
+        RDLogger.EnableLog('rdApp.*')
+
+    return Chem.MolToSmiles(polymer)
+
+def _join(polymer, L_index_of_t, R_index_of_e):
+    """Bonds neighbors of two end atoms together.
+
+    The bond takes the higher order of the two end atoms' bonds.
+    """
+    L_bond = polymer.GetAtomWithIdx(L_index_of_t).GetBonds()[0]
+    R_bond = polymer.GetAtomWithIdx(R_index_of_e).GetBonds()[0]
+    bond = max(L_bond, R_bond, key=lambda bond: bond.GetBondTypeAsDouble())
+    polymer.AddBond(L_bond.GetOtherAtomIdx(L_index_of_t),
+                    R_bond.GetOtherAtomIdx(R_index_of_e),
+                    bond.GetBondType())
@@ -7,26 +7,14 @@ import matplotlib.pyplot as plt
 
 import polyga.analysis as pga
 save_loc = 'Planet_Silly'
-df, fp_df = pga.load_planet(save_loc)
 
-for col in df.columns:
-    print(col)
-
-
-def plot_average_lengths(df):
+def plot_average_lengths(save_loc):
     """Plots average lengths of polymers vs generation for all settled_nations"""
-    gens = max(df.generation) + 1
-    x = np.linspace(0, gens, gens)
-    settled_nations = np.unique(df.settled_nation.values)
+    stats = pga.generation_statistics(save_loc, ['num_chromosomes'])
     legend = []
-    for settled_nation in settled_nations:
-        tdf = df.loc[df['settled_nation'] == settled_nation]
-        means = []
-        for gen in range(gens):
-            tdf_ = tdf.loc[tdf['generation'] == gen]
-            mean = tdf_.num_chromosomes.mean()
-            means.append(mean)
-        plt.plot(x, means)
+    for settled_nation in stats.index.unique('settled_nation'):
+        means = stats.xs(settled_nation, level='settled_nation')
+        plt.plot(means.index, means[('num_chromosomes', 'mean')])
         legend.append(settled_nation)
     plt.ylabel('Number of Blocks')
     plt.xlabel('Generation')
@@ -34,56 +22,29 @@ def plot_average_lengths(df):
     plt.savefig(save_loc + '/length_avg.png')
     plt.clf()
 
-def plot_property_averages(df):
+def plot_property_averages(save_loc):
     """Plots property averages for all settled_nations and displays them separately."""
     properties = ['Polymer_Coolness', 'Polymer_Funnyness','Polymer_Intelligence']
-    settled_nations = np.unique(df.settled_nation.values)
-    for settled_nation in settled_nations:
-        means = []
-        maxes = []
-        mins = []
-        stds = []
-        tdf = df.loc[df.settled_nation == settled_nation]
-        for prop in properties:
-            mean = []
-            std = []
-            max_ = []
-            min_ = []
-            for i in range(max(tdf.generation) + 1):
-                tdf_ = tdf.loc[tdf['generation'] == i]
-                mean.append(tdf_[prop].mean())
-                std.append(tdf_[prop].std())
-                max_.append(max(tdf_[prop]))
-                min_.append(min(tdf_[prop]))
-            means.append(mean)
-            stds.append(std)
-            maxes.append(max_)
-            mins.append(min_)
-
+    stats = pga.generation_statistics(save_loc, properties)
+    for settled_nation in stats.index.unique('settled_nation'):
+        tdf = stats.xs(settled_nation, level='settled_nation')
         fig, axes = plt.subplots(nrows=2, ncols=2, figsize=[16,9])
-        x = np.linspace(0, max(tdf.generation), max(tdf.generation)+1)
-        x = [val + 1 for val in x]
+        x = [gen + 1 for gen in tdf.index]
         row = 0
         col = 0
-        curr = 0
         for prop in properties:
-            max_ = maxes[curr]
-            min_ = mins[curr]
-            mean = means[curr]
-            std = stds[curr]
-            upper = [mean[i] + std[i] for i in range(len(mean))]
-            lower = [mean[i] - std[i] for i in range(len(mean))]
-            axes[row][col].fill_between(x, min_, max_, alpha=0.5, 
-                color='darkblue'
+            mean = tdf[(prop, 'mean')]
+            std = tdf[(prop, 'std')]
+            axes[row][col].fill_between(x, tdf[(prop, 'min')], 
+                tdf[(prop, 'max')], alpha=0.5, color='darkblue'
             )
-            axes[row][col].fill_between(x, lower, upper, alpha=0.5, 
+            axes[row][col].fill_between(x, mean - std, mean + std, alpha=0.5, 
                 color='lightblue'
             )
-            axes[row][col].plot(x, means[curr], lw=2, c='darkred')
+            axes[row][col].plot(x, mean, lw=2, c='darkred')
             axes[row][col].set_ylabel(prop)
-            axes[row][col].set_xlim([1,max(tdf.generation)+1])
+            axes[row][col].set_xlim([1, max(x)])
             axes[row][col].set_xscale("log")
-            curr += 1
             col += 1
             if col > 1:
                 col = 0
@@ -93,5 +54,5 @@ def plot_property_averages(df):
         plt.savefig(save_loc + '/' + settled_nation + '_property_avgs.png')
         plt.clf()
 
-plot_property_averages(df)
-plot_average_lengths(df)
+plot_property_averages(save_loc)
+plot_average_lengths(save_loc)
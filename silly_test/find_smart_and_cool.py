@@ -5,7 +5,7 @@ from sklearn.preprocessing import MinMaxScaler
 
 import polyga.analysis as pga
 save_loc = 'Planet_Silly'
-df, fp_df = pga.load_planet(save_loc)
+df, fp_df = pga.load_planet(save_loc, cache=True)
 
 def find_smart_and_cool(df):
     """Finds smart and cool polymers and saves them to file."""
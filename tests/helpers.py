@@ -0,0 +1,27 @@
+"""Fake fingerprint, predict, and fitness functions shared by the tests"""
+from collections import defaultdict
+
+import pandas as pd
+
+def fingerprint(df):
+    fp_dict = defaultdict(list)
+    columns = df.columns
+    for index, row in df.iterrows():
+        fp_dict['fp_1'].append(index)
+        fp_dict['fp_2'].append(len(df)-index)
+        fp_dict['fp_3'].append((len(df)-index)/2)
+        fp_dict['fp_4'].append(index % 2)
+        for col in columns:
+            fp_dict[col].append(row[col])
+    fp_df = pd.DataFrame.from_dict(fp_dict)
+    fp_headers = [col for col in fp_df.columns if 'fp_' in col]
+    return fp_df, fp_headers
+
+def predict(df, fp_headers, models):
+    df['prop_1'] = [index % 3 for index in df.index]
+    df['prop_2'] = [index * 2 for index in df.index]
+    return df
+
+def fitness(df, fp_headers):
+    df['fitness'] = df['prop_1']
+    return df
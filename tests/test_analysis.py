@@ -7,11 +7,18 @@ import sqlite3
 from collections import defaultdict
 import random
 
+import numpy as np
 import pandas as pd
+from sqlalchemy import create_engine
 
 from polyga import polygod as pg
 from polyga import utils, selection_schemes
 from polyga import analysis as pga
+from polyga.fingerprints import Fingerprinter, FingerprintStore
+from polyga.models import Polymer
+
+from helpers import predict
+
 def nothing():
     print("test")
 
@@ -32,11 +39,6 @@ def fingerprint(df):
     fp_headers = [col for col in fp_df.columns if 'fp_' in col]
     return fp_df, fp_headers
 
-def predict(df, fp_headers, models):
-    df['prop_1'] = [index % 3 for index in df.index]
-    df['prop_2'] = [index * 2 for index in df.index]
-    return df
-
 def fitness(df, fp_headers):
     df['fitness'] = 1
     return df
@@ -73,6 +75,270 @@ def test_load_planet():
 
     shutil.rmtree('Planet_Silly')
 
+calls = []
+
+def alternating_fingerprint(df):
+    # fp_4 comes and goes between generations
+    calls.append(len(df))
+    fp_df, fp_headers = fingerprint(df)
+    fp_df['fp_4'] = [float(i) for i in range(len(df))]
+    if len(calls) % 2 == 0:
+        fp_df = fp_df.drop(columns='fp_4')
+    return fp_df, [col for col in fp_df.columns if 'fp_' in col]
+
+def test_load_planet_cache():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=alternating_fingerprint,
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land, 
+                           num_population_initial=40,
+                           num_families=5, num_children_per_family=6
+                           )
+    def check():
+        df, fp_df = pga.load_planet('Planet_Silly')
+        cached_df, cached_fp_df = pga.load_planet('Planet_Silly', cache=True)
+        pd.testing.assert_frame_equal(cached_df, df)
+        pd.testing.assert_frame_equal(cached_fp_df, fp_df)
+        with open(os.path.join('Planet_Silly', 'load_planet_cache', 
+                               'meta.json')) as f:
+            return json.load(f)
+
+    planet.advance_time()
+    assert check()['generation'] == 0
+    for i in range(2):
+        planet.advance_time()
+    meta = check()
+    assert meta['generation'] == 2
+    assert set(meta['fp_block']['columns']) == {'fp_1', 'fp_2', 'fp_3', 
+                                                'fp_4'}
+    # One file for all fingerprints
+    assert not any(name.startswith('fp_') and name != 'fp_block' for name 
+                   in os.listdir(os.path.join('Planet_Silly', 
+                                              'load_planet_cache')))
+    assert check() == meta
+    # Census rolled back and rewritten, e.g., by PolyPlanet.resume
+    planet.census.rollback(planet.name, {nation.name: 2})
+    assert check()['generation'] == 1
+    planet.complete_run()
+    shutil.rmtree('Planet_Silly')
+
+def test_cache_fingerprint_block(tmp_path):
+    block = {'file': 'fp_block', 'columns': {}}
+    first = pd.DataFrame({'fp_1': [1, 2], 'fp_2': [0.5, 1.5]})
+    second = pd.DataFrame({'fp_2': [2.5], 'fp_3': [3]})
+    pga._cache_append_block(str(tmp_path), block, first, 0)
+    assert np.dtype(block['columns']['fp_1']) == np.int64
+    # fp_3 is new, so the block is rewritten with a column of nan
+    pga._cache_append_block(str(tmp_path), block, second, 2)
+    assert list(block['columns']) == ['fp_1', 'fp_2', 'fp_3']
+    # Columns with nan read back as float
+    assert [np.dtype(dtype) for dtype in block['columns'].values()] == [
+            np.float64] * 3
+    values = pga._cache_read_block(str(tmp_path), block, 3)
+    np.testing.assert_array_equal(values, [[1, 0.5, np.nan], 
+                                           [2, 1.5, np.nan],
+                                           [np.nan, 2.5, 3]])
+    assert os.listdir(str(tmp_path)) == ['fp_block']
+
+def test_similarity_index():
+    fingerprinter = Fingerprinter('morgan', num_bits=256, 
+                                  protocol='dataframe')
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprinter,
+            random_seed=2
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land, 
+                           num_population_initial=60,
+                           num_families=5, num_children_per_family=6
+                           )
+    for i in range(2):
+        planet.advance_time()
+    planet.complete_run()
+    df, fp_df = pga.load_planet('Planet_Silly')
+    fps = fp_df.sort_index().fillna(0).to_numpy()
+    ids = fp_df.sort_index().index.to_numpy()
+    def brute_force(fp):
+        common = fps @ fp
+        return common / (fp @ fp + (fps * fps).sum(axis=1) - common)
+
+    index = pga.SimilarityIndex.build('Planet_Silly')
+    assert len(index) == len(df)
+    assert index.generation == 1
+    query = int(ids[7])
+    nearest = index.nearest(query, k=5)
+    expected = brute_force(fps[7])
+    assert nearest.planetary_id.iloc[0] == query
+    assert nearest.similarity.iloc[0] == 1
+    assert np.allclose(nearest.similarity, np.sort(expected)[::-1][:5])
+    within = index.within(query, threshold=0.5)
+    assert set(within.planetary_id) == set(ids[expected >= 0.5])
+    smiles = df.set_index('planetary_id').smiles_string[query]
+    pd.testing.assert_frame_equal(index.within(smiles, threshold=0.5), 
+                                  within)
+    # Smiles not in the planet are fingerprinted
+    new_smiles = '[*]CC(c1ccccc1)C(F)(F)[*]'
+    with pytest.raises(ValueError):
+        index.nearest(new_smiles)
+    new_fp = fingerprinter(pd.DataFrame({'planetary_id': [0], 
+        'smiles_string': [new_smiles]}))[0][fp_df.columns].to_numpy()[0]
+    assert np.allclose(index.nearest(new_smiles, k=len(df), 
+        fingerprint_function=fingerprinter).similarity, 
+        np.sort(np.nan_to_num(brute_force(new_fp)))[::-1])
+    with pytest.raises(ValueError):
+        index.nearest(query, approximate=True)
+
+    index = pga.SimilarityIndex.build('Planet_Silly', lsh=True, 
+                                      lsh_bands=32, lsh_rows=2)
+    index.save('Planet_Silly')
+    loaded = pga.SimilarityIndex.load('Planet_Silly')
+    approximate = loaded.within(query, threshold=0.5)
+    assert approximate.planetary_id.iloc[0] == query
+    assert set(approximate.planetary_id) <= set(within.planetary_id)
+    # Most of the close polymers share a band
+    assert len(approximate) >= 0.5 * len(within)
+    pd.testing.assert_frame_equal(loaded.nearest(query, k=5, 
+                                                 approximate=False), nearest)
+    pd.testing.assert_frame_equal(loaded.nearest(query), 
+                                  index.nearest(query))
+    shutil.rmtree('Planet_Silly')
+
+def test_similarity_index_smiles(tmp_path):
+    smiles = ['[*]CC(C)[*]', '[*]CC(c1ccccc1)[*]', '[*]CC[*]']
+    store = FingerprintStore.from_matrix(np.array([[1, 1, 0], [0, 1, 1],
+                                                   [1, 0, 0]]), 
+                                         ['fp_1', 'fp_2', 'fp_3'])
+    index = pga.SimilarityIndex(np.array([3, 1, 2]), smiles, store)
+    assert index.smiles.dtype == object
+    assert index.smiles.tolist() == [smiles[1], smiles[2], smiles[0]]
+    # Polypropylene written another way is found without fingerprinting
+    nearest = index.nearest('[*]C(C)C[*]', k=1)
+    assert nearest.planetary_id.to_list() == [3]
+    assert nearest.smiles_string.to_list() == ['[*]CC(C)[*]']
+    index.save(str(tmp_path))
+    loaded = pga.SimilarityIndex.load(str(tmp_path))
+    assert loaded.smiles.dtype == object
+    assert loaded.smiles.tolist() == index.smiles.tolist()
+
+def make_pedigree(folder):
+    # Founders 1, 2, 3. 4 = 1 x 2, 5 = 4 x 3, 6 = 4 x 5
+    engine = create_engine("sqlite:///{}".format(os.path.join(folder,
+        'planetary_database.sqlite')))
+    Polymer.__table__.create(engine)
+    rows = [(1, 0, 0, 0), (2, 0, 0, 0), (3, 0, 0, 0), (4, 1, 2, 1),
+            (5, 4, 3, 2), (6, 4, 5, 3)]
+    conn = sqlite3.connect(os.path.join(folder, 'planetary_database.sqlite'))
+    conn.executemany("INSERT INTO polymer VALUES (?, ?, ?, 0, 1, '[*]C[*]', "
+            + "'land', 'nation', 'planet', '[1]', ?, 'planet', 'land', "
+            + "'nation', '{}', '{}')", rows)
+    conn.commit()
+    conn.close()
+
+def test_lineage(tmp_path):
+    make_pedigree(str(tmp_path))
+    tree = pga.ancestors(str(tmp_path), 6)
+    assert tree.planetary_id.to_list() == [6, 4, 5, 1, 2, 3]
+    assert tree.depth.to_list() == [0, 1, 1, 2, 2, 2]
+    assert pga.ancestors(str(tmp_path), 6, max_depth=1).planetary_id.to_list(
+            ) == [6, 4, 5]
+    family = pga.descendants(str(tmp_path), 1)
+    assert family.planetary_id.to_list() == [4, 5, 6]
+    assert family.depth.to_list() == [1, 2, 2]
+    assert pga.descendant_count(str(tmp_path), 4) == 2
+    assert pga.descendant_count(str(tmp_path), 3, max_depth=1) == 1
+    assert pga.descendant_count(str(tmp_path), 6) == 0
+    contributions = pga.founder_contributions(str(tmp_path), 6)
+    assert contributions.to_dict() == {1: 0.375, 2: 0.375, 3: 0.25}
+
+def make_shards(folder, num_shards):
+    # Pedigree split by planetary_id into num_shards databases
+    make_pedigree(folder)
+    database = os.path.join(folder, 'planetary_database.sqlite')
+    os.mkdir(os.path.join(folder, 'shards'))
+    for i in range(num_shards):
+        shard = os.path.join(folder, 'shards', 'nation_{}.sqlite'.format(i))
+        shutil.copy(database, shard)
+        conn = sqlite3.connect(shard)
+        conn.execute("DELETE FROM polymer WHERE planetary_id % ? != ?", 
+                     (num_shards, i))
+        conn.commit()
+        conn.close()
+    os.remove(database)
+
+@pytest.mark.parametrize('num_shards', [3, 12])
+def test_sharded_lineage(tmp_path, num_shards):
+    # 12 shards is more than SQLite attaches by default
+    make_shards(str(tmp_path), num_shards)
+    conn = pga.connect(str(tmp_path))
+    assert conn.execute("SELECT COUNT(*) FROM polymer").fetchone()[0] == 6
+    conn.close()
+    tree = pga.ancestors(str(tmp_path), 6)
+    assert tree.planetary_id.to_list() == [6, 4, 5, 1, 2, 3]
+    assert pga.descendant_count(str(tmp_path), 4) == 2
+    contributions = pga.founder_contributions(str(tmp_path), 6)
+    assert contributions.to_dict() == {1: 0.375, 2: 0.375, 3: 0.25}
+
+def test_generation_statistics(tmp_path):
+    folder = str(tmp_path)
+    make_pedigree(folder)
+    rng = np.random.default_rng(0)
+    conn = sqlite3.connect(os.path.join(folder, 'planetary_database.sqlite'))
+    rows = [(i, int(rng.integers(1, 6)), int(rng.integers(3)), 
+             'nation_{}'.format(i % 2), 
+             json.dumps({'prop': float(rng.normal()), 'other': i}))
+            for i in range(7, 107)]
+    conn.executemany("INSERT INTO polymer VALUES (?, 0, 0, 0, ?, '[*]C[*]', "
+            + "'land', 'nation', 'planet', '[1]', ?, 'planet', 'land', ?, "
+            + "'{}', ?)", rows)
+    conn.commit()
+    conn.close()
+    df = pd.DataFrame(rows, columns=['planetary_id', 'num_chromosomes', 
+                                     'generation', 'settled_nation', 
+                                     'properties'])
+    df['prop'] = [json.loads(props)['prop'] for props in df.properties]
+    stats = pga.generation_statistics(folder, ['prop', 'num_chromosomes'],
+                                      quantiles=[0.1, 0.5])
+    # Pedigree polymers have no prop
+    assert stats.loc[(1, 'nation'), ('num_chromosomes', 'count')] == 1
+    assert np.isnan(stats.loc[(1, 'nation'), ('prop', 'mean')])
+    stats = stats.drop(index='nation', level='settled_nation')
+    groups = df.groupby(['generation', 'settled_nation'])
+    for prop in ['prop', 'num_chromosomes']:
+        expected = groups[prop].agg(['count', 'mean', 'std', 'min', 'max'])
+        expected['10%'] = groups[prop].quantile(0.1)
+        expected['50%'] = groups[prop].quantile(0.5)
+        pd.testing.assert_frame_equal(stats[prop], expected, 
+                                      check_dtype=False, check_names=False)
+    by_generation = pga.generation_statistics(folder, 'other', 
+                                              by='generation')
+    assert by_generation[('other', 'count')].to_list() == [
+            (df.generation == 0).sum(), (df.generation == 1).sum(),
+            (df.generation == 2).sum(), 0]
+    # Default quantiles
+    others = pd.Series([json.loads(props)['other'] for props in 
+                        df.properties]).groupby(df.generation)
+    for q in [0.25, 0.5, 0.75]:
+        assert np.allclose(by_generation[('other', '{:g}%'.format(q * 100))
+                           ].to_numpy()[:3], others.quantile(q).to_numpy())
+    assert list(pga.generation_statistics(folder, 'other', by='generation',
+            quantiles=[])['other'].columns) == ['count', 'mean', 'std', 
+                                                'min', 'max']
+    with pytest.raises(ValueError):
+        pga.generation_statistics(folder, 'prop', by='smiles_string')
+
 def test_delete():
     try:
         shutil.rmtree('Planet_Silly')
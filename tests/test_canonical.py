@@ -0,0 +1,37 @@
+import pytest
+
+import pandas as pd
+
+from polyga.canonical import chromosome_key, polymer_key
+from polyga import analysis as pga
+
+def test_chromosome_key():
+    key = chromosome_key([1, 2, 3, 4])
+    for ids in [[3, 4, 1, 2], [4, 1, 2, 3], [4, 3, 2, 1], [2, 1, 4, 3]]:
+        assert chromosome_key(ids) == key
+    assert chromosome_key([1, 3, 2, 4]) != key
+    assert chromosome_key([]) == ()
+
+def test_polymer_key_shift_and_direction():
+    key = polymer_key('[*]CC(C)[*]')
+    for smiles in ['[*]C(C)C[*]', '[*]C(C[*])C', '*CC(*)C', 
+                   'C[CH]([*])[CH2][*]']:
+        assert polymer_key(smiles) == key
+    assert polymer_key('[*]CC(Cl)[*]') != key
+    key = polymer_key('[*]CC(=O)O[*]')
+    for smiles in ['[*]OC(=O)C[*]', '[*]C(=O)OC[*]']:
+        assert polymer_key(smiles) == key
+
+def test_polymer_key_single_backbone_atom():
+    assert polymer_key('[*]C(Cl)[*]') == polymer_key('[*]C([*])Cl')
+
+def test_polymer_key_fallbacks():
+    assert polymer_key('CCO') == 'CCO'
+    assert polymer_key('not a smiles') == 'not a smiles'
+
+def test_unique_polymers():
+    df = pd.DataFrame()
+    df['planetary_id'] = [1, 2, 3]
+    df['smiles_string'] = ['[*]CC(C)[*]', '[*]CC[*]', '[*]C(C)C[*]']
+    unique = pga.unique_polymers(df)
+    assert unique.planetary_id.to_list() == [1, 2]
@@ -0,0 +1,160 @@
+import pytest
+import shutil
+import os
+
+import pandas as pd
+
+from polyga import polygod as pg
+from polyga import utils, analysis
+
+from helpers import fingerprint, predict, fitness
+
+def run_planet(census_backend, census_shard_by='nation'):
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            random_seed=4,
+            census_backend=census_backend,
+            census_shard_by=census_shard_by
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    for name, seed in [('Cool', 5), ('Silly', 6)]:
+        pg.PolyNation(name, land, num_population_initial=40, 
+                      num_families=5, num_children_per_family=6,
+                      random_seed=seed)
+    for i in range(3):
+        planet.advance_time()
+    planet.complete_run()
+
+def test_invalid_census_backend():
+    with pytest.raises(ValueError):
+        planet = pg.PolyPlanet('Planet_Silly', 
+                predict_function=predict,
+                fingerprint_function=fingerprint,
+                census_backend='wrong'
+                )
+    shutil.rmtree('Planet_Silly', ignore_errors=True)
+
+def test_parquet_census():
+    pytest.importorskip('pyarrow')
+    run_planet('sqlite')
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    shutil.rmtree('Planet_Silly')
+    run_planet('parquet')
+    parquet_df, store = analysis.load_census('Planet_Silly', 
+                                             fingerprints=True)
+    fps = pd.DataFrame(store.to_dense(), columns=store.headers, 
+            index=parquet_df.planetary_id).sort_index()
+    parquet_df = parquet_df.sort_values('planetary_id')
+    df = df.sort_values('planetary_id')
+    for col in ['planetary_id', 'parent_1_id', 'parent_2_id', 
+                'smiles_string', 'generation', 'settled_nation', 'prop_1',
+                'prop_2']:
+        assert parquet_df[col].to_list() == df[col].to_list()
+    assert [list(ids) for ids in parquet_df.chromosome_ids] == (
+            df.chromosome_ids.to_list())
+    pd.testing.assert_frame_equal(fps, fp_df.loc[fps.index, fps.columns], 
+                                  check_dtype=False, check_names=False)
+    pruned, store = analysis.load_census('Planet_Silly', 
+            columns=['planetary_id', 'prop_1'], nations=['Cool'], 
+            generations=[1])
+    assert store is None
+    assert list(pruned.columns) == ['settled_nation', 'generation', 
+                                    'planetary_id', 'prop_1']
+    assert set(pruned.settled_nation) == {'Cool'}
+    assert set(pruned.generation) == {1}
+    shutil.rmtree('Planet_Silly')
+
+def test_sharded_census():
+    run_planet('sqlite')
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    ancestors = analysis.ancestors('Planet_Silly', df.planetary_id.max())
+    shutil.rmtree('Planet_Silly')
+    for shard_by, shards in [('nation', ['Cool.sqlite', 'Silly.sqlite']), 
+                             ('land', ['Awesomeland.sqlite'])]:
+        run_planet('sharded', shard_by)
+        assert sorted(os.listdir(os.path.join('Planet_Silly', 'shards'))
+                      ) == shards
+        assert not os.path.exists(os.path.join('Planet_Silly', 
+                                               'planetary_database.sqlite'))
+        sharded_df, sharded_fp_df = analysis.load_planet('Planet_Silly')
+        sharded_df = sharded_df.sort_values('planetary_id', 
+                                            ignore_index=True)
+        pd.testing.assert_frame_equal(sharded_df, df.sort_values(
+            'planetary_id', ignore_index=True))
+        pd.testing.assert_frame_equal(sharded_fp_df.sort_index(), 
+                                      fp_df.sort_index())
+        assert sharded_df.planetary_id.is_unique
+        pd.testing.assert_frame_equal(analysis.ancestors('Planet_Silly', 
+            df.planetary_id.max()), ancestors)
+        shutil.rmtree('Planet_Silly')
+
+def test_invalid_census_shard_key():
+    with pytest.raises(ValueError):
+        planet = pg.PolyPlanet('Planet_Silly', 
+                predict_function=predict,
+                fingerprint_function=fingerprint,
+                census_backend='sharded',
+                census_shard_by='wrong'
+                )
+    shutil.rmtree('Planet_Silly', ignore_errors=True)
+
+def test_live_reads():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            random_seed=4
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    for name, seed in [('Cool', 5), ('Silly', 6)]:
+        pg.PolyNation(name, land, num_population_initial=40, 
+                      num_families=5, num_children_per_family=6,
+                      random_seed=seed)
+    assert analysis.latest_generation('Planet_Silly') == -1
+    planet.advance_time()
+    df, fp_df, latest = analysis.tail('Planet_Silly')
+    assert latest == 0
+    assert set(df.generation) == {0}
+    assert len(fp_df) == len(df)
+    # An open read transaction neither blocks the census nor sees it
+    conn = analysis.connect('Planet_Silly')
+    conn.execute("BEGIN")
+    count = conn.execute("SELECT COUNT(*) FROM polymer").fetchone()[0]
+    planet.advance_time()
+    assert conn.execute("SELECT COUNT(*) FROM polymer").fetchone()[0] == (
+            count)
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM polymer").fetchone()[0] > (
+            count)
+    conn.close()
+    new_df, new_fp_df, latest = analysis.tail('Planet_Silly', latest)
+    assert latest == 1
+    assert set(new_df.generation) == {1}
+    assert not set(new_df.planetary_id) & set(df.planetary_id)
+    assert analysis.tail('Planet_Silly', latest)[0].empty
+    conn = analysis.connect('Planet_Silly')
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    log = pd.read_sql("SELECT * FROM census_log", conn)
+    conn.close()
+    assert sorted(zip(log.settled_nation, log.generation)) == [
+            ('Cool', 0), ('Cool', 1), ('Silly', 0), ('Silly', 1)]
+    assert log.groupby('generation').num_polymers.sum().to_list() == [
+            len(df), len(new_df)]
+    planet.complete_run()
+    shutil.rmtree('Planet_Silly')
+
+def test_delete():
+    try:
+        shutil.rmtree('Planet_Silly')
+    except:
+        pass
@@ -4,29 +4,15 @@ import os
 import json
 import pickle
 import sqlite3
-from collections import defaultdict
-
-import pandas as pd
 
 from polyga import polygod as pg
 from polyga import utils, selection_schemes
+
+from helpers import fingerprint
+
 def nothing():
     print("test")
 
-def fingerprint(df):
-    fp_dict = defaultdict(list)
-    columns = df.columns
-    for index, row in df.iterrows():
-        fp_dict['fp_1'].append(index)
-        fp_dict['fp_2'].append(len(df)-index)
-        fp_dict['fp_3'].append((len(df)-index)/2)
-        fp_dict['fp_4'].append(index % 2)
-        for col in columns:
-            fp_dict[col].append(row[col])
-    fp_df = pd.DataFrame.from_dict(fp_dict)
-    fp_headers = [col for col in fp_df.columns if 'fp_' in col]
-    return fp_df, fp_headers
-
 def predict(df, fp_headers, models):
     df['prop_1'] = [index % 3 for index in df.index]
     df['prop_2'] = [index * 2 for index in df.index]
@@ -109,3 +95,67 @@ def test_num_cpus():
     planet.complete_run()
     shutil.rmtree('Planet_Silly')
 
+
+def changes_properties(df, fp_headers):
+    df['fitness'] = 1
+    df['prop_1'] = 0
+    return df
+
+def changes_fingerprints(df, fp_headers):
+    df.loc[:, fp_headers] = 0
+    df['fitness'] = 1
+    return df
+
+@pytest.mark.parametrize('fitness_function', [changes_properties,
+                                              changes_fingerprints])
+def test_callback_contract(fitness_function):
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            callback_contract='validate'
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness_function
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+            selection_scheme=selection_schemes.elite, 
+            num_population_initial=180,
+            )
+    with pytest.raises(ValueError) as e_info:
+        planet.advance_time()
+    planet.complete_run()
+    shutil.rmtree('Planet_Silly')
+
+def test_invalid_callback_contract():
+    with pytest.raises(ValueError) as e_info:
+        planet = pg.PolyPlanet('Planet_Silly', 
+                predict_function=predict,
+                fingerprint_function=fingerprint,
+                callback_contract='wrong'
+                )
+    shutil.rmtree('Planet_Silly', ignore_errors=True)
+
+def test_invalid_storage():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            )
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+    with pytest.raises(ValueError) as e_info:
+        nation = pg.PolyNation('UnitedPolymersOfCool', land, storage='wrong')
+    shutil.rmtree('Planet_Silly', ignore_errors=True)
+
+def test_invalid_fingerprint_protocol():
+    with pytest.raises(ValueError) as e_info:
+        planet = pg.PolyPlanet('Planet_Silly', 
+                predict_function=predict,
+                fingerprint_function=fingerprint,
+                fingerprint_protocol='wrong'
+                )
+    shutil.rmtree('Planet_Silly', ignore_errors=True)
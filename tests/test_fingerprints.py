@@ -0,0 +1,171 @@
+import pytest
+import shutil
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem, DataStructs
+from rdkit.Chem import AllChem
+
+from polyga import fingerprints
+from polyga import polygod as pg
+from polyga import utils, selection_schemes, analysis
+from polyga.fingerprints import FingerprintStore, Fingerprinter
+
+def random_matrix(n=20, num_bits=150, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.integers(0, 2, (n, num_bits)).astype(np.float64)
+    matrix[:, 7] = 0
+    matrix[3] = 0
+    # A count column is kept dense
+    matrix[:, 11] = rng.integers(0, 5, n)
+    return matrix
+
+def headers(num_bits=150):
+    return ['fp_{}'.format(i) for i in range(num_bits)]
+
+def test_pack_bits():
+    bits = random_matrix()[:, :100] > 0
+    words = fingerprints.pack_bits(bits)
+    assert words.dtype == np.uint64
+    assert words.shape == (20, 2)
+    assert np.array_equal(fingerprints.unpack_bits(words, 100), bits)
+    assert fingerprints.popcount(words).tolist() == bits.sum(axis=1).tolist()
+
+def test_store_round_trip():
+    matrix = random_matrix()
+    store = FingerprintStore.from_matrix(matrix, headers())
+    assert store.dense_headers == ['fp_11']
+    assert store.shape == (20, 150)
+    assert np.array_equal(store.to_dense(), matrix)
+    df = store.to_frame(np.array([2, 5]))
+    assert list(df.columns) == headers()
+    assert np.array_equal(df.to_numpy(), matrix[[2, 5]])
+    frame_store = FingerprintStore.from_frame(pd.DataFrame(matrix,
+        columns=headers()), headers())
+    assert frame_store.bit_headers == store.bit_headers
+    assert np.array_equal(frame_store.bits, store.bits)
+
+def test_kernels():
+    matrix = random_matrix()
+    store = FingerprintStore.from_matrix(matrix, headers())
+    dots = matrix @ matrix[0]
+    self_dots = (matrix ** 2).sum(axis=1)
+    tanimoto = dots / (self_dots[0] + self_dots - dots)
+    dice = 2 * dots / (self_dots[0] + self_dots)
+    hamming = np.abs(matrix - matrix[0]).sum(axis=1)
+    assert np.allclose(store.tanimoto(0), tanimoto)
+    assert np.allclose(store.dice(0), dice)
+    assert np.allclose(store.hamming(0), hamming)
+    assert np.allclose(store.tanimoto(0, np.array([4, 1])), tanimoto[[4, 1]])
+
+def test_empty_fingerprints_similarity():
+    store = FingerprintStore.from_matrix(np.zeros((3, 4)), headers(4))
+    assert np.all(np.isnan(store.tanimoto(0)))
+    assert np.all(np.isnan(store.dice(0)))
+    assert store.hamming(0).tolist() == [0, 0, 0]
+
+def test_concat_and_drop_zero_columns():
+    one = FingerprintStore.from_matrix(np.array([[1, 0], [1, 0]]),
+                                       ['fp_a', 'fp_b'])
+    two = FingerprintStore.from_matrix(np.array([[3, 1]]), ['fp_a', 'fp_c'])
+    store = FingerprintStore.concat([one, two])
+    assert store.headers == ['fp_a', 'fp_b', 'fp_c']
+    assert store.dense_headers == ['fp_a']
+    assert store.to_dense().tolist() == [[1, 0, 0], [1, 0, 0], [3, 0, 1]]
+    store.drop_zero_columns()
+    assert store.headers == ['fp_a', 'fp_c']
+    assert store.columns(['fp_c', 'fp_x']).tolist() == [[0, 0], [0, 0],
+                                                        [1, 0]]
+
+SMILES = ['[*]CC([*])c1ccccc1', 'not a smiles', '[*]C[Se][*]', '[e]CC([t])C',
+          '']
+
+def test_fingerprint_smiles():
+    fps, failures = fingerprints.fingerprint_smiles(SMILES, radius=3,
+                                                    num_bits=512)
+    assert fps.shape == (5, 512)
+    assert failures.tolist() == [1, 4]
+    assert fps[failures].sum() == 0
+    for i in [0, 2]:
+        reference = np.zeros(0)
+        DataStructs.ConvertToNumpyArray(AllChem.GetMorganFingerprintAsBitVect(
+            Chem.MolFromSmiles(SMILES[i]), 3, nBits=512), reference)
+        assert np.array_equal(fps[i], reference)
+    # Ladder symbols are connection points
+    assert np.array_equal(fps[3], fingerprints.fingerprint_smiles(
+        ['[*]CC([*])C'], radius=3, num_bits=512)[0][0])
+    packed, _ = fingerprints.fingerprint_smiles(SMILES, radius=3,
+                                                num_bits=512, packed=True)
+    assert np.array_equal(packed, fingerprints.pack_bits(fps))
+    counts, _ = fingerprints.fingerprint_smiles(SMILES, radius=3,
+                                                num_bits=512, counts=True)
+    assert np.array_equal(counts > 0, fps > 0)
+    assert counts.max() > 1
+
+@pytest.mark.parametrize('kind', ['rdkit', 'maccs'])
+def test_fingerprint_kinds(kind):
+    fps, failures = fingerprints.fingerprint_smiles(SMILES, kind=kind)
+    assert failures.tolist() == [1, 4]
+    assert fps[0].sum() > 0
+
+def test_invalid_fingerprints():
+    with pytest.raises(ValueError):
+        fingerprints.fingerprint_smiles(SMILES, kind='wrong')
+    with pytest.raises(ValueError):
+        fingerprints.fingerprint_smiles(SMILES, kind='maccs', counts=True)
+    with pytest.raises(ValueError):
+        Fingerprinter(protocol='wrong')
+
+def predict(df, matrix, fp_headers, models):
+    df['prop_1'] = np.asarray(matrix).sum(axis=1)
+    return df
+
+def predict_frame(df, fp_headers, models):
+    return predict(df, df[fp_headers].values, fp_headers, models)
+
+def fitness(df, fp_headers):
+    df['fitness'] = df['prop_1']
+    return df
+
+@pytest.mark.parametrize('protocol', ['matrix', 'dataframe'])
+def test_fingerprinter(protocol):
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict if protocol == 'matrix' else predict_frame,
+            fingerprint_function=Fingerprinter(num_bits=256, 
+                                               protocol=protocol),
+            fingerprint_protocol=protocol,
+            num_cpus=2,
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+            selection_scheme=selection_schemes.elite, 
+            partner_selection='diversity', 
+            num_population_initial=40,
+            )
+    planet.advance_time()
+    planet.complete_run()
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    assert len(df) != 0
+    assert df['prop_1'].tolist() == fp_df.sum(axis=1).tolist()
+    shutil.rmtree('Planet_Silly')
+
+def test_minibatch_kmeans():
+    rng = np.random.default_rng(0)
+    # Three groups of fingerprints with different bits set
+    groups = np.repeat(np.arange(3), 200)
+    matrix = (rng.random((600, 192)) < 0.05).astype(np.uint8)
+    for group in range(3):
+        matrix[groups == group, group * 64:(group + 1) * 64] |= (
+            rng.random((200, 64)) < 0.9)
+    store = FingerprintStore.from_matrix(matrix, headers(192))
+    labels, centers = fingerprints.minibatch_kmeans(store, 3, rng,
+                                                    batch_size=100)
+    assert centers.shape == (3, 192)
+    for group in range(3):
+        assert len(np.unique(labels[groups == group])) == 1
+    assert len(np.unique(labels)) == 3
@@ -0,0 +1,59 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from polyga import fitness
+from polyga.fitness import WeightedSum, Desirability, Penalty
+
+def population():
+    return pd.DataFrame({'cool': [1.0, 3.0, 2.0, 5.0],
+                         'smart': [10.0, 0.0, 5.0, 5.0],
+                         'funny': [4.0, 4.0, 4.0, 4.0]})
+
+def test_weighted_sum_matches_loop():
+    df = population()
+    properties = ['cool', 'smart', 'funny']
+    expected = []
+    scaled = {prop: (df[prop] - df[prop].min()) / 
+              (df[prop].max() - df[prop].min()) if df[prop].nunique() > 1
+              else df[prop] * 0 for prop in properties}
+    for i in range(len(df)):
+        expected.append(sum(1/3 * scaled[prop][i] for prop in properties))
+    df = WeightedSum({prop: 1/3 for prop in properties})(df, [])
+    assert np.allclose(df['fitness'], expected)
+
+def test_weighted_sum_goals():
+    df = WeightedSum({'cool': 1.0}, scaling='none', minimize=['cool'])(
+            population(), [])
+    assert df['fitness'].tolist() == [-1.0, -3.0, -2.0, -5.0]
+    df = WeightedSum({'cool': 1.0}, scaling='none', targets={'cool': 2.5})(
+            population(), [])
+    assert df['fitness'].tolist() == [-1.5, -0.5, -0.5, -2.5]
+    df = WeightedSum({'cool': 1.0, 'smart': 2.0}, scaling='none', 
+                     ranges={'cool': (2, 3)})(population(), [])
+    assert df['fitness'].tolist() == [19.0, 0.0, 10.0, 8.0]
+    df = WeightedSum({'smart': 1.0}, scaling='zscore')(population(), [])
+    assert np.isclose(df['fitness'].mean(), 0)
+    assert np.isclose(df['fitness'].std(ddof=0), 1)
+
+def test_desirability():
+    df = Desirability({'cool': (1, 5), 'smart': (0, 10)}, 
+                      goals={'smart': 'min'})(population(), [])
+    assert np.allclose(df['fitness'], [0.0, np.sqrt(0.5), np.sqrt(0.25 * 0.5),
+                                       np.sqrt(0.5)])
+    d = fitness.desirability(np.array([[1.0], [2.0], [3.0], [5.0]]), [1], [5],
+                             ['target'], [2])
+    assert np.allclose(d[:, 0], [0, 1, 2/3, 0])
+
+def test_penalties():
+    df = WeightedSum({'cool': 1.0}, scaling='none', penalties=[
+        Penalty('smart', high=5, weight=0.5), 
+        Penalty('cool', low=2, hard=True)])(population(), [])
+    assert df['fitness'].tolist() == [-np.inf, 3.0, 2.0, 5.0]
+
+def test_invalid_fitness():
+    with pytest.raises(ValueError):
+        WeightedSum({'cool': 1.0}, scaling='wrong')
+    with pytest.raises(ValueError):
+        Desirability({'cool': (0, 1)}, goals={'cool': 'wrong'})
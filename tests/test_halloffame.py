@@ -0,0 +1,99 @@
+import pytest
+import shutil
+import os
+
+import numpy as np
+import pandas as pd
+
+from polyga import polygod as pg
+from polyga import utils, analysis
+from polyga.canonical import polymer_key
+
+from helpers import fingerprint
+
+def predict(df, fp_headers, models):
+    # Scores with few ties, so the best polymers are well defined
+    df['prop_1'] = [len(smiles) + sum(map(ord, smiles)) % 997 / 1000
+                    for smiles in df.smiles_string]
+    df['prop_2'] = [index % 3 for index in df.index]
+    return df
+
+def fitness(df, fp_headers):
+    df['fitness'] = -df['prop_1']
+    return df
+
+def short(df):
+    return -df['smiles_string'].str.len().to_numpy() - df['prop_1'] / 1000
+
+def best(df, scores, size):
+    df = df.assign(score=scores, canonical_key=[polymer_key(smiles) for
+                                                smiles in df.smiles_string])
+    df = df.sort_values(['score', 'planetary_id'], ascending=[False, True])
+    return df.drop_duplicates('canonical_key').head(size)
+
+def test_hall_of_fame():
+    planet = pg.PolyPlanet('Planet_Silly',
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            random_seed=3,
+            hall_of_fame_size=8,
+            hall_of_fame_scores={'prop_1': 'prop_1', 'short': short,
+                                 'missing': 'prop_3'}
+            )
+
+    land = pg.PolyLand('Awesomeland', planet,
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    for name, seed in [('Cool', 5), ('Silly', 6)]:
+        pg.PolyNation(name, land, num_population_initial=40,
+                      num_families=5, num_children_per_family=6,
+                      random_seed=seed)
+    for i in range(3):
+        planet.advance_time()
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    fame = analysis.load_hall_of_fame('Planet_Silly')
+    assert set(fame.archive) == {'fitness:Awesomeland', 'prop_1', 'short'}
+    for archive, scores in [('fitness:Awesomeland', -df.prop_1),
+                            ('prop_1', df.prop_1),
+                            ('short', short(df))]:
+        expected = best(df, scores.to_numpy(), 8)
+        saved = fame[fame.archive == archive]
+        assert saved['rank'].to_list() == list(range(8))
+        assert saved.planetary_id.to_list() == (
+                expected.planetary_id.to_list())
+        assert np.allclose(saved.score, expected.score)
+        assert saved.canonical_key.is_unique
+    pd.testing.assert_frame_equal(
+            planet.hall_of_fame.to_frame('prop_1'),
+            analysis.load_hall_of_fame('Planet_Silly', 'prop_1'),
+            check_dtype=False)
+    planet.complete_run()
+    shutil.rmtree('Planet_Silly')
+
+def test_hall_of_fame_off():
+    # Off unless a size is given
+    planet = pg.PolyPlanet('Planet_Silly',
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            )
+
+    land = pg.PolyLand('Awesomeland', planet,
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('Cool', land, num_population_initial=20)
+    planet.advance_time()
+    planet.complete_run()
+    assert planet.hall_of_fame.to_frame().empty
+    assert not os.path.exists(os.path.join('Planet_Silly',
+                                           'hall_of_fame.sqlite'))
+    shutil.rmtree('Planet_Silly')
+
+def test_delete():
+    try:
+        shutil.rmtree('Planet_Silly')
+    except:
+        pass
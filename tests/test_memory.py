@@ -0,0 +1,83 @@
+import pytest
+import shutil
+import tracemalloc
+
+import numpy as np
+
+from polyga import polygod as pg
+from polyga import utils
+from polyga.memory import MemoryMonitor, parse_size
+
+from helpers import fingerprint, predict, fitness
+
+def test_parse_size():
+    assert parse_size(None) is None
+    assert parse_size(1024) == 1024
+    assert parse_size('512MB') == 512 * 2**20
+    assert parse_size('1.5 gb') == 3 * 2**29
+    assert parse_size('100') == 100
+
+def test_monitor_records_phases():
+    memory = MemoryMonitor(trace=True)
+    with memory.phase('nation', 0, 'allocate'):
+        values = np.ones(10**6)
+    df = memory.to_frame()
+    assert df.phase.to_list() == ['allocate']
+    assert df.allocated_peak[0] >= values.nbytes
+    assert df.rss_peak[0] >= df.rss_start[0]
+    assert not df.under_pressure[0]
+
+def test_monitor_without_reset_peak(monkeypatch):
+    # tracemalloc.reset_peak is new in python 3.9
+    monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+    memory = MemoryMonitor(trace=True)
+    tracemalloc.start(5)
+    try:
+        traced = np.ones(10)
+        with memory.phase('nation', 0, 'first'):
+            values = np.ones(10**6)
+        del values
+        with memory.phase('nation', 0, 'second'):
+            values = np.ones(10**5)
+        # The user's tracing is left as it was
+        assert tracemalloc.get_traceback_limit() == 5
+        assert tracemalloc.get_object_traceback(traced) is not None
+    finally:
+        tracemalloc.stop()
+    df = memory.to_frame()
+    assert df.allocated_peak[0] >= 8 * 10**6
+    # The first phase's peak doesn't leak into the second
+    assert 8 * 10**5 <= df.allocated_peak[1] < 8 * 10**6
+
+def test_memory_budget(caplog):
+    planet = pg.PolyPlanet('Planet_Silly',
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            memory_budget=1,
+            chunk_size=1000
+            )
+
+    land = pg.PolyLand('Awesomeland', planet,
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+                           num_population_initial=30
+                           )
+    planet.advance_time()
+    planet.complete_run()
+    records = planet.memory.to_frame()
+    assert {'initial_population', 'fingerprint', 'fitness', 'selection',
+            'census', 'births'} <= set(records.phase)
+    assert records.under_pressure.all()
+    assert nation.storage == 'memmap'
+    assert planet.chunk_size == 100
+    assert 'selection phase of UnitedPolymersOfCool' in caplog.text
+    shutil.rmtree('Planet_Silly')
+
+def test_delete():
+    try:
+        shutil.rmtree('Planet_Silly')
+    except:
+        pass
@@ -0,0 +1,126 @@
+import pytest
+import shutil
+import os
+import pickle
+import sqlite3
+
+import pandas as pd
+
+from polyga import polygod as pg
+from polyga import utils, selection_schemes
+from polyga.novelty import BloomFilter, NoveltyIndex
+
+from helpers import fingerprint, predict, fitness
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(str(i))
+    for i in range(1000):
+        assert str(i) in bloom
+    false_positives = sum(str(i) in bloom for i in range(1000, 11000))
+    assert false_positives < 300
+    assert len(bloom) == 1000
+
+@pytest.mark.parametrize('kind', ['set', 'bloom'])
+def test_novelty_index(kind):
+    novelty = NoveltyIndex(kind, capacity=1000)
+    novelty.add('[*]CC([*])C', [1, 2])
+    assert novelty.has_chromosomes([1, 2])
+    assert novelty.has_chromosomes([2, 1])
+    assert not novelty.has_chromosomes([2, 1, 3])
+    assert novelty.has_smiles('[*]C(C)C[*]')
+    assert novelty.has_smiles('[*]C(C[*])C')
+    assert not novelty.has_smiles('[*]CC[*]')
+
+def test_invalid_novelty_index():
+    with pytest.raises(ValueError):
+        NoveltyIndex('wrong')
+
+def test_no_rebirth():
+    planet = pg.PolyPlanet('Planet_Silly',
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            random_seed=2,
+            novelty_index='set',
+            novelty_retries=20
+            )
+
+    land = pg.PolyLand('Awesomeland', planet,
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+            selection_scheme=selection_schemes.elite,
+            partner_selection='random',
+            num_population_initial=60,
+            num_families=5,
+            random_seed=3
+            )
+    for i in range(3):
+        planet.advance_time()
+    planet.complete_run()
+    conn = sqlite3.connect(os.path.join('Planet_Silly',
+        'planetary_database.sqlite')
+    )
+    df = pd.read_sql("SELECT * FROM polymer", conn)
+    conn.close()
+    assert df.str_chromosome_ids.duplicated().sum() == 0
+    keys = [NoveltyIndex.smiles_key(smiles) for smiles in df.smiles_string]
+    assert len(set(keys)) == len(keys)
+
+    novelty = NoveltyIndex('set')
+    novelty.rehydrate(os.path.join('Planet_Silly',
+        'planetary_database.sqlite'))
+    for smiles in df.smiles_string:
+        assert novelty.has_smiles(smiles)
+    shutil.rmtree('Planet_Silly')
+
+def test_checkpoint_without_novelty():
+    planet = pg.PolyPlanet('Planet_Silly',
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            novelty_index='set'
+            )
+
+    land = pg.PolyLand('Awesomeland', planet,
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+            num_population_initial=40,
+            num_families=5,
+            )
+    planet.advance_time()
+    planet.advance_time()
+    planet.checkpoint(novelty=False)
+    keys = set(planet.novelty.keys)
+    assert len(keys) != 0
+    planet.complete_run()
+    with open(os.path.join('Planet_Silly', 'checkpoint.pkl'), 'rb') as f:
+        assert len(pickle.load(f).novelty) == 0
+    planet = pg.PolyPlanet.resume('Planet_Silly')
+    # Rebuilt from the census and the children born since it
+    assert planet.novelty.keys == keys
+    planet.complete_run()
+    shutil.rmtree('Planet_Silly')
+
+def test_checkpoint_without_novelty_parquet():
+    planet = pg.PolyPlanet('Planet_Silly',
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            novelty_index='set',
+            census_backend='parquet'
+            )
+    with pytest.raises(ValueError):
+        planet.checkpoint(novelty=False)
+    assert planet.novelty is not None
+    shutil.rmtree('Planet_Silly')
+
+def test_delete():
+    try:
+        shutil.rmtree('Planet_Silly')
+    except:
+        pass
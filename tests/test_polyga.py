@@ -4,29 +4,20 @@ import os
 import json
 import pickle
 import sqlite3
-from collections import defaultdict
 
+import numpy as np
 import pandas as pd
+from scipy import sparse
 
 from polyga import polygod as pg
-from polyga import utils, selection_schemes
+from polyga import utils, selection_schemes, analysis
+from polyga.fingerprints import FingerprintStore
+
+from helpers import fingerprint
+
 def nothing():
     print("test")
 
-def fingerprint(df):
-    fp_dict = defaultdict(list)
-    columns = df.columns
-    for index, row in df.iterrows():
-        fp_dict['fp_1'].append(index)
-        fp_dict['fp_2'].append(len(df)-index)
-        fp_dict['fp_3'].append((len(df)-index)/2)
-        fp_dict['fp_4'].append(index % 2)
-        for col in columns:
-            fp_dict[col].append(row[col])
-    fp_df = pd.DataFrame.from_dict(fp_dict)
-    fp_headers = [col for col in fp_df.columns if 'fp_' in col]
-    return fp_df, fp_headers
-
 def predict(df, fp_headers, models):
     df['prop_1'] = [index % 3 for index in df.index]
     df['prop_2'] = [index * 2 for index in df.index]
@@ -95,3 +86,465 @@ def test_delete():
         shutil.rmtree('Planet_Silly')
     except:
         pass
+
+def test_readonly_callbacks():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            callback_contract='validate'
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+            selection_scheme=selection_schemes.elite, 
+                           partner_selection='diversity', 
+                           num_population_initial=180,
+                           )
+    planet.advance_time()
+    planet.advance_time()
+    planet.complete_run()
+    conn = sqlite3.connect(os.path.join('Planet_Silly', 
+        'planetary_database.sqlite')
+    )
+    df = pd.read_sql("SELECT * FROM polymer", conn)
+    conn.close()
+    assert set(df.generation) == {0, 1}
+    for index, row in df.iterrows():
+        assert list(json.loads(row['properties']).keys()) == ['prop_1', 'prop_2']
+    shutil.rmtree('Planet_Silly')
+
+def fitness_without_fingerprints(df, fp_headers):
+    assert not any(col in df.columns for col in fp_headers)
+    df['fitness'] = df['prop_1']
+    return df
+
+def test_packed_fingerprints():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness_without_fingerprints,
+            fitness_fingerprints=False
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+            selection_scheme=selection_schemes.elite, 
+                           partner_selection='diversity', 
+                           num_population_initial=100,
+                           )
+    planet.advance_time()
+    planet.advance_time()
+    planet.complete_run()
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    planetary_ids, store = analysis.load_fingerprint_store('Planet_Silly')
+    assert planetary_ids.tolist() == df.planetary_id.tolist()
+    assert store.headers == list(fp_df.columns)
+    assert store.to_dense().tolist() == fp_df.fillna(0).values.tolist()
+    assert 'fp_4' in store.bit_headers
+    # Chunks have different columns of bits, e.g. fp_1 is 0 or 1 in the first
+    planetary_ids, chunked = analysis.load_fingerprint_store('Planet_Silly',
+                                                             chunk_size=2)
+    assert planetary_ids.tolist() == df.planetary_id.tolist()
+    assert chunked.headers == store.headers
+    assert chunked.bit_headers == store.bit_headers
+    assert chunked.to_dense().tolist() == store.to_dense().tolist()
+    shutil.rmtree('Planet_Silly')
+
+def fingerprint_matrix(df):
+    # Same fingerprints as fingerprint, but the last polymer fails
+    df = df.iloc[:-1]
+    index = np.arange(len(df))
+    matrix = np.column_stack([index, len(df) - index, (len(df) - index) / 2,
+                              index % 2])
+    return (df['planetary_id'].values, sparse.csr_matrix(matrix), 
+            ['fp_1', 'fp_2', 'fp_3', 'fp_4'])
+
+def fingerprint_dropping_last(df):
+    return fingerprint(df.iloc[:-1].reset_index(drop=True))
+
+def predict_matrix(df, matrix, fp_headers, models):
+    assert sparse.issparse(matrix)
+    assert matrix.shape == (len(df), len(fp_headers))
+    return predict(df, fp_headers, models)
+
+def run_protocol(fingerprint_protocol):
+    if fingerprint_protocol == 'matrix':
+        fingerprint_function = fingerprint_matrix
+        predict_function = predict_matrix
+    else:
+        fingerprint_function = fingerprint_dropping_last
+        predict_function = predict
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict_function,
+            fingerprint_function=fingerprint_function,
+            fingerprint_protocol=fingerprint_protocol,
+            random_seed=4
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness_without_fingerprints,
+            fitness_fingerprints=False
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+            selection_scheme=selection_schemes.elite, 
+                           partner_selection='diversity', 
+                           num_population_initial=60,
+                           random_seed=5
+                           )
+    planet.advance_time()
+    planet.advance_time()
+    planet.complete_run()
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    shutil.rmtree('Planet_Silly')
+    return df, fp_df
+
+def test_matrix_fingerprint_protocol():
+    df, fp_df = run_protocol('dataframe')
+    matrix_df, matrix_fp_df = run_protocol('matrix')
+    assert len(df) != 0
+    pd.testing.assert_frame_equal(df, matrix_df)
+    pd.testing.assert_frame_equal(fp_df, matrix_fp_df)
+
+def elite_with_fingerprints(df, num_parents_per_nationality):
+    assert 'fp_1' in df.columns
+    return selection_schemes.elite(df, num_parents_per_nationality)
+
+def elite_without_fingerprints(df, num_parents_per_nationality):
+    assert 'fp_1' not in df.columns
+    return selection_schemes.elite(df, num_parents_per_nationality)
+
+def test_selection_fingerprints():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            callback_contract='validate'
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    pg.PolyNation('UnitedPolymersOfCool', land,
+                  selection_scheme=elite_with_fingerprints,
+                  num_population_initial=40,
+                  num_families=5, num_children_per_family=6,
+                  )
+    pg.PolyNation('UnitedPolymersOfSilly', land,
+                  selection_scheme=elite_without_fingerprints,
+                  selection_fingerprints=False,
+                  num_population_initial=40,
+                  num_families=5, num_children_per_family=6,
+                  )
+    planet.advance_time()
+    planet.advance_time()
+    planet.complete_run()
+    shutil.rmtree('Planet_Silly')
+
+def mating_nation(partner_selection):
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+                           num_population_initial=20,
+                           partner_selection=partner_selection
+                           )
+    planet.complete_run()
+    shutil.rmtree('Planet_Silly')
+    population = nation.population.take(np.arange(6))
+    population.fitness = np.arange(6, dtype=np.float64)
+    # No two parents alike, so diversity takes them in order
+    population.fingerprints = FingerprintStore.from_matrix(np.eye(6), 
+            ['fp_{}'.format(i) for i in range(6)])
+    nation.population = population
+    return nation
+
+def test_mating_keeps_selection_order():
+    nation = mating_nation('diversity')
+    ids = nation.population.planetary_id
+    # Lowest fitness first, e.g. a scheme ranking on something else
+    families = nation._PolyNation__mating(np.arange(6))
+    assert families == [list(ids[:3]), list(ids[3:])]
+    families = nation._PolyNation__mating(np.arange(6)[::-1])
+    assert families == [list(ids[:2:-1]), list(ids[2::-1])]
+
+def test_cluster_mating_sorts_by_fitness():
+    nation = mating_nation('cluster')
+    families = nation._PolyNation__mating(np.arange(6))
+    # Highest fitness parent chooses first
+    assert families[0][0] == nation.population.planetary_id[5]
+
+def test_cluster_partner_selection():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness_without_fingerprints,
+            fitness_fingerprints=False
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+            selection_scheme=selection_schemes.elite, 
+                           partner_selection='cluster', 
+                           num_partner_clusters=4,
+                           num_population_initial=100,
+                           )
+    planet.advance_time()
+    planet.advance_time()
+    planet.complete_run()
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    parents = df.loc[(df.generation == 0) & (df.is_parent == 1)]
+    children = df.loc[df.generation == 1]
+    assert len(parents) == 41
+    assert set(children.parent_1_id) <= set(parents.planetary_id)
+    shutil.rmtree('Planet_Silly')
+
+def initial_population(num_cpus):
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            chunk_size=7,
+            novelty_index='set'
+            )
+    # Past the cap on the machine's cores, so the pool always runs
+    planet.num_cpus = num_cpus
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+                           num_population_initial=30,
+                           num_chromosomes_initial=1,
+                           random_seed=5
+                           )
+    shutil.rmtree('Planet_Silly')
+    return nation.population
+
+def test_streamed_initial_population():
+    one = initial_population(1)
+    two = initial_population(2)
+    assert len(one) > 20
+    assert one.planetary_id.tolist() == list(range(1, len(one) + 1))
+    assert one.smiles.tolist() == two.smiles.tolist()
+    assert one.chromosomes.tolist() == two.chromosomes.tolist()
+
+def smiles_or_ids(chromosome_ids, chromosomes, rng, **kwargs):
+    # Returns the chromosome ids instead of smiles for odd first ids
+    if chromosome_ids[0] % 2:
+        return chromosome_ids
+    return utils.chromosome_ids_to_smiles(chromosome_ids, chromosomes, rng)
+
+def test_non_string_smiles_are_invalid():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            chunk_size=7
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=smiles_or_ids,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+                           num_population_initial=30,
+                           )
+    shutil.rmtree('Planet_Silly')
+    assert 0 < len(nation.population) < 30
+    assert all(isinstance(smiles, str) for smiles in nation.population.smiles)
+    assert all(nation.population.chromosome_ids(i)[0] % 2 == 0 
+               for i in range(len(nation.population)))
+
+def run_storage(storage):
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            random_seed=4,
+            chunk_size=7
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nations = [pg.PolyNation(name, land, num_population_initial=40,
+                             random_seed=seed, storage=storage)
+               for name, seed in [('Cool', 5), ('Silly', 6)]]
+    planet.advance_time()
+    planet.advance_time()
+    planet.complete_run()
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    if storage == 'memmap':
+        # Only the files of the last scored population are kept
+        folder = os.path.join('Planet_Silly', 'memmap', 'Cool')
+        folders = os.listdir(folder)
+        assert len(folders) == 1
+        assert 'dense.npy' in os.listdir(os.path.join(folder, folders[0]))
+    shutil.rmtree('Planet_Silly')
+    return df, fp_df
+
+def test_memmap_storage():
+    df, fp_df = run_storage('memory')
+    memmap_df, memmap_fp_df = run_storage('memmap')
+    pd.testing.assert_frame_equal(df, memmap_df)
+    pd.testing.assert_frame_equal(fp_df, memmap_fp_df)
+
+fingerprinted = []
+
+def counting_fingerprint(df):
+    fingerprinted.append(len(df))
+    return fingerprint(df)
+
+def run_checkpointed(crash):
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=counting_fingerprint,
+            random_seed=4,
+            novelty_index='set',
+            checkpoint_interval=2
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    for name, seed in [('Cool', 5), ('Silly', 6)]:
+        pg.PolyNation(name, land, num_population_initial=40,
+                      num_families=5, num_children_per_family=6,
+                      random_seed=seed)
+    for i in range(3):
+        planet.advance_time()
+    if crash:
+        # Lose the planet after the age 2 checkpoint was taken
+        planet.complete_run()
+        del planet, land
+        num_fingerprinted = len(fingerprinted)
+        planet = pg.PolyPlanet.resume('Planet_Silly')
+        assert planet.age == 2
+        planet.advance_time()
+        assert len(fingerprinted) == num_fingerprinted
+        planet.advance_time()
+    planet.advance_time()
+    planet.complete_run()
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    shutil.rmtree('Planet_Silly')
+    return df, fp_df
+
+def test_checkpoint_resume():
+    df, fp_df = run_checkpointed(crash=False)
+    resumed_df, resumed_fp_df = run_checkpointed(crash=True)
+    pd.testing.assert_frame_equal(df, resumed_df)
+    pd.testing.assert_frame_equal(fp_df, resumed_fp_df)
+
+def test_warm_start_from_planet():
+    planet = pg.PolyPlanet('Planet_Silly', 
+            predict_function=predict,
+            fingerprint_function=fingerprint,
+            random_seed=4
+            )
+
+    land = pg.PolyLand('Awesomeland', planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    nation = pg.PolyNation('UnitedPolymersOfCool', land,
+                           num_population_initial=40,
+                           num_families=5, num_children_per_family=6
+                           )
+    planet.advance_time()
+    planet.advance_time()
+    planet.complete_run()
+    df, fp_df = analysis.load_planet('Planet_Silly')
+    top = df.loc[df.generation == 1].sort_values('prop_2', 
+                                                 ascending=False)[:10]
+
+    warm_planet = pg.PolyPlanet(os.path.join('Planet_Silly', 'Warm'), 
+            predict_function=predict,
+            fingerprint_function=counting_fingerprint,
+            random_seed=4
+            )
+
+    warm_land = pg.PolyLand('Awesomeland', warm_planet, 
+            generative_function=utils.chromosome_ids_to_smiles,
+            fitness_function=fitness
+            )
+
+    warm_nation = pg.PolyNation('UnitedPolymersOfCool', warm_land,
+            num_families=2, num_children_per_family=6,
+            initial_planet='Planet_Silly', 
+            initial_planet_filters={'generation': 1, 'top_k': 10, 
+                                    'by': 'prop_2'})
+    num_fingerprinted = len(fingerprinted)
+    warm_planet.advance_time()
+    assert len(fingerprinted) == num_fingerprinted
+    warm_planet.advance_time()
+    warm_planet.complete_run()
+    warm_df, warm_fp_df = analysis.load_planet(
+            os.path.join('Planet_Silly', 'Warm'))
+    first = warm_df.loc[warm_df.generation == 0]
+    assert first.smiles_string.to_list() == top.smiles_string.to_list()
+    assert first.prop_2.to_list() == top.prop_2.to_list()
+    assert (warm_fp_df.loc[first.planetary_id].to_numpy() 
+            == fp_df.loc[top.planetary_id, warm_fp_df.columns].to_numpy()
+            ).all()
+    # Warm-started polymers are founders of the new planet
+    assert (first.parent_1_id == 0).all() and (first.parent_2_id == 0).all()
+    child = warm_df.loc[warm_df.generation == 1].planetary_id.iloc[0]
+    tree = analysis.ancestors(os.path.join('Planet_Silly', 'Warm'), child)
+    assert set(tree.planetary_id) - {child} <= set(first.planetary_id)
+    contributions = analysis.founder_contributions(
+            os.path.join('Planet_Silly', 'Warm'), child)
+    assert set(contributions.index) <= set(first.planetary_id)
+    assert np.isclose(contributions.sum(), 1)
+    shutil.rmtree('Planet_Silly')
+
+def round_robin(capacities, total):
+    # Handing out one at a time, as __selection used to
+    given = [0] * len(capacities)
+    capacities = list(capacities)
+    handed_out = 0
+    while handed_out != total:
+        no_more = True
+        for i in range(len(capacities)):
+            if capacities[i] > 0:
+                capacities[i] -= 1
+                given[i] += 1
+                handed_out += 1
+                no_more = False
+            if handed_out == total:
+                break
+        if no_more:
+            break
+    return given
+
+def test_allocate_evenly():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        capacities = rng.integers(0, 8, rng.integers(0, 6))
+        total = int(rng.integers(0, 30))
+        assert (pg.allocate_evenly(capacities, total).tolist() 
+                == round_robin(capacities, total))
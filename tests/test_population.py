@@ -0,0 +1,91 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from polyga.fingerprints import FingerprintStore
+from polyga.population import Birthplaces, Population
+
+def make_population(birthplaces, ids, nation='one'):
+    code = birthplaces.code('planet', 'land', nation)
+    chromosome_ids = [[i, i + 1] if i % 2 else [i] for i in ids]
+    return Population.from_records(birthplaces, ids, [0] * len(ids),
+            [0] * len(ids), code, ['[*]C[*]'] * len(ids), chromosome_ids)
+
+def test_birthplaces():
+    birthplaces = Birthplaces()
+    assert birthplaces.code('p', 'l', 'a') == 0
+    assert birthplaces.code('p', 'l', 'b') == 1
+    assert birthplaces.code('p', 'l', 'a') == 0
+    assert list(birthplaces.decode(np.array([1, 0]), 2)) == ['b', 'a']
+
+def test_take_and_positions():
+    population = make_population(Birthplaces(), [5, 6, 7, 8])
+    assert population.num_chromosomes.tolist() == [2, 1, 2, 1]
+    positions = population.positions([8, 5])
+    assert positions.tolist() == [3, 0]
+    subset = population.take(positions)
+    assert subset.planetary_id.tolist() == [8, 5]
+    assert subset.chromosome_ids(0) == [8]
+    assert subset.chromosome_ids(1) == [5, 6]
+    with pytest.raises(KeyError):
+        population.positions([9])
+
+def test_frame_round_trip():
+    population = make_population(Birthplaces(), [1, 2, 3])
+    df = population.to_frame()
+    assert df.birth_nation.to_list() == ['one'] * 3
+    assert df.chromosome_ids.to_list() == [[1, 2], [2], [3, 4]]
+    # User function drops a polymer and adds fingerprints and properties
+    df = df.loc[df.planetary_id != 2].copy()
+    df['fp_a'] = [1, 0]
+    df['fp_b'] = [0, 0]
+    df['prop'] = [0.5, 1.5]
+    population.absorb(df, ['fp_a', 'fp_b'])
+    assert population.planetary_id.tolist() == [1, 3]
+    assert population.fingerprints.to_dense().tolist() == [[1, 0], [0, 0]]
+    assert population.properties['prop'].tolist() == [0.5, 1.5]
+    df = population.to_frame()
+    df['fitness'] = df['prop'] * 2
+    population.absorb(df)
+    assert population.fitness.tolist() == [1.0, 3.0]
+    assert population.fp_headers == ['fp_a', 'fp_b']
+    population.drop_zero_columns()
+    assert population.fp_headers == ['fp_a']
+    assert population.fingerprints.shape == (2, 1)
+
+def test_shared_frame():
+    population = make_population(Birthplaces(), [1, 2])
+    population.fingerprints = FingerprintStore.from_matrix(
+            np.array([[1, 0.5], [0, 0]]), ['fp_a', 'fp_b'])
+    df = population.to_frame(share=True)
+    assert df[['fp_a', 'fp_b']].values.tolist() == [[1, 0.5], [0, 0]]
+    with pytest.raises(ValueError):
+        population.dense_fingerprints[0, 0] = 2
+    # Unpacked once until fingerprints change
+    dense = population.dense_fingerprints
+    population.to_frame(share=True)
+    assert population.dense_fingerprints is dense
+    population.drop_zero_columns()
+    assert population.dense_fingerprints.tolist() == [[1, 0.5], [0, 0]]
+    population.fingerprints = FingerprintStore.from_matrix(
+            np.array([[1], [1]]), ['fp_c'])
+    assert population.to_frame(share=True).fp_c.tolist() == [1, 1]
+    assert population.dense_fingerprints is not dense
+
+def test_concat():
+    birthplaces = Birthplaces()
+    one = make_population(birthplaces, [1, 2])
+    one.fingerprints = FingerprintStore.from_matrix(np.array([[1], [1]]),
+                                                    ['fp_a'])
+    one.properties = {'prop': np.array([1.0, 2.0])}
+    two = make_population(birthplaces, [3], nation='two')
+    two.fingerprints = FingerprintStore.from_matrix(np.array([[1]]), ['fp_b'])
+    population = Population.concat([one, two])
+    assert population.planetary_id.tolist() == [1, 2, 3]
+    assert population.fp_headers == ['fp_a', 'fp_b']
+    assert population.fingerprints.to_dense().tolist() == [[1, 0], [1, 0],
+                                                           [0, 1]]
+    assert population.properties['prop'].tolist() == [1.0, 2.0, 0.0]
+    assert list(population.birth_nations()) == ['one', 'one', 'two']
+    assert population.chromosome_ids(2) == [3, 4]
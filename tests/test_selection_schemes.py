@@ -28,3 +28,80 @@ def test_random():
         assert id in parents.id.to_list()
     for id in [1, 5]:
         assert id not in parents.id.to_list()
+
+def brute_force_ranks(objectives):
+    ranks = np.full(len(objectives), -1)
+    remaining = np.arange(len(objectives))
+    rank = 0
+    while len(remaining) > 0:
+        values = objectives[remaining]
+        dominated = ((values[:, None] <= values[None]).all(axis=2) 
+                     & (values[:, None] < values[None]).any(axis=2)).any(axis=0)
+        ranks[remaining[~dominated]] = rank
+        remaining = remaining[dominated]
+        rank += 1
+    return ranks
+
+@pytest.mark.parametrize('num_objectives', [2, 3, 4])
+def test_non_dominated_sort(num_objectives):
+    rng = np.random.default_rng(0)
+    for high in [3, 1000]:
+        objectives = rng.integers(0, high, (300, num_objectives)).astype(float)
+        expected = brute_force_ranks(objectives)
+        ranks = selection_schemes.non_dominated_sort(objectives, block_size=7)
+        assert ranks.tolist() == expected.tolist()
+        # Only fronts needed for 30 points must be ranked
+        ranks = selection_schemes.non_dominated_sort(objectives, 30)
+        needed = expected <= np.sort(expected)[29]
+        assert ranks[needed].tolist() == expected[needed].tolist()
+        assert np.all((ranks == expected) | (ranks == 300))
+
+def test_crowding_distance():
+    distance = selection_schemes.crowding_distance(np.array(
+        [[0.0, 4.0], [1.0, 3.0], [3.0, 1.0], [4.0, 0.0]]))
+    assert distance.tolist() == [np.inf, 1.5, 1.5, np.inf]
+
+def test_nsga2():
+    df = pd.DataFrame()
+    df['planetary_id'] = [1, 2, 3, 4, 5, 6]
+    df['birth_nation'] = ['one', 'one', 'one', 'two', 'two', 'two']
+    df['strength'] = [1, 2, 0, 5, 1, 3]
+    df['weight'] = [1, 2, 2, 5, 2, 3]
+    num_parents_per_nationality = {'one': 1, 'two': 2}
+    nsga2 = selection_schemes.NSGA2({'strength': 'max', 'weight': 'min'})
+    parents = nsga2(df, num_parents_per_nationality)
+    assert sorted(parents.planetary_id.to_list()) == [1, 4, 5]
+    assert sorted(nsga2.archive.members.planetary_id.to_list()) == [1, 2, 4, 6]
+    df['planetary_id'] += 6
+    df['weight'] -= 1
+    nsga2(df, num_parents_per_nationality)
+    assert sorted(nsga2.archive.members.planetary_id.to_list()) == [7, 8, 10, 12]
+
+def test_nsga2_zero_quota():
+    df = pd.DataFrame()
+    df['planetary_id'] = list(range(1, 15))
+    df['birth_nation'] = ['A'] * 4 + ['B'] * 10
+    df['strength'] = [1, 2, 0, 5, 1, 3, 4, 2, 6, 0, 1, 2, 3, 4]
+    df['weight'] = [1, 2, 2, 5, 2, 3, 1, 4, 2, 3, 5, 1, 2, 3]
+    num_parents_per_nationality = {'A': 4, 'B': 0}
+    nsga2 = selection_schemes.NSGA2({'strength': 'max', 'weight': 'min'})
+    parents = nsga2(df, num_parents_per_nationality)
+    assert sorted(parents.planetary_id.to_list()) == [1, 2, 3, 4]
+    assert len(selection_schemes.select_nondominated(
+        df[['strength', 'weight']].to_numpy(dtype=float), 0)) == 0
+
+def test_nsga2_nation_without_quota():
+    df = pd.DataFrame()
+    df['planetary_id'] = list(range(1, 9))
+    # Immigrants from C have no quota
+    df['birth_nation'] = ['A'] * 5 + ['C'] * 3
+    df['strength'] = [1, 2, 0, 5, 1, 9, 9, 9]
+    df['weight'] = [1, 2, 2, 5, 2, 0, 0, 0]
+    nsga2 = selection_schemes.NSGA2({'strength': 'max', 'weight': 'min'})
+    parents = nsga2(df, {'A': 2})
+    assert len(parents) == 2
+    assert set(parents.birth_nation) == {'A'}
+
+def test_invalid_objective():
+    with pytest.raises(ValueError):
+        selection_schemes.NSGA2({'strength': 'wrong'})
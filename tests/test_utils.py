@@ -0,0 +1,170 @@
+import pytest
+import os
+
+import pandas as pd
+from numpy.random import default_rng
+from rdkit import Chem, RDLogger
+
+from polyga import utils
+
+RDLogger.DisableLog('rdApp.*')
+
+def legacy_chromosome_ids_to_smiles(chromosome_ids: list, chromosomes: dict,
+        rng: default_rng, **kwargs) -> str:
+    """String based assembly polyga used before assembly moved to the
+    RDKit graph. Kept to check the two give the same polymers."""
+    chromosomes = [chromosomes[chromosome_id] for 
+                   chromosome_id in chromosome_ids]
+    mols_of_chromosomes = list()
+    for chromosome in chromosomes:
+        m = Chem.MolFromSmiles(chromosome)
+        if m is not None:
+            mols_of_chromosomes.append(m)
+        # Error occurs
+        else:
+            return None
+
+    # Get Ids of 'Bi' atoms in each fragment
+    # edtg stands for symbols used in ladder polymers
+    mols_edtg = list()
+    mols_at_idx = list()
+
+    # Iterate for each fragment (m) in the list ms
+    for m, i in zip(mols_of_chromosomes, range(len(mols_of_chromosomes))):
+        at_idx = []  # Indices of Bi atoms in this fragment
+        num_atom_m = m.GetNumAtoms()  # Number of atoms in this fragment
+        atom_i = 0
+        for atom in m.GetAtoms():
+            atom_i = atom_i + 1
+            if atom.GetSymbol() == 'Bi':
+                at_idx.append(atom.GetIdx())
+            if atom_i == num_atom_m:
+                break
+        edtg = [''] * len(at_idx)
+        temp_list_idx = list(range(len(at_idx)))
+
+        temp_rnd_e = rng.choice(temp_list_idx)
+        edtg[temp_rnd_e] = 'e'
+        temp_list_idx.remove(temp_rnd_e)
+
+        # Select random index and set the element of the index as 't'
+        temp_rnd_t = rng.choice(temp_list_idx)
+        edtg[temp_rnd_t] = 't'
+        temp_list_idx.remove(temp_rnd_t)
+
+        mols_at_idx.append(at_idx)
+        mols_edtg.append(edtg)
+
+    # Convert edtg to endatom symbols
+    endatom = {
+               'e': ['Sb', 51], 't': ['Po', 84], 
+              }
+
+    for m, i in zip(mols_of_chromosomes, range(len(mols_of_chromosomes))):
+        for key in endatom.keys():
+            try:
+                m.GetAtomWithIdx(
+                    mols_at_idx[i][
+                        mols_edtg[i].index(key)
+                                ]
+                                ).SetAtomicNum(endatom[key][1])
+            except ValueError as e:
+                pass
+
+    # Time to connect fragments.
+
+    L_mol = mols_of_chromosomes[0]
+    L_n_atoms = mols_of_chromosomes[0].GetNumAtoms()
+    L_ms_edtg = mols_edtg[0]
+    L_ms_at_idx = mols_at_idx[0]
+
+    for i in range(1, len(mols_of_chromosomes)):
+        R_mol = mols_of_chromosomes[i]
+        R_ms_edtg = mols_edtg[i]
+        R_ms_at_idx = mols_at_idx[i]
+
+        # if 't' in L_ms_edtg and 'e' in R_ms_edtg:
+        L_index_of_t = L_ms_at_idx[L_ms_edtg.index('t')]
+        R_index_of_e = R_ms_at_idx[R_ms_edtg.index('e')]
+
+        combo = Chem.CombineMols(L_mol, R_mol)
+        edcombo = Chem.EditableMol(combo)
+
+        edcombo.AddBond(L_index_of_t, R_index_of_e + L_n_atoms, order=Chem.rdchem.BondType.SINGLE)
+
+        L_mol = edcombo.GetMol()
+        L_ms_edtg = [''] * len(L_ms_edtg)
+        L_ms_edtg.extend(mols_edtg[i])
+        L_ms_at_idx.extend([x + L_n_atoms for x in mols_at_idx[i]])
+        L_n_atoms = L_mol.GetNumAtoms()
+
+    SMILES_connected = Chem.MolToSmiles(L_mol)
+    SMILES_connected = SMILES_connected.replace("[Po][Sb]", "")
+    SMILES_connected = SMILES_connected.replace("[Sb][Po]", "")
+    SMILES_connected = SMILES_connected.replace("[Po]", "[*]")
+    SMILES_connected = SMILES_connected.replace("[Sb]", "[*]")
+    SMILES_connected = SMILES_connected.replace("[Bi]", "[*]")
+
+    if SMILES_connected.count('*') > 2:
+        SMILES_connected = utils.longest_smiles(SMILES_connected)
+
+    return SMILES_connected
+
+
+def canonical(smiles):
+    """Returns RDKit canonical smiles or None if invalid"""
+    if smiles is None or smiles == '':
+        return None
+    m = Chem.MolFromSmiles(smiles)
+    if m is None:
+        return None
+    return Chem.MolToSmiles(m)
+
+def skeleton(smiles):
+    """Returns canonical smiles with hydrogens recomputed from valence"""
+    m = Chem.MolFromSmiles(smiles)
+    for atom in m.GetAtoms():
+        atom.SetNumExplicitHs(0)
+        atom.SetNoImplicit(False)
+        atom.SetNumRadicalElectrons(0)
+    Chem.SanitizeMol(m)
+    return Chem.MolToSmiles(m)
+
+def load_chromosomes():
+    path_to_dna = os.path.join(os.path.dirname(utils.__file__),
+                               'default_files', 'dna.csv')
+    dna = pd.read_csv(path_to_dna)
+    dna = dna[dna.num_connections >= 2]
+    return {row['chromosome_id']: row['chromosome'] for 
+            index, row in dna.iterrows()}
+
+def test_assembly_matches_legacy_on_dna_library():
+    chromosomes = load_chromosomes()
+    ids = list(chromosomes.keys())
+    sequences = ([[i] for i in ids] 
+                 + [[i, ids[(k+1) % len(ids)]] for k, i in enumerate(ids)]
+                 + [[i, i, ids[(k+7) % len(ids)]] for k, i in enumerate(ids)])
+    for sequence in sequences:
+        legacy = canonical(legacy_chromosome_ids_to_smiles(list(sequence), 
+            chromosomes, default_rng(0)))
+        smiles = utils.chromosome_ids_to_smiles(list(sequence), chromosomes,
+            default_rng(0))
+        # Legacy string edits sometimes wrote invalid smiles. Graph assembly
+        # must give the same polymer whenever legacy assembly was valid.
+        if legacy is not None:
+            assert canonical(smiles) == legacy
+        assert smiles.count('*') == 2 or canonical(smiles) is None
+
+def test_extra_end_atoms_removed():
+    chromosomes = {0: '[Bi]CC([Bi])C[Bi]', 1: '[Bi]c1ccc([Bi])cc1'}
+    smiles = utils.chromosome_ids_to_smiles([0, 1, 0], chromosomes,
+                                            default_rng(1))
+    assert smiles.count('*') == 2
+    # Legacy assembly left radicals where extra end atoms were removed
+    legacy = legacy_chromosome_ids_to_smiles([0, 1, 0], chromosomes,
+                                             default_rng(1))
+    assert canonical(smiles) == skeleton(legacy)
+
+def test_invalid_chromosome():
+    assert utils.chromosome_ids_to_smiles([0], {0: 'C1CC'}, 
+                                          default_rng(0)) is None